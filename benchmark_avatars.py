@@ -0,0 +1,73 @@
+import sys
+import os
+import io
+import timeit
+
+# Add the project directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image, ImageDraw, ImageFont
+
+from server import AVATAR_COLORS, AVATAR_FONT_PATHS, get_avatar_params, render_avatar_png
+
+BENCHMARK_SIZES = (50, 100, 256)
+BENCHMARK_NAME = 'Admin User'
+
+def render_avatar_png_legacy(initials, color_index, size, font_scale=0.5):
+    """
+    Previous renderer: one draw.line per row with hex parsing on every row
+    and a font lookup on every call. Kept here for comparison only.
+    """
+    background_color, gradient_color = AVATAR_COLORS[color_index]
+    image = Image.new('RGB', (size, size))
+    draw = ImageDraw.Draw(image)
+
+    for y in range(size):
+        r1 = int(int(background_color[1:3], 16) * (size - y) / size +
+                 int(gradient_color[1:3], 16) * y / size)
+        g1 = int(int(background_color[3:5], 16) * (size - y) / size +
+                 int(gradient_color[3:5], 16) * y / size)
+        b1 = int(int(background_color[5:7], 16) * (size - y) / size +
+                 int(gradient_color[5:7], 16) * y / size)
+        draw.line([(0, y), (size, y)], fill=(r1, g1, b1))
+
+    font = None
+    for path in AVATAR_FONT_PATHS:
+        try:
+            font = ImageFont.truetype(path, size=int(size * font_scale))
+            break
+        except IOError:
+            continue
+    if font is None:
+        font = ImageFont.load_default()
+
+    text_bbox = font.getbbox(initials)
+    position = ((size - (text_bbox[2] - text_bbox[0])) / 2,
+                (size - (text_bbox[3] - text_bbox[1])) / 2)
+    draw.text((position[0] + 1, position[1] + 1), initials, font=font, fill=(0, 0, 0, 64))
+    draw.text(position, initials, font=font, fill='#FFFFFF')
+
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='PNG')
+    return img_byte_arr.getvalue()
+
+def benchmark_avatar_renderers(number=200):
+    """
+    Time the legacy and current avatar renderers at the benchmark sizes.
+    """
+    initials, color_index = get_avatar_params(BENCHMARK_NAME)
+
+    print(f"{'size':>6} {'legacy ms':>10} {'current ms':>11} {'speedup':>8}")
+    for size in BENCHMARK_SIZES:
+        legacy = min(timeit.repeat(
+            lambda: render_avatar_png_legacy(initials, color_index, size),
+            number=number, repeat=3
+        )) / number * 1000
+        current = min(timeit.repeat(
+            lambda: render_avatar_png(initials, color_index, size),
+            number=number, repeat=3
+        )) / number * 1000
+        print(f"{size:>6} {legacy:>10.3f} {current:>11.3f} {legacy / current:>7.1f}x")
+
+if __name__ == '__main__':
+    benchmark_avatar_renderers(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
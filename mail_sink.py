@@ -0,0 +1,169 @@
+"""
+Local SMTP sink for development and tests.
+
+Accepts every message and keeps it instead of delivering it. The outbox
+sender talks to localhost:1025 by default, so running
+
+    python mail_sink.py --maildir instance/mail_sink
+
+next to the app captures all outgoing email. Tests can run it in-process:
+
+    with SMTPSink(port=0) as sink:
+        ...  # point SMTP_HOST/SMTP_PORT at sink.server_address
+        assert sink.messages[0]['To'] == 'bob@example.com'
+"""
+import argparse
+import os
+import socket
+import socketserver
+import threading
+import time
+from email import message_from_bytes, policy
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib: HELO/EHLO, MAIL, RCPT, DATA."""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode('ascii'))
+
+    def read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b'.\r\n', b'.\n'):
+                return b''.join(lines)
+            # Undo dot-stuffing
+            lines.append(line[1:] if line.startswith(b'.') else line)
+
+    def setup(self):
+        super().setup()
+        self.server.track(self.request)
+
+    def finish(self):
+        self.server.untrack(self.request)
+        super().finish()
+
+    def handle(self):
+        self.reply('220 sideforge-sink ESMTP')
+        mail_from, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, _, argument = line.decode('utf-8', 'replace').strip().partition(' ')
+            command = command.upper()
+
+            if command == 'EHLO':
+                self.wfile.write(b'250-sideforge-sink\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n')
+            elif command == 'HELO':
+                self.reply('250 sideforge-sink')
+            elif command == 'MAIL':
+                mail_from, recipients = argument.partition('<')[2].partition('>')[0], []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                recipients.append(argument.partition('<')[2].partition('>')[0])
+                self.reply('250 OK')
+            elif command == 'DATA':
+                if not recipients:
+                    self.reply('503 RCPT first')
+                    continue
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                self.server.deliver(mail_from, recipients, self.read_data())
+                mail_from, recipients = None, []
+                self.reply('250 OK')
+            elif command == 'RSET':
+                mail_from, recipients = None, []
+                self.reply('250 OK')
+            elif command == 'NOOP':
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    SMTP server that stores messages in ``messages`` and, with a maildir,
+    as .eml files.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='localhost', port=1025, maildir=None, verbose=False):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.maildir = maildir
+        self.verbose = verbose
+        self.messages = []
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def track(self, connection):
+        with self._lock:
+            self._connections.add(connection)
+
+    def untrack(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+
+    def deliver(self, mail_from, recipients, data):
+        message = message_from_bytes(data, policy=policy.default)
+        with self._lock:
+            self.messages.append(message)
+            count = len(self.messages)
+        if self.maildir:
+            os.makedirs(self.maildir, exist_ok=True)
+            path = os.path.join(self.maildir, f"{time.time_ns()}-{count}.eml")
+            with open(path, 'wb') as f:
+                f.write(data)
+        if self.verbose:
+            print(f"{mail_from} -> {', '.join(recipients)}: {message['Subject']}", flush=True)
+
+    def start(self):
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and drop open connections, like a restarting server."""
+        self.shutdown()
+        self.server_close()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Accept and keep all mail sent to this SMTP server.')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--maildir', help='Also write every message to this directory as .eml')
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, maildir=args.maildir, verbose=True)
+    print(f"SMTP sink listening on {args.host}:{args.port}", flush=True)
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Add storage_blobs and reference blobs from user_cloud_storage
+
+Revision ID: 3b9f0c6e4d12
+Revises: a7d3e5c91f20
+Create Date: 2026-10-18 14:02:19.734516
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9f0c6e4d12'
+down_revision = 'a7d3e5c91f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('storage_blobs',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('released_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('sha256')
+    )
+
+    # Existing rows keep their per-user file until `flask storage dedupe`
+    # moves the content into the blob store. Rows already hashed each hold a
+    # reference on their blob from the start.
+    op.execute(
+        "INSERT INTO storage_blobs (sha256, size, ref_count, created_at) "
+        "SELECT sha256, MAX(file_size), COUNT(*), CURRENT_TIMESTAMP "
+        "FROM user_cloud_storage WHERE sha256 IS NOT NULL GROUP BY sha256"
+    )
+
+    with op.batch_alter_table('user_cloud_storage', schema=None) as batch_op:
+        batch_op.alter_column('file_path',
+               existing_type=sa.String(length=500),
+               nullable=True)
+        batch_op.create_index(batch_op.f('ix_user_cloud_storage_sha256'), ['sha256'], unique=False)
+        batch_op.create_foreign_key('fk_user_cloud_storage_sha256_storage_blobs', 'storage_blobs', ['sha256'], ['sha256'])
+
+
+def downgrade():
+    with op.batch_alter_table('user_cloud_storage', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_user_cloud_storage_sha256_storage_blobs', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_user_cloud_storage_sha256'))
+        batch_op.alter_column('file_path',
+               existing_type=sa.String(length=500),
+               nullable=False)
+
+    op.drop_table('storage_blobs')
@@ -0,0 +1,104 @@
+"""Add lowercase directory columns and a trigram index to user
+
+Revision ID: 3e9b6d2f0c57
+Revises: a7d3f5c81e24
+Create Date: 2026-10-18 20:04:41.702318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e9b6d2f0c57'
+down_revision = 'a7d3f5c81e24'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+user_table = sa.table(
+    'user',
+    sa.column('id', sa.Integer),
+    sa.column('username', sa.String),
+    sa.column('email', sa.String),
+    sa.column('username_lower', sa.String),
+    sa.column('email_lower', sa.String),
+)
+
+
+def backfill_lowercase_columns():
+    # Python's lower() matches the application, unlike SQLite's ASCII-only lower()
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(user_table.c.id, user_table.c.username, user_table.c.email)
+            .where(user_table.c.id > last_id)
+            .order_by(user_table.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        bind.execute(
+            user_table.update()
+            .where(user_table.c.id == sa.bindparam('user_id'))
+            .values(username_lower=sa.bindparam('username_lower'), email_lower=sa.bindparam('email_lower')),
+            [{
+                'user_id': row.id,
+                'username_lower': (row.username or '').strip().lower(),
+                'email_lower': (row.email or '').strip().lower(),
+            } for row in rows]
+        )
+        last_id = rows[-1].id
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('username_lower', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('email_lower', sa.String(length=120), nullable=True))
+
+    backfill_lowercase_columns()
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('username_lower', existing_type=sa.String(length=100), nullable=False)
+        batch_op.alter_column('email_lower', existing_type=sa.String(length=120), nullable=False)
+        batch_op.create_index('ix_user_username_lower', ['username_lower'], unique=False,
+                              postgresql_ops={'username_lower': 'text_pattern_ops'})
+        batch_op.create_index('ix_user_email_lower', ['email_lower'], unique=False,
+                              postgresql_ops={'email_lower': 'text_pattern_ops'})
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        insert = "INSERT INTO user_fts(rowid, username, email) VALUES (new.id, new.username, new.email);"
+        delete = ("INSERT INTO user_fts(user_fts, rowid, username, email) "
+                  "VALUES ('delete', old.id, old.username, old.email);")
+        op.execute(
+            "CREATE VIRTUAL TABLE user_fts USING fts5(username, email, content='user', "
+            "content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(f"CREATE TRIGGER user_fts_insert AFTER INSERT ON user BEGIN {insert} END")
+        op.execute(f"CREATE TRIGGER user_fts_delete AFTER DELETE ON user BEGIN {delete} END")
+        op.execute(f"CREATE TRIGGER user_fts_update AFTER UPDATE OF username, email ON user BEGIN {delete} {insert} END")
+        op.execute("INSERT INTO user_fts(user_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('CREATE INDEX ix_user_username_lower_trgm ON "user" USING GIN (username_lower gin_trgm_ops)')
+        op.execute('CREATE INDEX ix_user_email_lower_trgm ON "user" USING GIN (email_lower gin_trgm_ops)')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for trigger in ('insert', 'delete', 'update'):
+            op.execute(f"DROP TRIGGER IF EXISTS user_fts_{trigger}")
+        op.execute("DROP TABLE IF EXISTS user_fts")
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_user_email_lower_trgm')
+        op.execute('DROP INDEX IF EXISTS ix_user_username_lower_trgm')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_email_lower')
+        batch_op.drop_index('ix_user_username_lower')
+        batch_op.drop_column('email_lower')
+        batch_op.drop_column('username_lower')
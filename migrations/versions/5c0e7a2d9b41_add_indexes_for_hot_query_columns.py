@@ -0,0 +1,84 @@
+"""Add indexes for hot foreign-key and filter columns
+
+Revision ID: 5c0e7a2d9b41
+Revises: f31b8c119dfb
+Create Date: 2026-10-18 10:02:47.915630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c0e7a2d9b41'
+down_revision = 'f31b8c119dfb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_username'), ['username'], unique=False)
+
+    with op.batch_alter_table('user_cloud_storage', schema=None) as batch_op:
+        batch_op.create_index('ix_user_cloud_storage_user_id_uploaded_at', ['user_id', 'uploaded_at'], unique=False)
+
+    with op.batch_alter_table('shared_files', schema=None) as batch_op:
+        batch_op.create_index('ix_shared_files_recipient_id_status', ['recipient_id', 'status'], unique=False)
+
+    with op.batch_alter_table('server_instance', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_server_instance_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_payment_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('payment_methods', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_payment_methods_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('planner_boards', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_planner_boards_owner_id'), ['owner_id'], unique=False)
+
+    with op.batch_alter_table('board_members', schema=None) as batch_op:
+        batch_op.create_index('ix_board_members_board_id_user_id', ['board_id', 'user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_board_members_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('planner_lists', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_planner_lists_board_id'), ['board_id'], unique=False)
+
+    with op.batch_alter_table('planner_tasks', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_planner_tasks_list_id'), ['list_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_planner_tasks_assigned_to_id'), ['assigned_to_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('planner_tasks', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_planner_tasks_assigned_to_id'))
+        batch_op.drop_index(batch_op.f('ix_planner_tasks_list_id'))
+
+    with op.batch_alter_table('planner_lists', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_planner_lists_board_id'))
+
+    with op.batch_alter_table('board_members', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_board_members_user_id'))
+        batch_op.drop_index('ix_board_members_board_id_user_id')
+
+    with op.batch_alter_table('planner_boards', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_planner_boards_owner_id'))
+
+    with op.batch_alter_table('payment_methods', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_payment_methods_user_id'))
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_payment_user_id'))
+
+    with op.batch_alter_table('server_instance', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_server_instance_user_id'))
+
+    with op.batch_alter_table('shared_files', schema=None) as batch_op:
+        batch_op.drop_index('ix_shared_files_recipient_id_status')
+
+    with op.batch_alter_table('user_cloud_storage', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_cloud_storage_user_id_uploaded_at')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_username'))
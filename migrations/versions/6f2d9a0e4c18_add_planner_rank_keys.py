@@ -0,0 +1,93 @@
+"""Replace planner_lists.order with rank keys and rank planner_tasks
+
+Revision ID: 6f2d9a0e4c18
+Revises: e5a1c8f73b96
+Create Date: 2026-10-18 17:25:36.704152
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f2d9a0e4c18'
+down_revision = 'e5a1c8f73b96'
+branch_labels = None
+depends_on = None
+
+# Same key format as server.spaced_ranks
+RANK_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+RANK_WIDTH = 4
+
+
+def spaced_ranks(count):
+    base = len(RANK_DIGITS)
+    width = RANK_WIDTH
+    while base ** width < 4 * (count + 1) * base:
+        width += 1
+    space = base ** width
+    ranks = []
+    for i in range(count):
+        value = space // 4 + (i + 1) * (space // 2) // (count + 1)
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, base)
+            digits.append(RANK_DIGITS[digit])
+        ranks.append(''.join(reversed(digits)).rstrip('0'))
+    return ranks
+
+
+def backfill_ranks(bind, table, container_column, order_by):
+    rows = bind.execute(sa.text(
+        f'SELECT id, {container_column} FROM {table} ORDER BY {container_column}, {order_by}'
+    )).fetchall()
+    groups = {}
+    for row_id, container_id in rows:
+        groups.setdefault(container_id, []).append(row_id)
+    for row_ids in groups.values():
+        bind.execute(
+            sa.text(f'UPDATE {table} SET rank = :rank WHERE id = :id'),
+            [{'id': row_id, 'rank': rank} for row_id, rank in zip(row_ids, spaced_ranks(len(row_ids)))]
+        )
+
+
+def upgrade():
+    with op.batch_alter_table('planner_lists', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rank', sa.String(length=255), nullable=True))
+
+    with op.batch_alter_table('planner_tasks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rank', sa.String(length=255), nullable=True))
+
+    bind = op.get_bind()
+    backfill_ranks(bind, 'planner_lists', 'board_id', '"order", id')
+    backfill_ranks(bind, 'planner_tasks', 'list_id', 'created_at, id')
+
+    with op.batch_alter_table('planner_lists', schema=None) as batch_op:
+        batch_op.alter_column('rank', existing_type=sa.String(length=255), nullable=False)
+        batch_op.create_index('ix_planner_lists_board_id_rank', ['board_id', 'rank'], unique=False)
+        batch_op.drop_column('order')
+
+    with op.batch_alter_table('planner_tasks', schema=None) as batch_op:
+        batch_op.alter_column('rank', existing_type=sa.String(length=255), nullable=False)
+        batch_op.create_index('ix_planner_tasks_list_id_rank', ['list_id', 'rank'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('planner_tasks', schema=None) as batch_op:
+        batch_op.drop_index('ix_planner_tasks_list_id_rank')
+        batch_op.drop_column('rank')
+
+    with op.batch_alter_table('planner_lists', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('order', sa.Integer(), nullable=True))
+
+    bind = op.get_bind()
+    rows = bind.execute(sa.text('SELECT id, board_id FROM planner_lists ORDER BY board_id, rank, id')).fetchall()
+    positions = {}
+    for row_id, board_id in rows:
+        positions[board_id] = positions.get(board_id, -1) + 1
+        bind.execute(sa.text('UPDATE planner_lists SET "order" = :order WHERE id = :id'),
+                     {'id': row_id, 'order': positions[board_id]})
+
+    with op.batch_alter_table('planner_lists', schema=None) as batch_op:
+        batch_op.drop_index('ix_planner_lists_board_id_rank')
+        batch_op.drop_column('rank')
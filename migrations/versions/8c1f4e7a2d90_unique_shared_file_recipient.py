@@ -0,0 +1,32 @@
+"""Allow one share per file and recipient
+
+Revision ID: 8c1f4e7a2d90
+Revises: 3e9b6d2f0c57
+Create Date: 2026-10-18 20:41:17.093862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1f4e7a2d90'
+down_revision = '3e9b6d2f0c57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep the most recent share of every (file, recipient) pair
+    op.execute(
+        "DELETE FROM shared_files WHERE id NOT IN ("
+        "SELECT MAX(id) FROM shared_files GROUP BY original_file_id, recipient_id)"
+    )
+
+    with op.batch_alter_table('shared_files', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_shared_files_original_file_id_recipient_id', ['original_file_id', 'recipient_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('shared_files', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_shared_files_original_file_id_recipient_id', type_='unique')
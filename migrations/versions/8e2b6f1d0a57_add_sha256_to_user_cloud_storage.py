@@ -0,0 +1,26 @@
+"""Add sha256 to user_cloud_storage
+
+Revision ID: 8e2b6f1d0a57
+Revises: c4ebb9102e39
+Create Date: 2026-10-18 12:14:52.307126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2b6f1d0a57'
+down_revision = 'c4ebb9102e39'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_cloud_storage', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sha256', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user_cloud_storage', schema=None) as batch_op:
+        batch_op.drop_column('sha256')
@@ -0,0 +1,49 @@
+"""Add Stripe event creation times for ordering
+
+Revision ID: 9d3f7a1b5e62
+Revises: 6b2e8d4c1a97
+Create Date: 2026-10-18 23:41:52.307915
+
+"""
+import json
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3f7a1b5e62'
+down_revision = '6b2e8d4c1a97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('stripe_events', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('subscription', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('stripe_event_created_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('stripe_invoice_event_created_at', sa.DateTime(), nullable=True))
+
+    # Backfill creation times from the stored payloads
+    connection = op.get_bind()
+    stripe_events = sa.table('stripe_events', sa.column('id'), sa.column('payload'), sa.column('created_at'))
+    for event_id, payload in connection.execute(sa.select(stripe_events.c.id, stripe_events.c.payload)).all():
+        created = json.loads(payload).get('created')
+        if created:
+            connection.execute(
+                stripe_events.update()
+                .where(stripe_events.c.id == event_id)
+                .values(created_at=datetime.utcfromtimestamp(created))
+            )
+
+
+def downgrade():
+    with op.batch_alter_table('subscription', schema=None) as batch_op:
+        batch_op.drop_column('stripe_invoice_event_created_at')
+        batch_op.drop_column('stripe_event_created_at')
+
+    with op.batch_alter_table('stripe_events', schema=None) as batch_op:
+        batch_op.drop_column('created_at')
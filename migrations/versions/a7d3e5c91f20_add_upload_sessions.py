@@ -0,0 +1,50 @@
+"""Add upload_sessions and upload_session_chunks tables
+
+Revision ID: a7d3e5c91f20
+Revises: 8e2b6f1d0a57
+Create Date: 2026-10-18 13:20:41.618203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e5c91f20'
+down_revision = '8e2b6f1d0a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('upload_sessions',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('file_name', sa.String(length=255), nullable=False),
+        sa.Column('file_type', sa.String(length=100), nullable=False),
+        sa.Column('total_size', sa.BigInteger(), nullable=False),
+        sa.Column('chunk_size', sa.Integer(), nullable=False),
+        sa.Column('temp_path', sa.String(length=500), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('upload_sessions', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_upload_sessions_user_id'), ['user_id'], unique=False)
+
+    op.create_table('upload_session_chunks',
+        sa.Column('session_id', sa.String(length=32), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('received_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['session_id'], ['upload_sessions.id'], ),
+        sa.PrimaryKeyConstraint('session_id', 'chunk_index')
+    )
+
+
+def downgrade():
+    op.drop_table('upload_session_chunks')
+    with op.batch_alter_table('upload_sessions', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_sessions_user_id'))
+
+    op.drop_table('upload_sessions')
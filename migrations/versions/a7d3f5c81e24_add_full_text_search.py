@@ -0,0 +1,76 @@
+"""Add full-text search indexes for tasks, boards and file names
+
+Revision ID: a7d3f5c81e24
+Revises: b2c7e4f19a03
+Create Date: 2026-10-18 19:12:06.318554
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3f5c81e24'
+down_revision = 'b2c7e4f19a03'
+branch_labels = None
+depends_on = None
+
+# Indexed table -> (column, PostgreSQL weight class); mirrors SEARCH_INDEXED_COLUMNS
+INDEXED_COLUMNS = {
+    'planner_tasks': (('title', 'A'), ('description', 'B')),
+    'planner_boards': (('title', 'A'), ('description', 'B')),
+    'user_cloud_storage': (('file_name', 'A'),),
+}
+
+
+def sqlite_upgrade(table, columns):
+    names = ', '.join(column for column, _ in columns)
+    new_values = ', '.join(f'new.{column}' for column, _ in columns)
+    old_values = ', '.join(f'old.{column}' for column, _ in columns)
+    fts = f'{table}_fts'
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values});"
+    delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values});"
+
+    op.execute(
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content='{table}', "
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    op.execute(f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END")
+    op.execute(f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN {delete} END")
+    op.execute(f"CREATE TRIGGER {fts}_update AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END")
+
+    # Index the existing rows
+    op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def postgresql_upgrade(table, columns):
+    vector = ' || '.join(
+        f"setweight(to_tsvector('simple', coalesce({column}, '')), '{weight_class}')"
+        for column, weight_class in columns
+    )
+    op.execute(
+        f"ALTER TABLE {table} ADD COLUMN search_vector tsvector "
+        f"GENERATED ALWAYS AS ({vector}) STORED"
+    )
+    op.execute(f"CREATE INDEX ix_{table}_search_vector ON {table} USING GIN (search_vector)")
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table, columns in INDEXED_COLUMNS.items():
+        if dialect == 'sqlite':
+            sqlite_upgrade(table, columns)
+        elif dialect == 'postgresql':
+            postgresql_upgrade(table, columns)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in INDEXED_COLUMNS:
+        if dialect == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{trigger}")
+            op.execute(f"DROP TABLE IF EXISTS {table}_fts")
+        elif dialect == 'postgresql':
+            op.execute(f"DROP INDEX IF EXISTS ix_{table}_search_vector")
+            op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
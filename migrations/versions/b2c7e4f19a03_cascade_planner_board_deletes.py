@@ -0,0 +1,67 @@
+"""Cascade planner board deletes and add planner_boards.deleted_at
+
+Revision ID: b2c7e4f19a03
+Revises: 6f2d9a0e4c18
+Create Date: 2026-10-18 18:03:52.480917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2c7e4f19a03'
+down_revision = '6f2d9a0e4c18'
+branch_labels = None
+depends_on = None
+
+# (table, column, referred table) of the foreign keys that cascade
+CASCADING_FOREIGN_KEYS = [
+    ('board_members', 'board_id', 'planner_boards'),
+    ('planner_lists', 'board_id', 'planner_boards'),
+    ('planner_tasks', 'list_id', 'planner_lists'),
+]
+
+# Names SQLite batch mode gives the reflected, unnamed constraints
+naming_convention = {
+    'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s',
+}
+
+
+def existing_foreign_key_name(bind, table, column, referred_table):
+    for foreign_key in sa.inspect(bind).get_foreign_keys(table):
+        if foreign_key['constrained_columns'] == [column] and foreign_key['name']:
+            return foreign_key['name']
+    # Unnamed constraint, named by the batch naming convention
+    return f'fk_{table}_{column}_{referred_table}'
+
+
+def replace_foreign_keys(ondelete):
+    bind = op.get_bind()
+    for table, column, referred_table in CASCADING_FOREIGN_KEYS:
+        name = existing_foreign_key_name(bind, table, column, referred_table)
+        with op.batch_alter_table(table, schema=None, naming_convention=naming_convention) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(f'fk_{table}_{column}_{referred_table}', referred_table,
+                                        [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    # Rows orphaned while SQLite ignored foreign keys would fail the new constraints
+    op.execute('DELETE FROM board_members WHERE board_id NOT IN (SELECT id FROM planner_boards)')
+    op.execute('DELETE FROM planner_lists WHERE board_id NOT IN (SELECT id FROM planner_boards)')
+    op.execute('DELETE FROM planner_tasks WHERE list_id NOT IN (SELECT id FROM planner_lists)')
+
+    replace_foreign_keys('CASCADE')
+
+    with op.batch_alter_table('planner_boards', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_planner_boards_deleted_at'), ['deleted_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('planner_boards', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_planner_boards_deleted_at'))
+        batch_op.drop_column('deleted_at')
+
+    replace_foreign_keys(None)
@@ -0,0 +1,39 @@
+"""Add user_storage_quota table
+
+Revision ID: c4ebb9102e39
+Revises: 5c0e7a2d9b41
+Create Date: 2026-10-18 11:26:13.540981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4ebb9102e39'
+down_revision = '5c0e7a2d9b41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_storage_quota',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('used_bytes', sa.BigInteger(), nullable=False),
+        sa.Column('file_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('reconciled_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # Backfill counters from the existing files
+    op.execute(
+        "INSERT INTO user_storage_quota (user_id, used_bytes, file_count, updated_at) "
+        "SELECT user_id, COALESCE(SUM(file_size), 0), COUNT(id), CURRENT_TIMESTAMP "
+        "FROM user_cloud_storage GROUP BY user_id"
+    )
+
+
+def downgrade():
+    op.drop_table('user_storage_quota')
@@ -0,0 +1,48 @@
+"""Add outbox_emails table
+
+Revision ID: d4a8b1e6f372
+Revises: 8c1f4e7a2d90
+Create Date: 2026-10-18 21:27:53.615209
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a8b1e6f372'
+down_revision = '8c1f4e7a2d90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox_emails',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('to_email', sa.String(length=120), nullable=False),
+        sa.Column('subject', sa.String(length=255), nullable=False),
+        sa.Column('body', sa.Text(), nullable=False),
+        sa.Column('digest_key', sa.String(length=50), nullable=True),
+        sa.Column('summary', sa.String(length=255), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('claim_token', sa.String(length=32), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('outbox_emails', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_outbox_emails_claim_token'), ['claim_token'], unique=False)
+        batch_op.create_index('ix_outbox_emails_status_next_attempt_at', ['status', 'next_attempt_at'], unique=False)
+        batch_op.create_index('ix_outbox_emails_to_email_digest_key', ['to_email', 'digest_key'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('outbox_emails', schema=None) as batch_op:
+        batch_op.drop_index('ix_outbox_emails_to_email_digest_key')
+        batch_op.drop_index('ix_outbox_emails_status_next_attempt_at')
+        batch_op.drop_index(batch_op.f('ix_outbox_emails_claim_token'))
+
+    op.drop_table('outbox_emails')
@@ -0,0 +1,28 @@
+"""Add indexes for sorting the cloud file listing by name and size
+
+Revision ID: d81c4a7e2b65
+Revises: 3b9f0c6e4d12
+Create Date: 2026-10-18 14:48:03.215894
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81c4a7e2b65'
+down_revision = '3b9f0c6e4d12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_cloud_storage', schema=None) as batch_op:
+        batch_op.create_index('ix_user_cloud_storage_user_id_file_name', ['user_id', 'file_name'], unique=False)
+        batch_op.create_index('ix_user_cloud_storage_user_id_file_size', ['user_id', 'file_size'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_cloud_storage', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_cloud_storage_user_id_file_size')
+        batch_op.drop_index('ix_user_cloud_storage_user_id_file_name')
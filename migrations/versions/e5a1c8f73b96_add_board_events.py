@@ -0,0 +1,38 @@
+"""Add board_events change log
+
+Revision ID: e5a1c8f73b96
+Revises: d81c4a7e2b65
+Create Date: 2026-10-18 16:42:09.318274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a1c8f73b96'
+down_revision = 'd81c4a7e2b65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('board_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('board_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=30), nullable=False),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('board_events', schema=None) as batch_op:
+        batch_op.create_index('ix_board_events_board_id_id', ['board_id', 'id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_board_events_created_at'), ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('board_events', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_board_events_created_at'))
+        batch_op.drop_index('ix_board_events_board_id_id')
+
+    op.drop_table('board_events')
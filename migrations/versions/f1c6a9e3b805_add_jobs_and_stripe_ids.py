@@ -0,0 +1,72 @@
+"""Add jobs table and Stripe ids on payment methods and subscriptions
+
+Revision ID: f1c6a9e3b805
+Revises: d4a8b1e6f372
+Create Date: 2026-10-18 22:14:39.208417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c6a9e3b805'
+down_revision = 'd4a8b1e6f372'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('idempotency_key', sa.String(length=255), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('claim_token', sa.String(length=32), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('idempotency_key')
+    )
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.create_index('ix_jobs_status_run_at', ['status', 'run_at'], unique=False)
+
+    with op.batch_alter_table('payment_methods', schema=None) as batch_op:
+        batch_op.alter_column('encrypted_card_number',
+               existing_type=sa.String(length=255),
+               nullable=True)
+        batch_op.add_column(sa.Column('stripe_payment_method_id', sa.String(length=255), nullable=True))
+        batch_op.create_unique_constraint('uq_payment_methods_stripe_payment_method_id', ['stripe_payment_method_id'])
+
+    with op.batch_alter_table('subscription', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('stripe_checkout_session_id', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('stripe_subscription_id', sa.String(length=255), nullable=True))
+        batch_op.create_unique_constraint('uq_subscription_stripe_checkout_session_id', ['stripe_checkout_session_id'])
+        batch_op.create_index(batch_op.f('ix_subscription_stripe_subscription_id'), ['stripe_subscription_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('subscription', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_subscription_stripe_subscription_id'))
+        batch_op.drop_constraint('uq_subscription_stripe_checkout_session_id', type_='unique')
+        batch_op.drop_column('stripe_subscription_id')
+        batch_op.drop_column('stripe_checkout_session_id')
+
+    with op.batch_alter_table('payment_methods', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_payment_methods_stripe_payment_method_id', type_='unique')
+        batch_op.drop_column('stripe_payment_method_id')
+        batch_op.alter_column('encrypted_card_number',
+               existing_type=sa.String(length=255),
+               nullable=False)
+
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_jobs_status_run_at')
+
+    op.drop_table('jobs')
@@ -0,0 +1,33 @@
+"""Add stripe_plan_catalog table
+
+Revision ID: f31b8c119dfb
+Revises: 03d1c1190943
+Create Date: 2026-10-18 09:12:04.318427
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f31b8c119dfb'
+down_revision = '03d1c1190943'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stripe_plan_catalog',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('plan_key', sa.String(length=50), nullable=False),
+        sa.Column('product_id', sa.String(length=255), nullable=False),
+        sa.Column('price_id', sa.String(length=255), nullable=False),
+        sa.Column('unit_amount', sa.Integer(), nullable=False),
+        sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('plan_key')
+    )
+
+
+def downgrade():
+    op.drop_table('stripe_plan_catalog')
@@ -0,0 +1,270 @@
+import io
+import os
+import re
+import sys
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from typing import Iterable, List, Dict, Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# "SCAN <table>" in EXPLAIN QUERY PLAN output means every row is visited.
+# Index lookups show up as "SEARCH <table> USING INDEX ...", full-text
+# lookups as "SCAN <fts table> VIRTUAL TABLE INDEX ...".
+FULL_SCAN_PATTERN = re.compile(r'^SCAN (?!CONSTANT ROW)(?:TABLE )?(\w+)(?! VIRTUAL TABLE)\b')
+
+class FullTableScanError(AssertionError):
+    """Raised when a checked query plan contains a full table scan."""
+
+class QueryPlanChecker:
+    """
+    Runs EXPLAIN QUERY PLAN for every SELECT sent to SQLite and records
+    statements whose plan scans a whole table.
+    """
+
+    def __init__(self, allowed_tables: Iterable[str] = ()):
+        self.allowed_tables = set(allowed_tables)
+        self.violations: List[Dict[str, Any]] = []
+        self._installed = False
+
+    def install(self):
+        """Start checking queries on every SQLAlchemy engine."""
+        if not self._installed:
+            event.listen(Engine, 'before_cursor_execute', self._check_statement)
+            self._installed = True
+
+    def uninstall(self):
+        """Stop checking queries."""
+        if self._installed:
+            event.remove(Engine, 'before_cursor_execute', self._check_statement)
+            self._installed = False
+
+    def _check_statement(self, conn, cursor, statement, parameters, context, executemany):
+        if executemany or not isinstance(cursor, sqlite3.Cursor):
+            return
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return
+
+        plan = cursor.connection.execute(
+            f'EXPLAIN QUERY PLAN {statement}', parameters or ()
+        ).fetchall()
+
+        tables = {name for (name,) in cursor.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )}
+
+        for row in plan:
+            detail = row[-1]
+            match = FULL_SCAN_PATTERN.match(detail)
+            # Scans of materialized subqueries (e.g. "SCAN anon_1") are not table scans
+            if match and match.group(1) in tables and match.group(1) not in self.allowed_tables:
+                self.violations.append({
+                    'table': match.group(1),
+                    'detail': detail,
+                    'statement': statement
+                })
+
+    def report(self) -> str:
+        """Human-readable summary of recorded violations."""
+        lines = []
+        for violation in self.violations:
+            lines.append(f"{violation['detail']}\n    {' '.join(violation['statement'].split())}")
+        return '\n'.join(lines)
+
+    def assert_no_full_table_scans(self):
+        """Raise FullTableScanError if any recorded query scanned a table."""
+        if self.violations:
+            raise FullTableScanError(
+                f"{len(self.violations)} query plan(s) with full table scans:\n{self.report()}"
+            )
+
+@contextmanager
+def check_query_plans(allowed_tables: Iterable[str] = ()):
+    """
+    Context manager for tests: fails when a query run inside the block
+    does a full table scan.
+
+        with check_query_plans():
+            client.get('/dashboard')
+    """
+    checker = QueryPlanChecker(allowed_tables)
+    checker.install()
+    try:
+        yield checker
+    finally:
+        checker.uninstall()
+    checker.assert_no_full_table_scans()
+
+class QueryCounter:
+    """Counts the statements sent to the database while installed."""
+
+    def __init__(self):
+        self.count = 0
+
+    def _count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._count_statement)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, 'before_cursor_execute', self._count_statement)
+
+# GET routes exercised by the standalone check, with tables each may still scan
+CHECKED_ROUTES = [
+    ('/dashboard', ()),
+    ('/cloud/files', ()),
+    ('/cloud/files?sort=name&prefix=a&limit=10', ()),
+    ('/cloud/files?sort=-size&type=image/&limit=10', ()),
+    ('/cloud/storage-info', ()),
+    ('/cloud/files/shared', ()),
+    ('/cloud/files/{file_id}/download', ()),
+    ('/cloud/files/search-users?query=plan', ()),
+    ('/cloud/files/search-users?query=admin', ()),
+    ('/server-instances', ()),
+    ('/planner', ()),
+    ('/planner/board/{board_id}', ()),
+    ('/planner/board/{board_id}/invite', ()),
+    ('/search?q=check', ()),
+]
+
+# Tables and columns that must not reference a deleted user
+DELETED_USER_ROWS = [
+    ('user', 'id'),
+    ('user_storage_quota', 'user_id'),
+    ('upload_sessions', 'user_id'),
+    ('user_cloud_storage', 'user_id'),
+    ('planner_boards', 'owner_id'),
+    ('board_members', 'user_id'),
+    ('planner_tasks', 'creator_id'),
+]
+
+def run_route_checks() -> int:
+    """
+    Exercise the main routes against a throwaway SQLite database and
+    report every full table scan, then check that the board page query
+    count does not grow with the board and that deleting the account
+    leaves no rows behind. Returns a process exit code.
+    """
+    database_dir = tempfile.mkdtemp(prefix='query-plan-check-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(database_dir, 'check.db')
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from server import app, db, User, PlannerBoard, BoardMember, PlannerList, PlannerTask, board_permission_cache
+
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='planner', email='planner@sideforge.com', name='Plan Checker')
+        user.set_password('checkpassword')
+        db.session.add(user)
+        db.session.flush()
+        board = PlannerBoard(title='Check', description='Query plan check', owner_id=user.id)
+        db.session.add(board)
+        db.session.flush()
+        db.session.add(BoardMember(board_id=board.id, user_id=user.id, role='admin'))
+        db.session.add(PlannerList(title='Todo', board_id=board.id))
+        db.session.commit()
+        board_id = board.id
+        user_id = user.id
+
+    client = app.test_client()
+    client.post('/login', data={'email': 'planner@sideforge.com', 'password': 'checkpassword'})
+
+    # A file for the download route to serve
+    upload = client.post('/cloud/upload', data={'file': (io.BytesIO(b'query plan check'), 'check.txt')},
+                         content_type='multipart/form-data')
+    if upload.status_code != 200:
+        print(f"/cloud/upload: status {upload.status_code}, cannot seed a file")
+        return 1
+    file_id = upload.get_json()['id']
+
+    failed = False
+    for route, allowed_tables in CHECKED_ROUTES:
+        path = route.format(board_id=board_id, file_id=file_id)
+        checker = QueryPlanChecker(allowed_tables)
+        checker.install()
+        try:
+            response = client.get(path)
+        finally:
+            checker.uninstall()
+
+        # A redirect or error page would skip the queries the route is checked for
+        if not (200 <= response.status_code < 300 or response.status_code == 304):
+            failed = True
+            print(f"{path}: status {response.status_code}")
+
+        if checker.violations:
+            failed = True
+            print(f"{path}: {len(checker.violations)} query plan(s) with full table scans:")
+            print(checker.report())
+
+    # The board page must not issue more queries as the board grows.
+    # Both requests start with a cold permission cache.
+    board_path = f'/planner/board/{board_id}'
+    board_permission_cache.clear()
+    with QueryCounter() as small_board:
+        client.get(board_path)
+
+    with app.app_context():
+        members = []
+        for i in range(5):
+            member = User(username=f'member{i}', email=f'member{i}@sideforge.com', name=f'Member {i}')
+            member.set_password('checkpassword')
+            members.append(member)
+        db.session.add_all(members)
+        db.session.flush()
+        db.session.add_all(BoardMember(board_id=board_id, user_id=m.id, role='editor') for m in members)
+        for i in range(10):
+            board_list = PlannerList(title=f'List {i}', board_id=board_id)
+            db.session.add(board_list)
+            db.session.flush()
+            db.session.add_all(
+                PlannerTask(title=f'Task {j}', list_id=board_list.id, creator_id=members[0].id,
+                            assigned_to_id=members[j % len(members)].id)
+                for j in range(20)
+            )
+        db.session.commit()
+
+    board_permission_cache.clear()
+    with QueryCounter() as large_board:
+        client.get(board_path)
+
+    if large_board.count != small_board.count:
+        failed = True
+        print(f"{board_path}: {small_board.count} queries for 1 list, "
+              f"{large_board.count} queries for 11 lists with 200 tasks")
+
+    # Deleting the account must remove every row that references the user;
+    # by now they own a board, a quota row and, below, an upload session
+    client.post('/cloud/uploads', json={'filename': 'pending.bin', 'size': 1024})
+    response = client.post('/account/delete')
+    if response.status_code != 200:
+        failed = True
+        print(f"/account/delete: status {response.status_code}")
+    with app.app_context():
+        leftovers = {
+            table: db.session.execute(
+                db.text(f'SELECT COUNT(*) FROM {table} WHERE {column} = :user_id'), {'user_id': user_id}
+            ).scalar()
+            for table, column in DELETED_USER_ROWS
+        }
+    leftovers = {table: count for table, count in leftovers.items() if count}
+    if leftovers:
+        failed = True
+        print(f"/account/delete: rows left behind: {leftovers}")
+
+    if failed:
+        return 1
+
+    print(f"Checked {len(CHECKED_ROUTES)} routes: no full table scans.")
+    print(f"{board_path}: {large_board.count} queries regardless of board size.")
+    print("/account/delete: removed the user and their rows.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(run_route_checks())
@@ -18,5 +18,8 @@ flask db upgrade
 # Start Advanced Security in background
 sudo "$SCRIPT_DIR/venv/bin/python3" "$SCRIPT_DIR/advanced_security.py" &
 
+# Start the background job worker
+flask jobs worker &
+
 # Start the server
 sudo "$SCRIPT_DIR/venv/bin/python3" "$SCRIPT_DIR/server.py"
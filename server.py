@@ -1,8 +1,9 @@
 import os
 import stripe
+import stripe_gateway
 from flask import (
     Flask, render_template, request, redirect, url_for, flash, 
-    jsonify, session, abort, send_file
+    jsonify, session, abort, send_file, make_response, g, has_request_context, Response
 )
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -13,19 +14,48 @@ from wtforms.validators import DataRequired, Email, Length, EqualTo
 from flask_wtf.file import FileField, FileRequired, FileAllowed
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import dump_options_header
 from flask_debugtoolbar import DebugToolbarExtension
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import secrets
-from flask_wtf.csrf import generate_csrf
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
-from sqlalchemy.orm import relationship
+from flask_wtf.csrf import generate_csrf, validate_csrf
+from wtforms.validators import ValidationError as CSRFValidationError
+from werkzeug.sansio.multipart import (
+    MultipartDecoder, NEED_DATA, Epilogue,
+    Data as MultipartData, Field as MultipartField, File as MultipartFile
+)
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, type_coerce, DDL
+from sqlalchemy.orm import relationship, selectinload, joinedload, object_session, Session
 from sqlalchemy.sql import func
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+import sqlite3
 import re
 from enum import Enum
 import traceback
+import hashlib
+import shutil
+import unicodedata
+from urllib.parse import quote as url_quote
+import functools
+import multiprocessing
+from collections import OrderedDict
+import threading
+import time
+import click
+from flask.cli import AppGroup
 from PIL import Image, ImageDraw, ImageFont
 import io
 import base64
+import json
+import queue
+import random
+import signal
+import smtplib
+from email.message import EmailMessage
+from email.utils import make_msgid
 
 # Stripe Configuration
 STRIPE_PUBLISHABLE_KEY = os.environ.get(
@@ -41,6 +71,9 @@ stripe.api_key = os.environ.get(
 if not STRIPE_PUBLISHABLE_KEY or not stripe.api_key:
     raise ValueError("Stripe keys must be configured. Check environment variables.")
 
+# All Stripe calls share one pooled keep-alive client (see stripe_gateway.py)
+stripe_gateway.configure()
+
 # Function to create or retrieve Stripe products and prices
 def get_or_create_stripe_plan(name, monthly_price, features):
     try:
@@ -50,7 +83,8 @@ def get_or_create_stripe_plan(name, monthly_price, features):
             'price_id': f'{name.lower()}_price',
             'name': name,
             'monthly_price': monthly_price,
-            'features': features
+            'features': features,
+            'price_resolved': False
         }
     except Exception as e:
         # Use print for logging before app is initialized
@@ -60,7 +94,8 @@ def get_or_create_stripe_plan(name, monthly_price, features):
             'price_id': f'{name.lower()}_price',
             'name': name,
             'monthly_price': monthly_price,
-            'features': features
+            'features': features,
+            'price_resolved': False
         }
 
 # Enhanced Stripe Pricing Plans
@@ -79,57 +114,107 @@ STRIPE_PLANS = {
     )
 }
 
-# Route to create actual Stripe products and prices after app initialization
-def initialize_stripe_products():
-    try:
-        for plan_key, plan_details in STRIPE_PLANS.items():
-            # Create or find existing product
-            try:
-                product = stripe.Product.create(
-                    name=plan_details['name'],
-                    description=' | '.join(plan_details['features']),
-                    metadata={
-                        'plan_type': plan_key,
-                        'features': ','.join(plan_details['features'])
-                    }
-                )
-                
-                # Create price for the product
-                price = stripe.Price.create(
-                    product=product.id,
-                    unit_amount=int(plan_details['monthly_price'] * 100),  # Convert to cents
-                    currency='usd',
-                    recurring={'interval': 'month'}
-                )
-                
-                # Update the plan with actual Stripe IDs
-                STRIPE_PLANS[plan_key]['product_id'] = product.id
-                STRIPE_PLANS[plan_key]['price_id'] = price.id
-                
-            except stripe.error.StripeError as e:
-                print(f"Error creating Stripe product for {plan_key}: {str(e)}")
-    except Exception as e:
-        print(f"Unexpected error initializing Stripe products: {str(e)}")
+# Database engine configuration
+# DATABASE_URL selects the database (PostgreSQL in production, like the
+# collaborative planner backend); without it the local SQLite file is used.
+# Pool sizes and SQLite pragmas can be tuned through the environment.
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+def get_database_uri(root_path):
+    """
+    Resolve the SQLAlchemy database URI from the environment.
+
+    Args:
+        root_path (str): Application root, used for the default SQLite file
+
+    Returns:
+        str: Database URI
+    """
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        return 'sqlite:///' + os.path.join(root_path, 'sideforge.db')
+
+    # Heroku-style URLs use a scheme SQLAlchemy no longer accepts; pin the
+    # driver to psycopg2 from requirements.txt when none is given
+    for scheme in ('postgres://', 'postgresql://'):
+        if database_url.startswith(scheme):
+            database_url = 'postgresql+psycopg2://' + database_url[len(scheme):]
+    return database_url
+
+def get_engine_options(database_uri):
+    """
+    Build SQLALCHEMY_ENGINE_OPTIONS with pool settings for the database in use.
+
+    Args:
+        database_uri (str): Database URI
+
+    Returns:
+        dict: Engine options
+    """
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    }
+
+    if database_uri.startswith('sqlite'):
+        options['connect_args'] = {
+            'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+            # Connections are handed between threads by the pool
+            'check_same_thread': False
+        }
+        if ':memory:' in database_uri or database_uri in ('sqlite://', 'sqlite:///'):
+            # In-memory databases use a single shared connection
+            return {'connect_args': options['connect_args']}
+    else:
+        options['pool_recycle'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+        options['pool_pre_ping'] = True
+
+    return options
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Tune every new SQLite connection: WAL lets readers proceed during a
+    write, busy_timeout makes writers wait instead of failing with
+    "database is locked", and foreign keys are enforced.
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+    cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    # SQLite ignores foreign keys, including ON DELETE CASCADE, unless enabled
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
 
 # Create Flask app
 app = Flask(__name__)
 
 # Configure app before Stripe initialization
 app.config['SECRET_KEY'] = secrets.token_hex(16)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.root_path, 'sideforge.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = get_database_uri(app.root_path)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-# Ensure database directory and file have proper permissions
+# Ensure database directory and file have proper permissions (local SQLite only)
 db_dir = os.path.dirname(os.path.abspath(__file__))
-os.makedirs(db_dir, exist_ok=True)
-os.chmod(db_dir, 0o755)
 db_path = os.path.join(db_dir, 'sideforge.db')
-if os.path.exists(db_path):
-    os.chmod(db_path, 0o666)
-else:
-    with open(db_path, 'w') as f:
-        f.write('')  # Create an empty file
-    os.chmod(db_path, 0o666)
+if app.config['SQLALCHEMY_DATABASE_URI'] == 'sqlite:///' + db_path:
+    os.makedirs(db_dir, exist_ok=True)
+    os.chmod(db_dir, 0o755)
+    if os.path.exists(db_path):
+        os.chmod(db_path, 0o666)
+    else:
+        with open(db_path, 'w') as f:
+            f.write('')  # Create an empty file
+        os.chmod(db_path, 0o666)
 
 # Initialize CSRF protection
 csrf = CSRFProtect(app)
@@ -140,6 +225,14 @@ migrate = Migrate(app, db)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+def dialect_insert(model):
+    """INSERT construct of the configured database, for ON CONFLICT clauses."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
 def run_database_migration():
     """
     Run database migration to apply model changes
@@ -297,57 +390,644 @@ def initialize_database_with_preservation():
                 print(f"Error loading user {user_id}: {str(e)}")
                 return None
 
-# Initialize Stripe products when the app context is pushed
-@app.context_processor
-def inject_stripe_initialization():
-    # This will run when the first request context is created
-    initialize_stripe_products()
-    return {}
+# Stripe plan catalog
+# Product/price IDs are resolved against Stripe once, persisted in the
+# stripe_plan_catalog table and refreshed in the background, so page renders
+# never wait on the Stripe API.
+STRIPE_PLAN_CATALOG_TTL = int(os.environ.get('STRIPE_PLAN_CATALOG_TTL', 6 * 60 * 60))  # seconds
+
+def find_or_create_stripe_price(plan_key, plan_details):
+    """
+    Idempotently resolve the Stripe product and monthly price for a plan.
+
+    Products are looked up by their ``plan_type`` metadata and prices by amount,
+    currency and interval; only missing objects are created, with idempotency
+    keys so concurrent workers cannot create duplicates.
+
+    Args:
+        plan_key (str): Key of the plan in STRIPE_PLANS
+        plan_details (dict): Plan definition from STRIPE_PLANS
+
+    Returns:
+        tuple: (product_id, price_id, unit_amount)
+    """
+    unit_amount = int(round(plan_details['monthly_price'] * 100))  # Convert to cents
+
+    products = stripe_gateway.call(
+        'product.search', stripe.Product.search,
+        query=f"active:'true' AND metadata['plan_type']:'{plan_key}'",
+        limit=1
+    )
+    if products.data:
+        product = products.data[0]
+    else:
+        product = stripe_gateway.call(
+            'product.create', stripe.Product.create,
+            name=plan_details['name'],
+            description=' | '.join(plan_details['features']),
+            metadata={
+                'plan_type': plan_key,
+                'features': ','.join(plan_details['features'])
+            },
+            idempotency_key=f'sideforge-product-{plan_key}'
+        )
+
+    price = None
+    prices = stripe_gateway.call('price.list', stripe.Price.list, product=product.id, active=True, limit=100)
+    for candidate in prices.auto_paging_iter():
+        recurring = getattr(candidate, 'recurring', None)
+        if (candidate.unit_amount == unit_amount and candidate.currency == 'usd'
+                and getattr(recurring, 'interval', None) == 'month'):
+            price = candidate
+            break
+
+    if price is None:
+        price = stripe_gateway.call(
+            'price.create', stripe.Price.create,
+            product=product.id,
+            unit_amount=unit_amount,
+            currency='usd',
+            recurring={'interval': 'month'},
+            metadata={'plan_type': plan_key},
+            idempotency_key=f'sideforge-price-{plan_key}-{unit_amount}'
+        )
+
+    return product.id, price.id, unit_amount
+
+def apply_plan_catalog_entry(entry):
+    """Copy a persisted catalog entry into the in-memory STRIPE_PLANS."""
+    plan = STRIPE_PLANS.get(entry.plan_key)
+    if not plan:
+        return
+    # Ignore entries persisted for an outdated price
+    if entry.unit_amount != int(round(plan['monthly_price'] * 100)):
+        return
+    plan['product_id'] = entry.product_id
+    plan['price_id'] = entry.price_id
+    plan['price_resolved'] = True
+
+def load_plan_catalog():
+    """
+    Load persisted Stripe IDs into STRIPE_PLANS. Local database read only.
+
+    Returns:
+        bool: True if every plan has a fresh catalog entry
+    """
+    entries = StripePlanCatalog.query.filter(
+        StripePlanCatalog.plan_key.in_(list(STRIPE_PLANS.keys()))
+    ).all()
+    for entry in entries:
+        apply_plan_catalog_entry(entry)
+
+    cutoff = datetime.utcnow() - timedelta(seconds=STRIPE_PLAN_CATALOG_TTL)
+    fresh = [e for e in entries if e.refreshed_at and e.refreshed_at >= cutoff]
+    return len(fresh) == len(STRIPE_PLANS) and all(
+        plan['price_resolved'] for plan in STRIPE_PLANS.values()
+    )
+
+def resolve_stripe_plan(plan_key):
+    """
+    Resolve a single plan against Stripe and persist the result.
+
+    Args:
+        plan_key (str): Key of the plan in STRIPE_PLANS
+
+    Returns:
+        dict: The updated plan details
+    """
+    plan_details = STRIPE_PLANS[plan_key]
+    product_id, price_id, unit_amount = find_or_create_stripe_price(plan_key, plan_details)
+
+    entry = StripePlanCatalog.query.filter_by(plan_key=plan_key).first()
+    if not entry:
+        entry = StripePlanCatalog(plan_key=plan_key)
+        db.session.add(entry)
+    entry.product_id = product_id
+    entry.price_id = price_id
+    entry.unit_amount = unit_amount
+    entry.refreshed_at = datetime.utcnow()
+    db.session.commit()
+
+    apply_plan_catalog_entry(entry)
+    return plan_details
+
+def refresh_plan_catalog():
+    """Resolve every plan against Stripe and persist the IDs."""
+    for plan_key in STRIPE_PLANS:
+        try:
+            resolve_stripe_plan(plan_key)
+        except stripe.error.StripeError as e:
+            db.session.rollback()
+            app.logger.error(f"Error resolving Stripe plan {plan_key}: {str(e)}")
+
+def refresh_stale_plan_catalog():
+    """Refresh the plan catalog if any entry is missing or older than the TTL."""
+    if not load_plan_catalog():
+        refresh_plan_catalog()
+
+# Background tasks
+# Periodic maintenance runs in daemon threads started by the first request
+# of each worker process.
+_background_lock = threading.Lock()
+_background_tasks_started = False
+_periodic_tasks = []
+
+def register_periodic_task(name, interval, func, run_immediately=False):
+    """
+    Register a function to run every ``interval`` seconds in the background.
+
+    Args:
+        name (str): Thread name, used in logs
+        interval (int): Seconds between runs
+        func (callable): Called inside an application context
+        run_immediately (bool): Run once at startup instead of after the first interval
+    """
+    _periodic_tasks.append((name, interval, func, run_immediately))
+
+def _run_periodic_task(name, interval, func, run_immediately):
+    if not run_immediately:
+        time.sleep(interval)
+    while True:
+        with app.app_context():
+            try:
+                func()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Periodic task {name} failed: {str(e)}")
+            finally:
+                db.session.remove()
+        time.sleep(interval)
+
+@app.before_request
+def start_background_tasks():
+    """Load the plan catalog and start periodic tasks once per worker."""
+    global _background_tasks_started
+    if _background_tasks_started:
+        return
+    with _background_lock:
+        if _background_tasks_started:
+            return
+        _background_tasks_started = True
+
+    try:
+        load_plan_catalog()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Could not load Stripe plan catalog: {str(e)}")
+
+    for name, interval, func, run_immediately in _periodic_tasks:
+        threading.Thread(
+            target=_run_periodic_task,
+            args=(name, interval, func, run_immediately),
+            name=name,
+            daemon=True
+        ).start()
+
+register_periodic_task(
+    'plan-catalog-refresher',
+    max(60, STRIPE_PLAN_CATALOG_TTL // 4),
+    refresh_stale_plan_catalog,
+    run_immediately=True
+)
+
+STRIPE_LATENCY_LOG_INTERVAL = int(os.environ.get('STRIPE_LATENCY_LOG_INTERVAL', 5 * 60))  # seconds
+
+def log_stripe_latency():
+    """Log this process's Stripe call latency per operation."""
+    stats = stripe_gateway.latency_stats.snapshot()
+    for operation, entry in sorted(stats.items()):
+        app.logger.info(
+            f"Stripe {operation}: {entry['calls']} calls, {entry['errors']} errors, "
+            f"p50 {entry['p50_ms']}ms, p95 {entry['p95_ms']}ms, max {entry['max_ms']}ms"
+        )
+    if stats:
+        app.logger.info(f"Stripe connections opened: {stripe_gateway.http_client.connections_opened()}")
+
+register_periodic_task('stripe-latency-logger', STRIPE_LATENCY_LOG_INTERVAL, log_stripe_latency)
+
+plans_cli = AppGroup('plans', help='Manage the cached Stripe plan catalog.')
+
+@plans_cli.command('refresh')
+def refresh_plans_command():
+    """Resolve all plans against Stripe and store their IDs."""
+    refresh_plan_catalog()
+    for plan_key, plan in STRIPE_PLANS.items():
+        click.echo(f"{plan_key}: product={plan['product_id']} price={plan['price_id']}")
+
+app.cli.add_command(plans_cli)
+
+# Background jobs
+# Slow side effects (Stripe calls, reconciliations, file scans) are queued as
+# rows in the jobs table and run by `flask jobs worker`, a separate process
+# with a pool of threads, so request latency does not depend on them. Jobs
+# are claimed with a lease, retried with backoff and may carry an
+# idempotency key: enqueueing a key that exists returns the existing job.
+# Recurring jobs are enqueued by the worker under one key per interval, so
+# any number of workers run each occurrence once.
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))  # seconds
+JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 4))
+JOB_DEFAULT_TIMEOUT = 5 * 60  # seconds a claimed job may run before it is retried
+JOB_DEFAULT_MAX_ATTEMPTS = 5
+JOB_BASE_BACKOFF = 10  # seconds, doubled after every failed attempt
+JOB_MAX_BACKOFF = 60 * 60  # seconds
+JOB_RETENTION = timedelta(days=7)
+JOB_STATS_INTERVAL = 60  # seconds between queue depth log lines of a worker
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+    idempotency_key = db.Column(db.String(255), unique=True, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=JOB_DEFAULT_MAX_ATTEMPTS)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    claim_token = db.Column(db.String(32), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+# Job name -> (function, max attempts, timeout in seconds)
+_job_handlers = {}
+# (name, interval) of the jobs enqueued every ``interval`` seconds
+_recurring_jobs = []
+
+def background_job(name, max_attempts=JOB_DEFAULT_MAX_ATTEMPTS, timeout=JOB_DEFAULT_TIMEOUT):
+    """
+    Register a function as the handler of a job. It is called with the
+    job's payload as keyword arguments inside an application context; its
+    session changes are committed when it returns. Raising retries the job.
+    """
+    def decorator(func):
+        _job_handlers[name] = (func, max_attempts, timeout)
+        return func
+    return decorator
+
+def register_recurring_job(name, interval, func, timeout=JOB_DEFAULT_TIMEOUT):
+    """
+    Run a function every ``interval`` seconds on the job workers. Unlike
+    register_periodic_task it runs once per interval across all processes.
+
+    Args:
+        name (str): Job name, used in logs and idempotency keys
+        interval (int): Seconds between runs
+        func (callable): Called without arguments
+        timeout (int): Seconds a run may take before it is retried
+    """
+    background_job(name, max_attempts=1, timeout=timeout)(func)
+    _recurring_jobs.append((name, interval))
+
+def enqueue_job(name, payload=None, idempotency_key=None, run_at=None):
+    """
+    Queue a job. The caller commits; the job does not exist if the
+    transaction rolls back.
+
+    Keyed jobs are inserted with ON CONFLICT DO NOTHING rather than in a
+    savepoint: pysqlite starts no transaction before a SAVEPOINT, so on
+    SQLite releasing it would commit the job on its own.
+
+    Args:
+        name (str): Registered job name
+        payload (dict): JSON-serializable keyword arguments for the handler
+        idempotency_key (str): Enqueue at most one job with this key
+        run_at (datetime): Earliest run time in UTC (default: now)
+
+    Returns:
+        Job: The new job, or the existing one with the same idempotency key
+    """
+    if name not in _job_handlers:
+        raise ValueError(f"Unknown job: {name}")
+    if idempotency_key:
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing
+    
+    values = {
+        'name': name,
+        'payload': json.dumps(payload or {}),
+        'idempotency_key': idempotency_key,
+        'status': 'queued',
+        'attempts': 0,
+        'max_attempts': _job_handlers[name][1],
+        'run_at': run_at or datetime.utcnow(),
+        'created_at': datetime.utcnow()
+    }
+    if not idempotency_key:
+        job = Job(**values)
+        db.session.add(job)
+        return job
+    
+    job_id = db.session.execute(
+        dialect_insert(Job).values(**values)
+        .on_conflict_do_nothing(index_elements=['idempotency_key'])
+        .returning(Job.id)
+    ).scalar()
+    if job_id is None:
+        # Enqueued by a concurrent request in the meantime
+        return Job.query.filter_by(idempotency_key=idempotency_key).one()
+    return db.session.get(Job, job_id)
+
+def backoff_delay(attempts, base, maximum):
+    """Seconds to wait after the given number of failed attempts, with jitter."""
+    delay = min(maximum, base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+def claim_job(worker_name):
+    """
+    Claim the next due job for the timeout of its handler.
+
+    Returns:
+        tuple: (job id, claim token), or None when no job is due
+    """
+    while True:
+        now = datetime.utcnow()
+        job = db.session.query(Job.id, Job.name).filter(
+            Job.status == 'queued',
+            Job.run_at <= now
+        ).order_by(Job.run_at, Job.id).first()
+        if job is None:
+            db.session.commit()
+            return None
+        
+        _, _, timeout = _job_handlers.get(job.name, (None, None, JOB_DEFAULT_TIMEOUT))
+        token = f"{worker_name[:15]}-{secrets.token_hex(8)}"
+        # Conditional update: of two workers racing for a job only one matches
+        claimed = Job.query.filter(Job.id == job.id, Job.status == 'queued').update({
+            'status': 'running',
+            'claim_token': token,
+            'locked_until': now + timedelta(seconds=timeout),
+            'attempts': Job.attempts + 1,
+            'started_at': now
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return job.id, token
+
+def finish_job(job_id, token, error=None):
+    """Record the outcome of a claimed job, unless its lease was taken over."""
+    job = Job.query.filter_by(id=job_id, claim_token=token).first()
+    if job is None:
+        return
+    job.claim_token = None
+    job.locked_until = None
+    if error is None:
+        job.status = 'succeeded'
+        job.finished_at = datetime.utcnow()
+        job.last_error = None
+    elif job.attempts >= job.max_attempts:
+        job.status = 'failed'
+        job.finished_at = datetime.utcnow()
+        job.last_error = error
+    else:
+        job.status = 'queued'
+        job.run_at = datetime.utcnow() + timedelta(seconds=backoff_delay(job.attempts, JOB_BASE_BACKOFF, JOB_MAX_BACKOFF))
+        job.last_error = error
+    db.session.commit()
+
+def run_next_job(worker_name='worker'):
+    """
+    Claim and run one due job.
 
-def generate_profile_picture(name, size=100, font_scale=0.5):
+    Returns:
+        bool: False when no job was due
     """
-    Generate a profile picture with user's initials on a colorful background
+    claim = claim_job(worker_name)
+    if claim is None:
+        return False
+    job_id, token = claim
     
+    job = db.session.get(Job, job_id)
+    handler = _job_handlers.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job {job.name}")
+        handler[0](**json.loads(job.payload))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Job {job_id} ({job.name}) failed: {str(e)}")
+        finish_job(job_id, token, error=str(e) or e.__class__.__name__)
+    else:
+        finish_job(job_id, token)
+    return True
+
+def schedule_recurring_jobs():
+    """Enqueue the current occurrence of every recurring job."""
+    now = time.time()
+    for name, interval in _recurring_jobs:
+        slot = int(now // interval)
+        enqueue_job(
+            name,
+            idempotency_key=f"recurring:{name}:{slot}",
+            run_at=datetime.utcfromtimestamp(slot * interval)
+        )
+    db.session.commit()
+
+def requeue_expired_jobs():
+    """Give jobs whose worker died or timed out back to the queue."""
+    now = datetime.utcnow()
+    expired = Job.query.filter(Job.status == 'running', Job.locked_until < now).all()
+    for job in expired:
+        job.claim_token = None
+        job.locked_until = None
+        job.last_error = 'Lease expired'
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = now
+        else:
+            job.status = 'queued'
+            job.run_at = now
+    db.session.commit()
+    return len(expired)
+
+def prune_jobs():
+    """Delete finished jobs older than JOB_RETENTION."""
+    Job.query.filter(
+        Job.status.in_(('succeeded', 'failed')),
+        Job.finished_at < datetime.utcnow() - JOB_RETENTION
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+def job_queue_stats():
+    """
+    Queue depth per job name.
+
+    Returns:
+        dict: name -> {'queued', 'due', 'running', 'failed', 'oldest_due_seconds'}
+    """
+    now = datetime.utcnow()
+    stats = {}
+    rows = db.session.query(
+        Job.name,
+        Job.status,
+        func.count(Job.id),
+        func.sum(db.case((Job.run_at <= now, 1), else_=0)),
+        func.min(Job.run_at)
+    ).filter(Job.status.in_(('queued', 'running', 'failed'))).group_by(Job.name, Job.status).all()
+    for name, status, count, due, oldest in rows:
+        entry = stats.setdefault(name, {'queued': 0, 'due': 0, 'running': 0, 'failed': 0, 'oldest_due_seconds': 0})
+        entry[status] = count
+        if status == 'queued':
+            entry['due'] = int(due or 0)
+            if due:
+                entry['oldest_due_seconds'] = int((now - oldest).total_seconds())
+    return stats
+
+class JobWorker:
+    """
+    Runs jobs on a pool of threads until stopped. One extra thread
+    schedules recurring jobs, requeues expired leases and logs the queue
+    depth.
+    """
+
+    def __init__(self, threads=JOB_WORKER_THREADS, poll_interval=JOB_POLL_INTERVAL):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+
+    def _work(self, worker_name):
+        while not self.stopping.is_set():
+            with app.app_context():
+                try:
+                    ran = run_next_job(worker_name)
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Job worker {worker_name} error: {str(e)}")
+                    ran = False
+                finally:
+                    db.session.remove()
+            if not ran:
+                self.stopping.wait(self.poll_interval)
+
+    def _maintain(self):
+        last_stats = 0
+        while not self.stopping.is_set():
+            with app.app_context():
+                try:
+                    schedule_recurring_jobs()
+                    requeue_expired_jobs()
+                    if time.monotonic() - last_stats >= JOB_STATS_INTERVAL:
+                        last_stats = time.monotonic()
+                        for name, entry in job_queue_stats().items():
+                            app.logger.info(
+                                f"Job queue {name}: {entry['due']} due, {entry['queued']} queued, "
+                                f"{entry['running']} running, {entry['failed']} failed, "
+                                f"oldest due {entry['oldest_due_seconds']}s"
+                            )
+                        log_stripe_latency()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Job scheduler error: {str(e)}")
+                finally:
+                    db.session.remove()
+            self.stopping.wait(self.poll_interval)
+
+    def run(self):
+        """Block until stop() is called or the process is interrupted."""
+        workers = [
+            threading.Thread(target=self._work, args=(f"job-worker-{os.getpid()}-{i}",), name=f"job-worker-{i}", daemon=True)
+            for i in range(self.threads)
+        ]
+        workers.append(threading.Thread(target=self._maintain, name='job-scheduler', daemon=True))
+        for thread in workers:
+            thread.start()
+        try:
+            while not self.stopping.wait(1):
+                pass
+        except KeyboardInterrupt:
+            self.stopping.set()
+        for thread in workers:
+            thread.join()
+
+    def stop(self):
+        self.stopping.set()
+
+register_recurring_job('job-pruner', 60 * 60, prune_jobs)
+
+jobs_cli = AppGroup('jobs', help='Run and inspect background jobs.')
+
+@jobs_cli.command('worker')
+@click.option('--threads', type=int, default=JOB_WORKER_THREADS, show_default=True, help='Jobs run in parallel.')
+def jobs_worker_command(threads):
+    """Run jobs until interrupted."""
+    worker = JobWorker(threads=threads)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    click.echo(f"Job worker started with {threads} thread(s)")
+    worker.run()
+
+@jobs_cli.command('run')
+def jobs_run_command():
+    """Run all due jobs in this process, then exit."""
+    schedule_recurring_jobs()
+    count = 0
+    while run_next_job('cli'):
+        count += 1
+    click.echo(f"Ran {count} job(s)")
+
+@jobs_cli.command('status')
+def jobs_status_command():
+    """Show the queue depth per job."""
+    stats = job_queue_stats()
+    if not stats:
+        click.echo('No queued, running or failed jobs')
+    for name, entry in sorted(stats.items()):
+        click.echo(
+            f"{name}: {entry['due']} due, {entry['queued']} queued, {entry['running']} running, "
+            f"{entry['failed']} failed, oldest due {entry['oldest_due_seconds']}s"
+        )
+
+app.cli.add_command(jobs_cli)
+
+# Avatar rendering
+# Avatars are rendered once per (initials, palette index, size), kept in an
+# in-memory LRU backed by a disk cache, and served from /avatar/<id>/<size>.png.
+AVATAR_COLORS = [
+    ('#2196F3', '#1976D2'),  # Blue
+    ('#4CAF50', '#388E3C'),  # Green
+    ('#FF5722', '#E64A19'),  # Deep Orange
+    ('#9C27B0', '#7B1FA2'),  # Purple
+    ('#00BCD4', '#0097A7'),  # Cyan
+    ('#FF9800', '#F57C00'),  # Orange
+    ('#795548', '#5D4037'),  # Brown
+    ('#607D8B', '#455A64'),  # Blue Grey
+]
+AVATAR_FONT_PATHS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/ubuntu/Ubuntu-Bold.ttf",
+    "/usr/share/fonts/truetype/liberation2/LiberationSans-Bold.ttf"
+]
+AVATAR_MIN_SIZE = 16
+AVATAR_MAX_SIZE = 512
+AVATAR_TEMPLATE_SIZES = (50, 100)  # Sizes requested by templates, warmed by 'flask avatars pregenerate'
+AVATAR_RENDER_VERSION = 2  # Bump when the rendering changes to invalidate caches
+AVATAR_CACHE_DIR = os.environ.get('AVATAR_CACHE_DIR', os.path.join(app.root_path, 'avatar_cache'))
+AVATAR_LRU_SIZE = int(os.environ.get('AVATAR_LRU_SIZE', 512))
+
+def get_avatar_params(name):
+    """
+    Derive the initials and palette index used to render a user's avatar.
+
     Args:
         name (str): Full name of the user
-        size (int): Size of the image in pixels
-        font_scale (float): Scale of font size relative to image size
-    
+
     Returns:
-        str: Base64 encoded image
+        tuple: (initials, color_index)
     """
     # Ensure we have a valid name
     if not name or not isinstance(name, str):
         name = 'Anonymous'
-    
-    # Enhanced color palette with more nuanced and professional colors
-    colors = [
-        ('#2196F3', '#1976D2'),  # Blue
-        ('#4CAF50', '#388E3C'),  # Green
-        ('#FF5722', '#E64A19'),  # Deep Orange
-        ('#9C27B0', '#7B1FA2'),  # Purple
-        ('#00BCD4', '#0097A7'),  # Cyan
-        ('#FF9800', '#F57C00'),  # Orange
-        ('#795548', '#5D4037'),  # Brown
-        ('#607D8B', '#455A64'),  # Blue Grey
-    ]
-    
-    # Sophisticated text color selection
-    def get_text_color(bg_color):
-        # Convert hex to RGB
-        bg_color = bg_color.lstrip('#')
-        rgb = tuple(int(bg_color[i:i+2], 16) for i in (0, 2, 4))
-        
-        # Calculate luminance
-        luminance = (0.299 * rgb[0] + 0.587 * rgb[1] + 0.114 * rgb[2]) / 255
-        
-        # Choose text color based on background luminance
-        return '#FFFFFF' if luminance < 0.5 else '#000000'
-    
+
     # Sanitize and process name
     name = name.strip()
     name_parts = name.split()
-    
+
     # Generate initials
     if len(name_parts) >= 2:
         initials = f"{name_parts[0][0].upper()}{name_parts[-1][0].upper()}"
@@ -355,85 +1035,207 @@ def generate_profile_picture(name, size=100, font_scale=0.5):
         initials = name_parts[0][0].upper()
     else:
         initials = '?'
-    
+
     # Deterministic color selection based on name
-    color_index = sum(ord(char) for char in name) % len(colors)
-    background_color, gradient_color = colors[color_index]
-    text_color = get_text_color(background_color)
-    
-    # Create image with gradient background
-    image = Image.new('RGB', (size, size))
-    draw = ImageDraw.Draw(image)
-    
-    # Create gradient background
-    for y in range(size):
-        # Linear gradient
-        r1 = int(int(background_color[1:3], 16) * (size - y) / size + 
-                 int(gradient_color[1:3], 16) * y / size)
-        g1 = int(int(background_color[3:5], 16) * (size - y) / size + 
-                 int(gradient_color[3:5], 16) * y / size)
-        b1 = int(int(background_color[5:7], 16) * (size - y) / size + 
-                 int(gradient_color[5:7], 16) * y / size)
-        
-        draw.line([(0, y), (size, y)], fill=(r1, g1, b1))
-    
-    # Load a font
-    font = None
-    font_paths = [
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-        "/usr/share/fonts/truetype/ubuntu/Ubuntu-Bold.ttf",
-        "/usr/share/fonts/truetype/liberation2/LiberationSans-Bold.ttf"
-    ]
-    
-    for path in font_paths:
+    color_index = sum(ord(char) for char in name) % len(AVATAR_COLORS)
+    return initials, color_index
+
+def get_avatar_text_color(bg_color):
+    """Pick white or black text depending on the background luminance."""
+    bg_color = bg_color.lstrip('#')
+    rgb = tuple(int(bg_color[i:i+2], 16) for i in (0, 2, 4))
+
+    luminance = (0.299 * rgb[0] + 0.587 * rgb[1] + 0.114 * rgb[2]) / 255
+    return '#FFFFFF' if luminance < 0.5 else '#000000'
+
+def _hex_to_rgb(color):
+    return tuple(int(color[i:i+2], 16) for i in (1, 3, 5))
+
+# (top RGB, bottom RGB, text color) per palette entry, parsed once
+AVATAR_PALETTE_RGB = [
+    (_hex_to_rgb(top), _hex_to_rgb(bottom), get_avatar_text_color(top))
+    for top, bottom in AVATAR_COLORS
+]
+
+@functools.lru_cache(maxsize=16)
+def _avatar_gradient_mask(size):
+    """Vertical 0-255 ramp used to blend the two palette colors."""
+    return Image.linear_gradient('L').resize((size, size), Image.BILINEAR)
+
+@functools.lru_cache(maxsize=64)
+def load_avatar_font(pixel_size):
+    """
+    Load the avatar font for a pixel size. Fonts are loaded once per process.
+
+    Args:
+        pixel_size (int): Font size in pixels
+
+    Returns:
+        ImageFont: The first available bold font, or Pillow's default font
+    """
+    for path in AVATAR_FONT_PATHS:
         try:
-            font = ImageFont.truetype(path, size=int(size * font_scale))
-            break
+            return ImageFont.truetype(path, size=pixel_size)
         except IOError:
             continue
-    
+
     # Fallback to default if no font found
-    if font is None:
-        font = ImageFont.load_default()
-    
+    return ImageFont.load_default()
+
+def avatar_etag(initials, color_index, size):
+    """Stable identifier for a rendered avatar, used as ETag and cache file name."""
+    key = f"{AVATAR_RENDER_VERSION}:{initials}:{color_index}:{size}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+def render_avatar_png(initials, color_index, size, font_scale=0.5):
+    """
+    Render an avatar with initials on a gradient background.
+
+    Args:
+        initials (str): One or two letters to draw
+        color_index (int): Index into AVATAR_COLORS
+        size (int): Size of the image in pixels
+        font_scale (float): Scale of font size relative to image size
+
+    Returns:
+        bytes: PNG encoded image
+    """
+    top_rgb, bottom_rgb, text_color = AVATAR_PALETTE_RGB[color_index]
+
+    # Blend both colors through a linear ramp in one operation
+    image = Image.composite(
+        Image.new('RGB', (size, size), bottom_rgb),
+        Image.new('RGB', (size, size), top_rgb),
+        _avatar_gradient_mask(size)
+    )
+    draw = ImageDraw.Draw(image)
+
+    font = load_avatar_font(int(size * font_scale))
+
     # Calculate text position
     text_bbox = font.getbbox(initials)
     text_width = text_bbox[2] - text_bbox[0]
     text_height = text_bbox[3] - text_bbox[1]
     position = ((size - text_width) / 2, (size - text_height) / 2)
-    
+
     # Draw text with slight shadow for better readability
-    # Shadow
     shadow_offset = 1
     draw.text(
-        (position[0] + shadow_offset, position[1] + shadow_offset), 
-        initials, 
-        font=font, 
+        (position[0] + shadow_offset, position[1] + shadow_offset),
+        initials,
+        font=font,
         fill=(0, 0, 0, 64)  # Transparent black
     )
-    
-    # Main text
-    draw.text(
-        position, 
-        initials, 
-        font=font, 
-        fill=text_color
-    )
-    
-    # Save to bytes
+    draw.text(position, initials, font=font, fill=text_color)
+
     img_byte_arr = io.BytesIO()
     image.save(img_byte_arr, format='PNG')
-    img_byte_arr = img_byte_arr.getvalue()
-    
-    # Encode to base64
-    return f"data:image/png;base64,{base64.b64encode(img_byte_arr).decode('utf-8')}"
+    return img_byte_arr.getvalue()
+
+class AvatarCache:
+    """
+    Two-level cache for rendered avatars: an in-memory LRU in front of a
+    directory of PNG files shared by all worker processes.
+    """
+
+    def __init__(self, cache_dir, max_entries=512):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _disk_path(self, etag):
+        return os.path.join(self.cache_dir, f"{etag}.png")
+
+    def _remember(self, etag, png):
+        with self._lock:
+            self._entries[etag] = png
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, initials, color_index, size):
+        """
+        Return the PNG bytes for an avatar, rendering it only on a full miss.
+
+        Returns:
+            tuple: (etag, png_bytes)
+        """
+        etag = avatar_etag(initials, color_index, size)
+
+        with self._lock:
+            png = self._entries.get(etag)
+            if png is not None:
+                self._entries.move_to_end(etag)
+                return etag, png
+
+        path = self._disk_path(etag)
+        try:
+            with open(path, 'rb') as f:
+                png = f.read()
+        except OSError:
+            png = render_avatar_png(initials, color_index, size)
+            self.store(etag, png)
+
+        self._remember(etag, png)
+        return etag, png
+
+    def store(self, etag, png):
+        """Write a rendered avatar to the disk cache atomically."""
+        path = self._disk_path(etag)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            app.logger.warning(f"Could not write avatar cache file {path}: {e}")
+
+avatar_cache = AvatarCache(AVATAR_CACHE_DIR, max_entries=AVATAR_LRU_SIZE)
+
+def _pregenerate_avatar(job):
+    """Pool worker: render one avatar into the disk cache unless present."""
+    initials, color_index, size = job
+    etag = avatar_etag(initials, color_index, size)
+    if os.path.exists(avatar_cache._disk_path(etag)):
+        return False
+    avatar_cache.store(etag, render_avatar_png(initials, color_index, size))
+    return True
+
+avatars_cli = AppGroup('avatars', help='Manage the rendered avatar cache.')
+
+@avatars_cli.command('pregenerate')
+@click.option('--size', 'sizes', type=click.IntRange(AVATAR_MIN_SIZE, AVATAR_MAX_SIZE), multiple=True,
+              help='Avatar size in pixels; repeatable. Defaults to the template sizes.')
+@click.option('--processes', type=int, default=None,
+              help='Worker processes (defaults to the CPU count).')
+def pregenerate_avatars_command(sizes, processes):
+    """Render avatars for every existing user into the disk cache."""
+    sizes = sizes or AVATAR_TEMPLATE_SIZES
+    jobs = sorted({
+        (*get_avatar_params(name), size)
+        for (name,) in db.session.query(User.name)
+        for size in sizes
+    })
+    click.echo(f"Rendering {len(jobs)} avatar(s) for sizes {', '.join(map(str, sizes))}")
+
+    with multiprocessing.Pool(processes) as pool:
+        rendered = sum(pool.imap_unordered(_pregenerate_avatar, jobs, chunksize=32))
+
+    click.echo(f"Rendered {rendered}, {len(jobs) - rendered} already cached")
+
+app.cli.add_command(avatars_cli)
 
 # Database Models
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(100), nullable=False)
+    username = db.Column(db.String(100), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
+    # Lowercase copies for indexed directory lookups, kept in sync on flush
+    username_lower = db.Column(db.String(100), nullable=False)
+    email_lower = db.Column(db.String(120), nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime, nullable=True)
@@ -445,7 +1247,7 @@ class User(db.Model, UserMixin):
     profile_picture = db.Column(db.String(500), nullable=True)
     
     # New fields for payment methods
-    stripe_customer_id = db.Column(db.String(255), nullable=True)
+    stripe_customer_id = db.Column(db.String(255), nullable=True, index=True)
     default_payment_method_id = db.Column(db.String(255), nullable=True)
     
     server_instances = db.relationship('ServerInstance', backref='owner', lazy='dynamic')
@@ -453,6 +1255,13 @@ class User(db.Model, UserMixin):
     payments = db.relationship('Payment', backref='user', lazy='dynamic')
     payment_methods = db.relationship('PaymentMethod', back_populates='user', lazy='dynamic')
     cloud_storage = db.relationship('UserCloudStorage', back_populates='user')
+
+    __table_args__ = (
+        # text_pattern_ops lets PostgreSQL use the indexes for LIKE 'prefix%'
+        db.Index('ix_user_username_lower', 'username_lower', postgresql_ops={'username_lower': 'text_pattern_ops'}),
+        db.Index('ix_user_email_lower', 'email_lower', postgresql_ops={'email_lower': 'text_pattern_ops'}),
+    )
+
     planner_tasks_created = db.relationship('PlannerTask', 
                                             foreign_keys='PlannerTask.creator_id', 
                                             back_populates='creator', 
@@ -519,16 +1328,22 @@ class User(db.Model, UserMixin):
 
     def get_profile_picture(self, size=100):
         """
-        Always generate a profile picture based on user's name
+        URL of the generated profile picture based on user's name
         
         Args:
             size (int): Size of the profile picture in pixels
         
         Returns:
-            str: Base64 encoded profile picture
+            str: Cacheable avatar URL, versioned by the rendered content
         """
         # Always generate picture from name, ignoring stored profile_picture
-        return generate_profile_picture(self.name, size=size)
+        initials, color_index = get_avatar_params(self.name)
+        return url_for(
+            'user_avatar',
+            user_id=self.id,
+            size=size,
+            v=avatar_etag(initials, color_index, size)
+        )
 
     def __repr__(self):
         return f'<User {self.name}>'
@@ -536,10 +1351,12 @@ class User(db.Model, UserMixin):
 class PaymentMethod(db.Model):
     __tablename__ = 'payment_methods'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     card_type = db.Column(db.String(50), nullable=False)  # visa, mastercard, etc.
     last4 = db.Column(db.String(4), nullable=False)  # Changed from last_four
-    encrypted_card_number = db.Column(db.String(255), nullable=False)
+    # Cards saved through Stripe have no local card number
+    encrypted_card_number = db.Column(db.String(255), nullable=True)
+    stripe_payment_method_id = db.Column(db.String(255), unique=True, nullable=True)
     expiry_month = db.Column(db.Integer, nullable=False)
     expiry_year = db.Column(db.Integer, nullable=False)
     is_default = db.Column(db.Boolean, default=False)
@@ -640,6 +1457,12 @@ class Subscription(db.Model):
     # New columns
     payment_status = db.Column(db.String(20), default='pending')  # pending, paid, overdue
     amount_paid = db.Column(db.Float, default=0.0)
+    stripe_checkout_session_id = db.Column(db.String(255), unique=True, nullable=True)
+    stripe_subscription_id = db.Column(db.String(255), nullable=True, index=True)
+    # Creation times of the last subscription and invoice events applied;
+    # each orders its own events, status and payment_status respectively
+    stripe_event_created_at = db.Column(db.DateTime, nullable=True)
+    stripe_invoice_event_created_at = db.Column(db.DateTime, nullable=True)
     
     # Relationships
     user = db.relationship('User', back_populates='user_subscriptions')
@@ -650,7 +1473,7 @@ class Subscription(db.Model):
 
 class ServerInstance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     subscription_id = db.Column(db.Integer, db.ForeignKey('subscription.id'), nullable=False)
     server_name = db.Column(db.String(100), nullable=False)
     server_type = db.Column(db.String(50), nullable=False)
@@ -659,7 +1482,7 @@ class ServerInstance(db.Model):
 
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     subscription_id = db.Column(db.Integer, db.ForeignKey('subscription.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     payment_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -667,20 +1490,105 @@ class Payment(db.Model):
     transaction_id = db.Column(db.String(255), nullable=True)
     status = db.Column(db.String(20), default='completed')  # completed, pending, failed
 
+class StripePlanCatalog(db.Model):
+    __tablename__ = 'stripe_plan_catalog'
+    id = db.Column(db.Integer, primary_key=True)
+    plan_key = db.Column(db.String(50), unique=True, nullable=False)
+    product_id = db.Column(db.String(255), nullable=False)
+    price_id = db.Column(db.String(255), nullable=False)
+    unit_amount = db.Column(db.Integer, nullable=False)  # cents
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StripePlanCatalog {self.plan_key}: {self.price_id}>'
+
+class StorageBlob(db.Model):
+    __tablename__ = 'storage_blobs'
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime, nullable=True)  # Last time a reference was dropped
+
+    def __repr__(self):
+        return f'<StorageBlob {self.sha256} refs={self.ref_count}>'
+
 class UserCloudStorage(db.Model):
     __tablename__ = 'user_cloud_storage'
+    __table_args__ = (
+        db.Index('ix_user_cloud_storage_user_id_uploaded_at', 'user_id', 'uploaded_at'),
+        db.Index('ix_user_cloud_storage_user_id_file_name', 'user_id', 'file_name'),
+        db.Index('ix_user_cloud_storage_user_id_file_size', 'user_id', 'file_size'),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
     file_name = Column(String(255), nullable=False)
-    file_path = Column(String(500), nullable=False)
+    file_path = Column(String(500), nullable=True)  # Legacy per-user copy, unset once the content is in the blob store
     file_size = Column(Integer, nullable=False)
     file_type = Column(String(100), nullable=False)
+    sha256 = Column(String(64), ForeignKey('storage_blobs.sha256'), nullable=True, index=True)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
     
     user = relationship('User', back_populates='cloud_storage')
+    blob = relationship('StorageBlob')
+
+    @property
+    def stored_path(self):
+        """Location of the file content on disk."""
+        if self.file_path:
+            return self.file_path
+        return blob_path(self.sha256) if self.sha256 else None
+
+class UserStorageQuota(db.Model):
+    __tablename__ = 'user_storage_quota'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    used_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    file_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    reconciled_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<UserStorageQuota user={self.user_id} used={self.used_bytes}>'
+
+class UploadSession(db.Model):
+    __tablename__ = 'upload_sessions'
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    file_name = db.Column(db.String(255), nullable=False)
+    file_type = db.Column(db.String(100), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    temp_path = db.Column(db.String(500), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    chunks = db.relationship('UploadSessionChunk', backref='session', cascade='all, delete-orphan')
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def chunk_length(self, index):
+        """Expected byte length of chunk ``index``."""
+        return min(self.chunk_size, self.total_size - index * self.chunk_size)
+
+    def __repr__(self):
+        return f'<UploadSession {self.id} user={self.user_id}>'
+
+class UploadSessionChunk(db.Model):
+    __tablename__ = 'upload_session_chunks'
+    # One row per received chunk, so parallel PUTs never update the same row
+    session_id = db.Column(db.String(32), db.ForeignKey('upload_sessions.id'), primary_key=True)
+    chunk_index = db.Column(db.Integer, primary_key=True)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class SharedFile(db.Model):
     __tablename__ = 'shared_files'
+    __table_args__ = (
+        db.Index('ix_shared_files_recipient_id_status', 'recipient_id', 'status'),
+        # One share per file and recipient; re-sharing updates the row
+        db.UniqueConstraint('original_file_id', 'recipient_id', name='uq_shared_files_original_file_id_recipient_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     original_file_id = db.Column(db.Integer, db.ForeignKey('user_cloud_storage.id'), nullable=False)
@@ -736,19 +1644,26 @@ class PlannerBoard(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
-    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_public = db.Column(db.Boolean, default=False)
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)  # Hidden, waiting for purge_deleted_boards
     
     owner = db.relationship('User', backref='owned_boards')
-    lists = db.relationship('PlannerList', back_populates='board', cascade='all, delete-orphan')
-    board_members = db.relationship('BoardMember', back_populates='board', cascade='all, delete-orphan')
+    # Children are removed by ON DELETE CASCADE, not loaded and deleted one by one
+    lists = db.relationship('PlannerList', back_populates='board', cascade='all, delete-orphan',
+                            passive_deletes=True, order_by=lambda: (PlannerList.rank, PlannerList.id))
+    board_members = db.relationship('BoardMember', back_populates='board', cascade='all, delete-orphan',
+                                    passive_deletes=True)
 
 class BoardMember(db.Model):
     __tablename__ = 'board_members'
+    __table_args__ = (
+        db.Index('ix_board_members_board_id_user_id', 'board_id', 'user_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    board_id = db.Column(db.Integer, db.ForeignKey('planner_boards.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    board_id = db.Column(db.Integer, db.ForeignKey('planner_boards.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     role = db.Column(db.String(20), default='viewer')  # 'viewer', 'editor', 'admin'
     
     board = db.relationship('PlannerBoard', back_populates='board_members')
@@ -756,22 +1671,30 @@ class BoardMember(db.Model):
 
 class PlannerList(db.Model):
     __tablename__ = 'planner_lists'
+    __table_args__ = (
+        db.Index('ix_planner_lists_board_id_rank', 'board_id', 'rank'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
-    board_id = db.Column(db.Integer, db.ForeignKey('planner_boards.id'), nullable=False)
-    order = db.Column(db.Integer, default=0)
+    board_id = db.Column(db.Integer, db.ForeignKey('planner_boards.id', ondelete='CASCADE'), nullable=False, index=True)
+    rank = db.Column(db.String(255), nullable=False)  # Position on the board, see rank_between
     
     board = db.relationship('PlannerBoard', back_populates='lists')
-    tasks = db.relationship('PlannerTask', back_populates='list', cascade='all, delete-orphan')
+    tasks = db.relationship('PlannerTask', back_populates='list', cascade='all, delete-orphan',
+                            passive_deletes=True, order_by=lambda: (PlannerTask.rank, PlannerTask.id))
 
 class PlannerTask(db.Model):
     __tablename__ = 'planner_tasks'
+    __table_args__ = (
+        db.Index('ix_planner_tasks_list_id_rank', 'list_id', 'rank'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=True)
-    list_id = db.Column(db.Integer, db.ForeignKey('planner_lists.id'), nullable=False)
+    list_id = db.Column(db.Integer, db.ForeignKey('planner_lists.id', ondelete='CASCADE'), nullable=False, index=True)
+    rank = db.Column(db.String(255), nullable=False)  # Position in the list, see rank_between
     creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    assigned_to_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    assigned_to_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
     due_date = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime, nullable=True)
@@ -795,6 +1718,22 @@ class PlannerTask(db.Model):
         self.completed_at = None
         self.is_completed = False
 
+class BoardEvent(db.Model):
+    __tablename__ = 'board_events'
+    __table_args__ = (
+        db.Index('ix_board_events_board_id_id', 'board_id', 'id'),
+    )
+    # Change log read by the board change feed; no foreign key, so the
+    # event announcing a board's deletion outlives the board
+    id = db.Column(db.Integer, primary_key=True)
+    board_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(30), nullable=False)  # 'task.created', 'list.deleted', 'board.updated', ...
+    data = db.Column(db.Text, nullable=False)  # JSON payload sent to clients
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def to_message(self):
+        return {'id': self.id, 'board_id': self.board_id, 'kind': self.kind, 'data': self.data}
+
 # User Loader for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
@@ -952,8 +1891,376 @@ def index():
             details=str(e)
         ), 500
 
-@app.route('/register', methods=['GET', 'POST'])
-def register():
+# Stripe side effects
+# Stripe calls made on behalf of a request run as background jobs: handlers
+# change local state and enqueue the matching job in the same transaction.
+# The jobs read the current local state when they run, so a job that runs
+# late or twice still leaves Stripe matching the database.
+@background_job('stripe.ensure_customer')
+def ensure_stripe_customer_job(user_id):
+    """Create the user's Stripe customer unless they already have one."""
+    user = db.session.get(User, user_id)
+    if user is not None:
+        stripe_gateway.ensure_customer(user)
+
+@background_job('stripe.sync_default_payment_method')
+def sync_default_payment_method_job(user_id):
+    """Make the customer's invoice default the user's local default card."""
+    user = db.session.get(User, user_id)
+    if user is None or not user.stripe_customer_id:
+        return
+    default_method = PaymentMethod.query.filter(
+        PaymentMethod.user_id == user_id,
+        PaymentMethod.is_default.is_(True),
+        PaymentMethod.stripe_payment_method_id.isnot(None)
+    ).first()
+    if default_method is None:
+        return
+    stripe_gateway.call(
+        'customer.modify', stripe.Customer.modify,
+        user.stripe_customer_id,
+        invoice_settings={'default_payment_method': default_method.stripe_payment_method_id}
+    )
+
+@background_job('stripe.detach_payment_method')
+def detach_payment_method_job(stripe_payment_method_id):
+    """Detach a deleted card from its Stripe customer."""
+    try:
+        stripe_gateway.call('payment_method.detach', stripe.PaymentMethod.detach, stripe_payment_method_id)
+    except stripe.error.InvalidRequestError as e:
+        # Already detached or gone, e.g. after an earlier attempt timed out
+        app.logger.warning(f"Payment method {stripe_payment_method_id} not detached: {str(e)}")
+
+def record_checkout_session(checkout_session):
+    """
+    Create the local subscription and server instance for a completed
+    Checkout Session. The caller commits; the unique session id on
+    Subscription makes a second recording fail instead of duplicating.
+
+    Args:
+        checkout_session (dict): Session object from a checkout.session.completed event
+
+    Returns:
+        Subscription: The new subscription
+    """
+    user = db.session.get(User, int(checkout_session['client_reference_id']))
+    plan_key = (checkout_session.get('metadata') or {}).get('plan')
+    if plan_key not in STRIPE_PLANS:
+        plan_key = 'starter'
+    plan = STRIPE_PLANS[plan_key]
+    
+    subscription = Subscription(
+        user_id=user.id,
+        plan_name=plan_key,
+        start_date=datetime.utcfromtimestamp(checkout_session['created']),
+        status='active',
+        payment_status='paid' if checkout_session.get('payment_status') == 'paid' else 'pending',
+        amount_paid=(checkout_session.get('amount_total') or 0) / 100 or plan['monthly_price'],
+        stripe_checkout_session_id=checkout_session['id'],
+        stripe_subscription_id=checkout_session.get('subscription')
+    )
+    db.session.add(subscription)
+    db.session.flush()
+    
+    db.session.add(ServerInstance(
+        user_id=user.id,
+        subscription_id=subscription.id,
+        server_name=f"{user.name}'s {plan['name']} Server",
+        server_type=plan_key.lower(),
+        status='active'
+    ))
+    
+    # Checkout creates the customer for users who had none
+    if not user.stripe_customer_id and checkout_session.get('customer'):
+        user.stripe_customer_id = checkout_session['customer']
+    
+    return subscription
+
+# Stripe webhooks
+# Stripe posts signed events to /stripe/webhook. The endpoint only checks the
+# signature and stores the raw event in the stripe_events inbox, together
+# with a job that applies it, and answers right away. Handlers run on the
+# job worker and must be safe to run twice: Stripe redelivers events and
+# `flask stripe replay` applies stored events again. Stripe does not deliver
+# events in order either, so subscriptions remember the creation time of
+# the last event applied to them and older events are skipped.
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
+STRIPE_WEBHOOK_TOLERANCE = 300  # seconds a signature timestamp may be off
+STRIPE_EVENT_RETENTION = timedelta(days=30)
+
+class StripeEvent(db.Model):
+    __tablename__ = 'stripe_events'
+    __table_args__ = (
+        db.Index('ix_stripe_events_status_received_at', 'status', 'received_at'),
+    )
+
+    id = db.Column(db.String(255), primary_key=True)  # Stripe event ID, e.g. evt_1Nx...
+    type = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # Raw request body
+    status = db.Column(db.String(20), nullable=False, default='received')  # received, processed, ignored, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)  # When Stripe created the event
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+# Event type -> handler called with the event's data.object and creation time
+_stripe_event_handlers = {}
+
+def stripe_event_handler(event_type):
+    """Register the function that applies events of one type."""
+    def decorator(func):
+        _stripe_event_handlers[event_type] = func
+        return func
+    return decorator
+
+def store_stripe_event(event_id, event_type, payload, created_at):
+    """
+    Add an event to the inbox and queue its processing in the caller's
+    transaction. The caller commits.
+
+    Returns:
+        bool: False if the event was already stored
+    """
+    stored = db.session.execute(
+        dialect_insert(StripeEvent).values(
+            id=event_id,
+            type=event_type,
+            payload=payload,
+            status='received',
+            attempts=0,
+            created_at=created_at,
+            received_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=['id']).returning(StripeEvent.id)
+    ).scalar()
+    if stored is None:
+        # Redelivery of an event we already have
+        return False
+    enqueue_job('stripe.process_event', {'event_id': event_id}, idempotency_key=f"stripe-event:{event_id}")
+    return True
+
+@app.route('/stripe/webhook', methods=['POST'])
+@csrf.exempt  # Authenticated by the Stripe-Signature header
+def stripe_webhook():
+    """Verify and store a Stripe event; it is applied by a background job."""
+    if not STRIPE_WEBHOOK_SECRET:
+        app.logger.error("Stripe webhook received but STRIPE_WEBHOOK_SECRET is not set")
+        return jsonify({'error': 'Webhook not configured'}), 503
+
+    payload = request.get_data(as_text=True)
+    try:
+        stripe.WebhookSignature.verify_header(
+            payload,
+            request.headers.get('Stripe-Signature', ''),
+            STRIPE_WEBHOOK_SECRET,
+            STRIPE_WEBHOOK_TOLERANCE
+        )
+        stripe_event = json.loads(payload)
+        event_id, event_type = stripe_event['id'], stripe_event['type']
+        created_at = datetime.utcfromtimestamp(stripe_event['created'])
+    except stripe.error.SignatureVerificationError as e:
+        app.logger.warning(f"Stripe webhook signature rejected: {str(e)}")
+        return jsonify({'error': 'Invalid signature'}), 400
+    except (ValueError, KeyError, TypeError):
+        return jsonify({'error': 'Invalid payload'}), 400
+
+    try:
+        store_stripe_event(event_id, event_type, payload, created_at)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error storing Stripe event {event_id}: {str(e)}")
+        # Stripe retries non-2xx responses
+        return jsonify({'error': 'Failed to store event', 'details': str(e)}), 500
+
+    return jsonify({'received': True})
+
+@background_job('stripe.process_event', max_attempts=8)
+def process_stripe_event(event_id):
+    """Apply a stored event once; later runs for the same event do nothing."""
+    stored = db.session.get(StripeEvent, event_id)
+    if stored is None or stored.status in ('processed', 'ignored'):
+        return
+    
+    handler = _stripe_event_handlers.get(stored.type)
+    try:
+        if handler is not None:
+            stripe_event = json.loads(stored.payload)
+            handler(stripe_event['data']['object'], datetime.utcfromtimestamp(stripe_event['created']))
+    except Exception as e:
+        db.session.rollback()
+        stored = db.session.get(StripeEvent, event_id)
+        stored.attempts += 1
+        stored.status = 'failed'
+        stored.last_error = str(e) or e.__class__.__name__
+        db.session.commit()
+        raise
+    
+    stored.attempts += 1
+    stored.status = 'processed' if handler is not None else 'ignored'
+    stored.last_error = None
+    stored.processed_at = datetime.utcnow()
+
+@stripe_event_handler('checkout.session.completed')
+def handle_checkout_session_completed(checkout_session, created_at):
+    if checkout_session.get('mode') != 'subscription' or not checkout_session.get('client_reference_id'):
+        return
+    if Subscription.query.filter_by(stripe_checkout_session_id=checkout_session['id']).first():
+        return
+    record_checkout_session(checkout_session).stripe_event_created_at = created_at
+
+def _subscription_for_event(stripe_subscription_id, created_at, clock='stripe_event_created_at'):
+    """
+    The subscription an event applies to, or None when an event of the
+    same kind created after this one was already applied to it.
+
+    ``clock`` is the column holding the creation time of the last event of
+    that kind. Subscription and invoice events change different fields, so
+    each kind has its own clock and never drops the other.
+    """
+    subscription = Subscription.query.filter_by(stripe_subscription_id=stripe_subscription_id).first()
+    if subscription is None:
+        # Events can arrive before checkout.session.completed; the job retries
+        raise LookupError(f"No subscription for {stripe_subscription_id} yet")
+    last_applied = getattr(subscription, clock)
+    if last_applied and created_at < last_applied:
+        app.logger.info(f"Skipping Stripe event for {stripe_subscription_id} older than the last one applied")
+        return None
+    setattr(subscription, clock, created_at)
+    return subscription
+
+@stripe_event_handler('customer.subscription.updated')
+@stripe_event_handler('customer.subscription.deleted')
+def handle_subscription_changed(stripe_subscription, created_at):
+    subscription = _subscription_for_event(stripe_subscription['id'], created_at)
+    if subscription is None:
+        return
+    status = stripe_subscription['status']
+    subscription.status = 'cancelled' if status in ('canceled', 'incomplete_expired') else status
+    if stripe_subscription.get('ended_at'):
+        subscription.end_date = datetime.utcfromtimestamp(stripe_subscription['ended_at'])
+        ServerInstance.query.filter_by(subscription_id=subscription.id).update({'status': 'suspended'})
+
+@stripe_event_handler('invoice.paid')
+def handle_invoice_paid(invoice, created_at):
+    subscription = invoice.get('subscription') and _subscription_for_event(
+        invoice['subscription'], created_at, clock='stripe_invoice_event_created_at'
+    )
+    if subscription:
+        subscription.payment_status = 'paid'
+
+@stripe_event_handler('invoice.payment_failed')
+def handle_invoice_payment_failed(invoice, created_at):
+    subscription = invoice.get('subscription') and _subscription_for_event(
+        invoice['subscription'], created_at, clock='stripe_invoice_event_created_at'
+    )
+    if subscription:
+        subscription.payment_status = 'overdue'
+
+@stripe_event_handler('payment_method.attached')
+def handle_payment_method_attached(payment_method, created_at):
+    card = payment_method.get('card')
+    user = User.query.filter_by(stripe_customer_id=payment_method.get('customer')).first()
+    if card is None or user is None:
+        return
+    if PaymentMethod.query.filter_by(stripe_payment_method_id=payment_method['id']).first():
+        return
+    has_default = PaymentMethod.query.filter_by(user_id=user.id, is_default=True).first() is not None
+    db.session.add(PaymentMethod(
+        user_id=user.id,
+        stripe_payment_method_id=payment_method['id'],
+        card_type=card['brand'],
+        last4=card['last4'],
+        expiry_month=card['exp_month'],
+        expiry_year=card['exp_year'],
+        is_default=not has_default
+    ))
+    if not has_default:
+        user.default_payment_method_id = payment_method['id']
+
+@stripe_event_handler('payment_method.detached')
+def handle_payment_method_detached(payment_method, created_at):
+    PaymentMethod.query.filter_by(stripe_payment_method_id=payment_method['id']).delete()
+
+def prune_stripe_events():
+    """Delete applied events older than STRIPE_EVENT_RETENTION."""
+    StripeEvent.query.filter(
+        StripeEvent.status.in_(('processed', 'ignored')),
+        StripeEvent.received_at < datetime.utcnow() - STRIPE_EVENT_RETENTION
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+register_recurring_job('stripe-event-pruner', 60 * 60, prune_stripe_events)
+
+def replay_stripe_events(events):
+    """Queue stored events to be applied again. The caller commits."""
+    for stored in events:
+        stored.status = 'received'
+        stored.last_error = None
+        enqueue_job('stripe.process_event', {'event_id': stored.id})
+    return len(events)
+
+stripe_cli = AppGroup('stripe', help='Inspect and replay Stripe webhook events.')
+
+@stripe_cli.command('replay')
+@click.argument('event_ids', nargs=-1)
+@click.option('--failed', is_flag=True, help='Replay all events whose last attempt failed.')
+@click.option('--type', 'event_type', help='Replay stored events of this type.')
+@click.option('--since', type=int, help='Only events received in the last N hours.')
+def stripe_replay_command(event_ids, failed, event_type, since):
+    """
+    Apply stored events again, oldest first. Subscription and invoice events
+    older than the last one of their kind applied to their subscription are
+    skipped.
+    """
+    query = StripeEvent.query
+    if event_ids:
+        query = query.filter(StripeEvent.id.in_(event_ids))
+    elif failed:
+        query = query.filter(StripeEvent.status == 'failed')
+    elif not event_type:
+        raise click.UsageError('Give event IDs, --failed or --type')
+    if event_type:
+        query = query.filter(StripeEvent.type == event_type)
+    if since:
+        query = query.filter(StripeEvent.received_at >= datetime.utcnow() - timedelta(hours=since))
+    count = replay_stripe_events(query.order_by(StripeEvent.created_at, StripeEvent.received_at).all())
+    db.session.commit()
+    click.echo(f"Queued {count} event(s) for processing")
+
+@stripe_cli.command('fetch')
+@click.option('--since', type=int, default=24, show_default=True, help='Fetch events created in the last N hours.')
+def stripe_fetch_command(since):
+    """Store events the webhook missed, e.g. while the app was down."""
+    events = stripe_gateway.call(
+        'event.list', stripe.Event.list,
+        created={'gte': int(time.time()) - since * 60 * 60},
+        limit=100
+    )
+    stored = 0
+    for stripe_event in events.auto_paging_iter():
+        # str() of a Stripe object is its JSON
+        stored += store_stripe_event(
+            stripe_event.id, stripe_event.type, str(stripe_event), datetime.utcfromtimestamp(stripe_event.created)
+        )
+    db.session.commit()
+    click.echo(f"Stored {stored} new event(s)")
+
+@stripe_cli.command('status')
+def stripe_status_command():
+    """Show the number of stored events per status."""
+    rows = db.session.query(StripeEvent.status, func.count(StripeEvent.id)).group_by(StripeEvent.status).all()
+    if not rows:
+        click.echo('No stored events')
+    for status, count in sorted(rows):
+        click.echo(f"{status}: {count}")
+    for stored in StripeEvent.query.filter_by(status='failed').order_by(StripeEvent.received_at).limit(20):
+        click.echo(f"  {stored.id} {stored.type} ({stored.attempts} attempts): {stored.last_error}")
+
+app.cli.add_command(stripe_cli)
+
+@app.route('/register', methods=['GET', 'POST'])
+def register():
     """
     User registration route
     Handles both GET (display form) and POST (process registration) requests
@@ -978,23 +2285,16 @@ def register():
             # Set password securely
             new_user.set_password(form.password.data)
             
-            # Save user to database
+            # Save user to database; the Stripe customer is created by a job
             db.session.add(new_user)
+            db.session.flush()
+            enqueue_job(
+                'stripe.ensure_customer',
+                {'user_id': new_user.id},
+                idempotency_key=f"stripe-customer:{new_user.id}"
+            )
             db.session.commit()
 
-            # Create Stripe customer for the new user
-            try:
-                stripe_customer = stripe.Customer.create(
-                    email=new_user.email,
-                    name=new_user.name
-                )
-                new_user.stripe_customer_id = stripe_customer.id
-                db.session.commit()
-            except stripe.error.StripeError as stripe_error:
-                app.logger.error(f"Stripe customer creation error: {str(stripe_error)}")
-                # Optionally, you might want to handle this differently
-                # For now, we'll continue without a Stripe customer
-
             # Log the user in
             login_user(new_user)
 
@@ -1089,22 +2389,25 @@ def dashboard():
     try:
         # Cloud Storage Usage
         total_storage = 100  # GB
-        used_storage = db.session.query(func.sum(UserCloudStorage.file_size)).filter_by(user_id=current_user.id).scalar() or 0
+        quota = get_storage_quota(current_user.id, commit=True)
+        used_storage = quota.used_bytes
         storage_usage_percent = round((used_storage / (total_storage * 1024 * 1024 * 1024)) * 100, 2)
         
         # Monthly Spending
         monthly_spending = db.session.query(func.sum(Payment.amount)).filter_by(user_id=current_user.id).scalar() or 0
         
         # Active Files
-        active_files = UserCloudStorage.query.filter_by(user_id=current_user.id).count()
+        active_files = quota.file_count
         
         # Recent Cloud Files
         recent_cloud_files = UserCloudStorage.query.filter_by(user_id=current_user.id).order_by(UserCloudStorage.uploaded_at.desc()).limit(5).all()
         
         # Planner Boards
+        # Union of two indexed lookups; an OR across both would scan every board
+        owned_board_ids = db.session.query(PlannerBoard.id).filter(PlannerBoard.owner_id == current_user.id)
+        member_board_ids = db.session.query(BoardMember.board_id).filter(BoardMember.user_id == current_user.id)
         boards = PlannerBoard.query.filter(
-            (PlannerBoard.owner_id == current_user.id) | 
-            (PlannerBoard.board_members.any(user_id=current_user.id))
+            PlannerBoard.id.in_(owned_board_ids.union(member_board_ids))
         ).limit(5).all()
         
         return render_template('dashboard.html', 
@@ -1119,6 +2422,38 @@ def dashboard():
         flash('An error occurred while loading your dashboard.', 'error')
         return redirect(url_for('index'))
 
+@app.route('/avatar/<int:user_id>/<int:size>.png')
+@login_required
+def user_avatar(user_id, size):
+    """
+    Serve a user's generated avatar as a PNG.
+
+    The URL carries a content version (?v=...), so responses can be cached
+    for a long time; renames produce a new URL.
+    """
+    if size < AVATAR_MIN_SIZE or size > AVATAR_MAX_SIZE:
+        abort(404)
+
+    user = db.session.get(User, user_id)
+    if not user:
+        abort(404)
+
+    initials, color_index = get_avatar_params(user.name)
+    etag = avatar_etag(initials, color_index, size)
+
+    # Answer revalidations without touching the cache
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        _, png = avatar_cache.get(initials, color_index, size)
+        response = app.response_class(png, mimetype='image/png')
+
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = 365 * 24 * 60 * 60
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/checkout/<plan>')
 @login_required
 def checkout(plan):
@@ -1132,7 +2467,8 @@ def checkout(plan):
 
         # Create a PaymentIntent
         try:
-            intent = stripe.PaymentIntent.create(
+            intent = stripe_gateway.call(
+                'payment_intent.create', stripe.PaymentIntent.create,
                 amount=int(plan_details['monthly_price'] * 100),  # amount in cents
                 currency='usd',
                 payment_method_types=['card'],
@@ -1184,6 +2520,18 @@ def create_checkout_session():
                 'details': f'Plan {plan} does not exist'
             }), 400
 
+        # Resolve the Stripe price on demand if the catalog has no entry yet
+        if not plan_details.get('price_resolved'):
+            try:
+                plan_details = resolve_stripe_plan(plan)
+            except stripe.error.StripeError as catalog_error:
+                db.session.rollback()
+                app.logger.error(f"Stripe plan resolution error: {str(catalog_error)}")
+                return jsonify({
+                    'error': 'Plan configuration error',
+                    'details': 'Unable to find pricing for selected plan'
+                }), 500
+
         # Validate price ID
         price_id = plan_details.get('price_id')
         if not price_id:
@@ -1193,12 +2541,12 @@ def create_checkout_session():
                 'details': 'Unable to find pricing for selected plan'
             }), 500
 
-        # Create Stripe customer if not exists
+        # Reuse the stored Stripe customer; it is only created here when the
+        # registration job has not run yet
         try:
-            customer = stripe.Customer.create(
-                email=current_user.email,
-                name=current_user.name
-            )
+            if not current_user.stripe_customer_id:
+                stripe_gateway.ensure_customer(current_user)
+                db.session.commit()
         except stripe.error.StripeError as customer_error:
             app.logger.error(f"Stripe customer creation error: {str(customer_error)}")
             return jsonify({
@@ -1208,15 +2556,18 @@ def create_checkout_session():
 
         # Create a Stripe checkout session with comprehensive options
         try:
-            checkout_session = stripe.checkout.Session.create(
+            checkout_session = stripe_gateway.call(
+                'checkout.session.create', stripe.checkout.Session.create,
                 payment_method_types=['card'],
                 mode='subscription',
                 client_reference_id=str(current_user.id),
-                customer=customer.id,
+                customer=current_user.stripe_customer_id,
                 line_items=[{
                     'price': price_id,
                     'quantity': 1,
                 }],
+                # Read back from the checkout.session.completed event
+                metadata={'plan': plan},
                 subscription_data={
                     'metadata': {
                         'user_id': str(current_user.id),
@@ -1364,27 +2715,17 @@ def set_payment_method_default():
         if not payment_method:
             return jsonify({'success': False, 'message': 'Payment method not found'}), 404
         
-        # Update Stripe customer's default payment method
-        stripe.Customer.modify(
-            current_user.stripe_customer_id,
-            invoice_settings={'default_payment_method': payment_method.stripe_payment_method_id}
-        )
-        
         # Reset all other payment methods to non-default
         PaymentMethod.query.filter_by(user_id=current_user.id).update({'is_default': False})
         
-        # Set this method as default
+        # Set this method as default; a job updates the Stripe customer
         payment_method.is_default = True
         current_user.default_payment_method_id = payment_method.stripe_payment_method_id
+        enqueue_job('stripe.sync_default_payment_method', {'user_id': current_user.id})
         db.session.commit()
         
         return jsonify({'success': True})
     
-    except stripe.error.StripeError as e:
-        db.session.rollback()
-        app.logger.error(f"Stripe error setting default payment method: {str(e)}")
-        return jsonify({'success': False, 'message': str(e)}), 500
-    
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Error setting default payment method: {str(e)}")
@@ -1418,8 +2759,12 @@ def remove_payment_method():
                 'message': 'You must have at least one payment method'
             }), 400
         
-        # Remove from Stripe
-        stripe.PaymentMethod.detach(payment_method.stripe_payment_method_id)
+        # Stripe is updated by jobs once the local change is committed
+        if payment_method.stripe_payment_method_id:
+            enqueue_job(
+                'stripe.detach_payment_method',
+                {'stripe_payment_method_id': payment_method.stripe_payment_method_id}
+            )
         
         # If this was the default method, set another method as default
         if payment_method.is_default:
@@ -1430,10 +2775,8 @@ def remove_payment_method():
             
             if alternative_method:
                 alternative_method.is_default = True
-                stripe.Customer.modify(
-                    current_user.stripe_customer_id,
-                    invoice_settings={'default_payment_method': alternative_method.stripe_payment_method_id}
-                )
+                current_user.default_payment_method_id = alternative_method.stripe_payment_method_id
+                enqueue_job('stripe.sync_default_payment_method', {'user_id': current_user.id})
         
         # Delete the payment method
         db.session.delete(payment_method)
@@ -1441,11 +2784,6 @@ def remove_payment_method():
         
         return jsonify({'success': True})
     
-    except stripe.error.StripeError as e:
-        db.session.rollback()
-        app.logger.error(f"Stripe error deleting payment method: {str(e)}")
-        return jsonify({'success': False, 'message': str(e)}), 500
-    
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Error deleting payment method: {str(e)}")
@@ -1477,7 +2815,10 @@ def contact():
 @login_required
 def subscription_success():
     """
-    Subscription success page after successful payment
+    Subscription success page after successful payment. Reads local state
+    only: the purchase is recorded when the checkout.session.completed
+    webhook is processed, until then the page shows a pending state and
+    refreshes itself.
     """
     try:
         # Get session ID from Stripe
@@ -1486,109 +2827,23 @@ def subscription_success():
             flash('Invalid checkout session', 'danger')
             return redirect(url_for('dashboard'))
 
-        # Retrieve the Checkout Session
-        try:
-            checkout_session = stripe.checkout.Session.retrieve(session_id)
-        except stripe.error.StripeError as e:
-            app.logger.error(f"Stripe session retrieval error: {str(e)}")
-            flash('Unable to verify payment', 'danger')
-            return redirect(url_for('dashboard'))
-
-        # Validate the session belongs to the current user
-        if str(current_user.id) != checkout_session.client_reference_id:
-            flash('Unauthorized access', 'danger')
-            return redirect(url_for('dashboard'))
-
-        # Extract plan details from session metadata
-        plan_key = checkout_session.metadata.get('plan', 'starter')
-        
-        # Define plan details
-        plans = {
-            'starter': {
-                'name': 'Starter',
-                'price': 9.99,
-                'features': [
-                    '1 CPU Core',
-                    '2GB RAM',
-                    '50GB Storage',
-                    'Basic Support'
-                ]
-            }
-            # Add more plans as needed
-        }
-
-        # Validate plan
-        plan = plans.get(plan_key, plans['starter'])
-
-        # Retrieve the subscription from Stripe
-        try:
-            stripe_subscription = stripe.Subscription.retrieve(
-                checkout_session.subscription
-            )
-        except stripe.error.StripeError as e:
-            app.logger.error(f"Stripe subscription retrieval error: {str(e)}")
-            flash('Unable to retrieve subscription details', 'danger')
-            return redirect(url_for('dashboard'))
-
-        # Create or update local subscription
-        subscription = Subscription(
-            user_id=current_user.id,
-            plan_name=plan_key,
-            start_date=datetime.utcfromtimestamp(stripe_subscription.start_date),
-            status='active',
-            payment_status='paid',
-            amount_paid=plan['price']
-        )
-        db.session.add(subscription)
-        db.session.flush()  # Get the ID before committing
+        subscription = Subscription.query.filter_by(
+            stripe_checkout_session_id=session_id,
+            user_id=current_user.id
+        ).first()
 
-        # Create server instance
-        server_instance = ServerInstance(
-            user_id=current_user.id,
-            subscription_id=subscription.id,
-            server_name=f"{current_user.name}'s {plan['name']} Server",
-            server_type=plan_key.lower(),
-            status='active'
-        )
-        db.session.add(server_instance)
+        if subscription is None:
+            return render_template('subscription_success.html', pending=True)
 
-        # Save payment method if available
-        if checkout_session.payment_method:
-            try:
-                payment_method = stripe.PaymentMethod.retrieve(
-                    checkout_session.payment_method
-                )
-                
-                # Check if payment method already exists
-                existing_method = PaymentMethod.query.filter_by(
-                    stripe_payment_method_id=payment_method.id
-                ).first()
-
-                if not existing_method:
-                    new_payment_method = PaymentMethod(
-                        user_id=current_user.id,
-                        stripe_payment_method_id=payment_method.id,
-                        last4=payment_method.card.last4,
-                        brand=payment_method.card.brand,
-                        exp_month=payment_method.card.exp_month,
-                        exp_year=payment_method.card.exp_year,
-                        is_default=True
-                    )
-                    db.session.add(new_payment_method)
-
-                    # Update user's default payment method
-                    current_user.default_payment_method_id = new_payment_method.stripe_payment_method_id
-            except stripe.error.StripeError as e:
-                app.logger.error(f"Error retrieving payment method: {str(e)}")
-
-        # Commit all changes
-        db.session.commit()
+        plan = STRIPE_PLANS.get(subscription.plan_name, STRIPE_PLANS['starter'])
+        server_instance = ServerInstance.query.filter_by(subscription_id=subscription.id).first()
 
         return render_template(
             'subscription_success.html', 
             plan=plan,
             subscription=subscription,
-            server_instance=server_instance
+            server_instance=server_instance,
+            pending=False
         )
     
     except Exception as e:
@@ -1599,6 +2854,8 @@ def subscription_success():
 
 @app.errorhandler(404)
 def page_not_found(e):
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Not found'}), 404
     return render_template('error.html', error='Page not found'), 404
 
 @app.errorhandler(413)
@@ -1662,136 +2919,1160 @@ def get_user_storage_path(user_id):
         app.logger.error(f"Comprehensive error creating user storage directory: {e}")
         raise
 
-@app.route('/cloud/upload', methods=['POST'])
-@login_required
-def upload_file():
-    # Comprehensive logging
-    app.logger.info(f"Upload request from user {current_user.id}")
-    app.logger.info(f"Request method: {request.method}")
-    app.logger.info(f"Request content type: {request.content_type}")
-    
-    # Check if files are present
-    if 'file' not in request.files:
-        app.logger.warning(f"No file in upload request by user {current_user.id}")
-        return jsonify({
-            'error': 'Keine Datei ausgewählt', 
-            'details': 'No file found in the request'
-        }), 400
-    
-    file = request.files['file']
-    
-    # Validate file
-    if not file or file.filename == '':
-        app.logger.warning(f"Empty filename for upload by user {current_user.id}")
-        return jsonify({
-            'error': 'Keine Datei ausgewählt', 
-            'details': 'Empty filename or no file selected'
-        }), 400
-    
-    # File size validation
-    MAX_FILE_SIZE = 5 * 1024 * 1024 * 1024  # 5 GB
-    file.seek(0, os.SEEK_END)
-    file_size = file.tell()
-    file.seek(0)
-    
-    app.logger.info(f"File details: name={file.filename}, size={file_size} bytes")
-    
-    if file_size > MAX_FILE_SIZE:
-        app.logger.warning(f"File too large: {file_size} bytes by user {current_user.id}")
-        return jsonify({
-            'error': f'Datei zu groß. Maximale Dateigröße: 5 GB (Ihre Datei: {file_size / (1024 * 1024):.2f} MB)'
-        }), 400
+# Per-user storage usage
+# user_storage_quota holds used bytes and file count per user. Every change
+# to UserCloudStorage rows adjusts it in the same transaction, so quota checks
+# are a primary-key read; reconcile_storage_quotas() corrects drift.
+USER_STORAGE_QUOTA_BYTES = 5 * 1024 * 1024 * 1024  # 5 GB
+STORAGE_RECONCILE_INTERVAL = int(os.environ.get('STORAGE_RECONCILE_INTERVAL', 6 * 60 * 60))  # seconds
 
-    # Storage limit check
-    total_storage = db.session.query(func.sum(UserCloudStorage.file_size)).filter_by(user_id=current_user.id).scalar() or 0
-    
-    if total_storage + file_size > MAX_FILE_SIZE:
-        app.logger.warning(f"Storage limit exceeded for user {current_user.id}")
-        return jsonify({
-            'error': 'Speicherlimit überschritten. Bitte löschen Sie einige Dateien.'
-        }), 400
-    
-    # Prepare file storage
-    unique_filename = secure_filename(file.filename)
-    user_storage_path = get_user_storage_path(current_user.id)
-    file_path = os.path.join(user_storage_path, unique_filename)
-    
+def get_storage_quota(user_id, commit=False):
+    """
+    Return the usage counter for a user, creating it from the stored rows once.
+
+    Args:
+        user_id (int): The ID of the user.
+        commit (bool): Commit a newly created row right away. Only for
+            read-only requests; writers commit it with their own changes.
+
+    Returns:
+        UserStorageQuota: The counter row.
+    """
+    quota = db.session.get(UserStorageQuota, user_id)
+    if quota is None:
+        # Pending rows of the current request are counted by their own delta
+        with db.session.no_autoflush:
+            used_bytes, file_count = db.session.query(
+                func.coalesce(func.sum(UserCloudStorage.file_size), 0),
+                func.count(UserCloudStorage.id)
+            ).filter(UserCloudStorage.user_id == user_id).one()
+            # A concurrent request may create the row first; keep its row
+            db.session.execute(
+                dialect_insert(UserStorageQuota).values(
+                    user_id=user_id, used_bytes=used_bytes, file_count=file_count,
+                    updated_at=datetime.utcnow()
+                ).on_conflict_do_nothing(index_elements=['user_id'])
+            )
+            quota = db.session.get(UserStorageQuota, user_id)
+        if commit:
+            db.session.commit()
+    return quota
+
+def adjust_storage_quota(user_id, bytes_delta, files_delta=0):
+    """
+    Apply a usage delta in the current transaction. The caller commits.
+
+    Call this before adding the matching UserCloudStorage row to the session.
+
+    Args:
+        user_id (int): The ID of the user.
+        bytes_delta (int): Change in used bytes.
+        files_delta (int): Change in file count.
+    """
+    get_storage_quota(user_id)
+
+    # Relative UPDATE so concurrent requests cannot overwrite each other
+    db.session.query(UserStorageQuota).filter(UserStorageQuota.user_id == user_id).update({
+        UserStorageQuota.used_bytes: UserStorageQuota.used_bytes + bytes_delta,
+        UserStorageQuota.file_count: UserStorageQuota.file_count + files_delta,
+        UserStorageQuota.updated_at: datetime.utcnow()
+    }, synchronize_session='fetch')
+
+def reconcile_storage_quotas(user_ids=None):
+    """
+    Recompute usage counters from the stored files.
+
+    File sizes that no longer match the file on disk are corrected first;
+    missing files are logged and keep their recorded size.
+
+    Args:
+        user_ids (list): Limit reconciliation to these users (default: all).
+
+    Returns:
+        int: Number of counters that had drifted.
+    """
+    if user_ids is None:
+        user_ids = {uid for (uid,) in db.session.query(UserCloudStorage.user_id).distinct()}
+        user_ids |= {uid for (uid,) in db.session.query(UserStorageQuota.user_id)}
+
+    drifted = 0
+    for user_id in user_ids:
+        used_bytes = 0
+        file_count = 0
+        for cloud_file in UserCloudStorage.query.filter_by(user_id=user_id):
+            try:
+                disk_size = os.path.getsize(cloud_file.stored_path)
+            except OSError:
+                app.logger.warning(f"Stored file missing on disk: {cloud_file.stored_path} (id={cloud_file.id})")
+                disk_size = cloud_file.file_size
+            if disk_size != cloud_file.file_size:
+                app.logger.info(f"Correcting size of file {cloud_file.id}: {cloud_file.file_size} -> {disk_size}")
+                cloud_file.file_size = disk_size
+            used_bytes += cloud_file.file_size
+            file_count += 1
+
+        quota = get_storage_quota(user_id)
+        if quota.used_bytes != used_bytes or quota.file_count != file_count:
+            app.logger.info(
+                f"Storage usage drift for user {user_id}: "
+                f"{quota.used_bytes}B/{quota.file_count} -> {used_bytes}B/{file_count}"
+            )
+            drifted += 1
+        quota.used_bytes = used_bytes
+        quota.file_count = file_count
+        quota.reconciled_at = datetime.utcnow()
+        db.session.commit()
+
+    return drifted
+
+register_recurring_job('storage-reconciler', STORAGE_RECONCILE_INTERVAL, reconcile_storage_quotas, timeout=60 * 60)
+
+storage_cli = AppGroup('storage', help='Manage per-user cloud storage usage.')
+
+@storage_cli.command('reconcile')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Only reconcile these users.')
+def reconcile_storage_command(user_ids):
+    """Recompute storage usage counters from the files on disk."""
+    drifted = reconcile_storage_quotas(list(user_ids) or None)
+    click.echo(f"Reconciled storage usage, {drifted} counter(s) corrected")
+
+# Content-addressed blob store
+# File content is stored once under blobs/<aa>/<bb>/<sha256>, no matter how
+# many UserCloudStorage rows (uploads, accepted shares, code files) point at
+# it. storage_blobs counts the references; blobs whose count stayed at zero
+# for the grace period are deleted by the garbage collector.
+BLOB_STORE_DIR = os.path.join(USER_STORAGE_BASE_DIR, 'blobs')
+BLOB_GC_GRACE = timedelta(hours=1)
+BLOB_GC_INTERVAL = 60 * 60  # seconds
+
+def blob_path(sha256):
+    """Path of the blob with the given SHA-256 hex digest."""
+    return os.path.join(BLOB_STORE_DIR, sha256[:2], sha256[2:4], sha256)
+
+def acquire_blob(sha256, size):
+    """
+    Take a reference on a blob, creating its row if needed. The caller commits.
+
+    Args:
+        sha256 (str): Hex digest of the content
+        size (int): Content size in bytes
+    """
+    updated = db.session.query(StorageBlob).filter(StorageBlob.sha256 == sha256).update(
+        {StorageBlob.ref_count: StorageBlob.ref_count + 1}, synchronize_session=False
+    )
+    if updated:
+        return
     try:
-        # Save file
-        os.makedirs(user_storage_path, exist_ok=True)
-        file.save(file_path)
-        
-        # Create database record
-        cloud_file = UserCloudStorage(
-            user_id=current_user.id,
-            file_name=file.filename,
-            file_path=file_path,
-            file_size=file_size,
-            file_type=file.content_type or 'application/octet-stream'
+        with db.session.begin_nested():
+            db.session.add(StorageBlob(sha256=sha256, size=size, ref_count=1))
+    except IntegrityError:
+        # Created by a concurrent request in the meantime
+        db.session.query(StorageBlob).filter(StorageBlob.sha256 == sha256).update(
+            {StorageBlob.ref_count: StorageBlob.ref_count + 1}, synchronize_session=False
         )
-        
-        db.session.add(cloud_file)
+
+def release_blob(sha256):
+    """Drop one reference on a blob. The caller commits."""
+    db.session.query(StorageBlob).filter(StorageBlob.sha256 == sha256).update({
+        StorageBlob.ref_count: StorageBlob.ref_count - 1,
+        StorageBlob.released_at: datetime.utcnow()
+    }, synchronize_session=False)
+
+def store_blob_file(temp_path, sha256):
+    """
+    Move a finished temporary file into the blob store, or drop it if the
+    blob already exists. Call after acquire_blob so the garbage collector
+    cannot remove the blob concurrently.
+    """
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        os.remove(temp_path)
+        return
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    os.replace(temp_path, path)
+    # Fresh mtime keeps the orphan sweep away until the row is committed
+    os.utime(path)
+
+def add_cloud_file(user_id, file_name, file_type, temp_path, size, sha256):
+    """
+    Create a UserCloudStorage row for a finished temporary file, moving its
+    content into the blob store. The caller commits.
+
+    Args:
+        user_id (int): Owner of the new file
+        file_name (str): Name shown to the user
+        file_type (str): Content type
+        temp_path (str): Fully written and flushed temporary file
+        size (int): Size in bytes
+        sha256 (str): Hex digest of the content
+
+    Returns:
+        UserCloudStorage: The pending row
+    """
+    acquire_blob(sha256, size)
+    adjust_storage_quota(user_id, size, 1)
+    cloud_file = UserCloudStorage(
+        user_id=user_id,
+        file_name=file_name,
+        file_size=size,
+        file_type=file_type,
+        sha256=sha256
+    )
+    db.session.add(cloud_file)
+    db.session.flush()
+    store_blob_file(temp_path, sha256)
+    return cloud_file
+
+def add_cloud_file_reference(user_id, source_file, file_name):
+    """
+    Create a UserCloudStorage row sharing ``source_file``'s content. The
+    caller commits.
+    """
+    if source_file.sha256:
+        acquire_blob(source_file.sha256, source_file.file_size)
+    adjust_storage_quota(user_id, source_file.file_size, 1)
+    cloud_file = UserCloudStorage(
+        user_id=user_id,
+        file_name=file_name,
+        file_path=source_file.file_path,
+        file_size=source_file.file_size,
+        file_type=source_file.file_type,
+        sha256=source_file.sha256
+    )
+    db.session.add(cloud_file)
+    return cloud_file
+
+def remove_cloud_file(cloud_file, replacement=None):
+    """
+    Delete a UserCloudStorage row and release its content. The caller
+    commits. Every row with a ``sha256`` holds a blob reference; legacy
+    files are removed once no other row points at them.
+
+    Args:
+        cloud_file (UserCloudStorage): Row to delete
+        replacement (UserCloudStorage): New version of the file; the shares
+            of the deleted row move to it instead of being deleted
+
+    Returns:
+        str: Legacy file to delete after the commit, or None
+    """
+    adjust_storage_quota(cloud_file.user_id, -cloud_file.file_size, -1)
+    shares = SharedFile.query.filter_by(original_file_id=cloud_file.id)
+    if replacement is not None:
+        shares.update({'original_file_id': replacement.id}, synchronize_session=False)
+    else:
+        shares.delete(synchronize_session=False)
+    
+    legacy_path = None
+    if cloud_file.file_path:
+        other_refs = UserCloudStorage.query.filter(
+            UserCloudStorage.file_path == cloud_file.file_path,
+            UserCloudStorage.id != cloud_file.id
+        ).count()
+        if not other_refs:
+            legacy_path = cloud_file.file_path
+    if cloud_file.sha256:
+        release_blob(cloud_file.sha256)
+    
+    db.session.delete(cloud_file)
+    return legacy_path
+
+def hash_file(path):
+    """Return (sha256 hex digest, size) of a file."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(data)
+            size += len(data)
+    return digest.hexdigest(), size
+
+def collect_garbage_blobs(grace=BLOB_GC_GRACE, sweep_orphans=False):
+    """
+    Delete blobs without references.
+
+    Each row is deleted only if its count is still zero, and its file is
+    unlinked before that delete commits. An upload taking a new reference
+    waits for the commit and then writes the file again.
+
+    Args:
+        grace (timedelta): Minimum time since the last reference was dropped
+        sweep_orphans (bool): Also delete blob files that have no row at all,
+            e.g. left behind by a failed request
+
+    Returns:
+        int: Number of blobs deleted
+    """
+    cutoff = datetime.utcnow() - grace
+    candidates = [sha256 for (sha256,) in db.session.query(StorageBlob.sha256).filter(
+        StorageBlob.ref_count <= 0,
+        db.or_(StorageBlob.released_at == None, StorageBlob.released_at < cutoff)
+    )]
+    
+    removed = 0
+    for sha256 in candidates:
+        deleted = db.session.query(StorageBlob).filter(
+            StorageBlob.sha256 == sha256,
+            StorageBlob.ref_count <= 0
+        ).delete(synchronize_session=False)
+        if deleted:
+            path = blob_path(sha256)
+            if os.path.exists(path):
+                os.remove(path)
+            removed += 1
         db.session.commit()
-        
-        app.logger.info(f"File uploaded successfully by user {current_user.id}")
-        
-        return jsonify({
-            'id': cloud_file.id,
-            'filename': unique_filename,
-            'message': 'Datei erfolgreich hochgeladen'
-        }), 200
     
-    except Exception as e:
-        # Cleanup and error handling
-        db.session.rollback()
-        
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        app.logger.error(f"File upload error: {str(e)}", exc_info=True)
-        
-        return jsonify({
-            'error': 'Fehler beim Datei-Upload. Bitte versuchen Sie es erneut.',
-            'details': str(e)
-        }), 500
+    if sweep_orphans and os.path.isdir(BLOB_STORE_DIR):
+        cutoff_timestamp = cutoff.replace(tzinfo=timezone.utc).timestamp()
+        for directory, _, names in os.walk(BLOB_STORE_DIR):
+            for name in names:
+                path = os.path.join(directory, name)
+                if os.path.getmtime(path) >= cutoff_timestamp:
+                    continue
+                if db.session.get(StorageBlob, name) is None:
+                    os.remove(path)
+                    removed += 1
+        db.session.commit()
+    
+    if removed:
+        app.logger.info(f"Blob garbage collection removed {removed} blob(s)")
+    return removed
 
-@app.route('/cloud/files', methods=['GET'])
-@login_required
-def list_cloud_files():
+def migrate_files_to_blob_store(dry_run=False):
     """
-    List cloud files for the current user.
-    
+    Move legacy per-user files (rows with a ``file_path``) into the blob
+    store, storing identical content once. Rows sharing one legacy path
+    (accepted shares) are converted together.
+
+    Args:
+        dry_run (bool): Only report what would be done
+
     Returns:
-        JSON list of cloud files with their details
+        dict: Counts of converted rows and files and bytes saved
     """
-    try:
-        # Retrieve cloud storage files
-        cloud_files = UserCloudStorage.query.filter_by(user_id=current_user.id).all()
+    stats = {'rows': 0, 'files': 0, 'missing': 0, 'bytes_saved': 0}
+    seen = set()
+    legacy_paths = [path for (path,) in db.session.query(UserCloudStorage.file_path).filter(
+        UserCloudStorage.file_path != None
+    ).distinct()]
+    
+    for legacy_path in legacy_paths:
+        if not os.path.isfile(legacy_path):
+            app.logger.warning(f"Legacy file missing on disk, skipped: {legacy_path}")
+            stats['missing'] += 1
+            continue
         
-        # Convert to list of dictionaries for JSON serialization
-        file_list = [
-            {
-                'id': file.id,  # Add this line to provide the file ID
-                'filename': file.file_name, 
-                'size': file.file_size, 
-                'type': file.file_type,
-                'uploaded_at': file.uploaded_at.isoformat() if file.uploaded_at else None,
-                'path': file.file_path
-            } for file in cloud_files
-        ]
+        sha256, size = hash_file(legacy_path)
+        rows = UserCloudStorage.query.filter_by(file_path=legacy_path).all()
+        blob_exists = sha256 in seen or os.path.exists(blob_path(sha256))
+        seen.add(sha256)
         
-        return jsonify(file_list)
-    except Exception as e:
-        app.logger.error(f"Error listing cloud files: {e}")
-        return jsonify({'error': 'Failed to retrieve cloud files'}), 500
+        stats['rows'] += len(rows)
+        stats['files'] += 1
+        if blob_exists:
+            stats['bytes_saved'] += size
+        
+        if dry_run:
+            continue
+        
+        for cloud_file in rows:
+            # Rows hashed before the blob store already hold their reference
+            if cloud_file.sha256 != sha256:
+                if cloud_file.sha256:
+                    release_blob(cloud_file.sha256)
+                acquire_blob(sha256, size)
+            cloud_file.sha256 = sha256
+            cloud_file.file_path = None
+        db.session.flush()
+        
+        if not blob_exists:
+            os.makedirs(os.path.dirname(blob_path(sha256)), mode=0o700, exist_ok=True)
+            try:
+                os.link(legacy_path, blob_path(sha256))
+            except OSError:
+                shutil.copy2(legacy_path, blob_path(sha256))
+            os.utime(blob_path(sha256))
+        db.session.commit()
+        
+        os.remove(legacy_path)
+    
+    return stats
 
-@app.route('/cloud')
-@login_required
-def cloud_storage():
-    return render_template('cloud_storage.html')
+# Uploads move their blob into the store before committing, so a failed
+# commit leaves a file without a row; the sweep's grace period covers
+# uploads still in flight
+register_recurring_job('blob-garbage-collector', BLOB_GC_INTERVAL,
+                       functools.partial(collect_garbage_blobs, sweep_orphans=True), timeout=60 * 60)
 
-@app.route('/dashboard/add_payment_method', methods=['POST'])
-@login_required
+@storage_cli.command('dedupe')
+@click.option('--dry-run', is_flag=True, help='Report what would be moved without changing anything.')
+def dedupe_storage_command(dry_run):
+    """Move legacy user_storage/<id>/ files into the deduplicating blob store."""
+    stats = migrate_files_to_blob_store(dry_run=dry_run)
+    click.echo(
+        f"{'Would convert' if dry_run else 'Converted'} {stats['rows']} row(s) from {stats['files']} file(s), "
+        f"{stats['bytes_saved']} bytes deduplicated, {stats['missing']} missing file(s)"
+    )
+
+@storage_cli.command('gc')
+@click.option('--orphans', is_flag=True, help='Also delete blob files that have no database row.')
+@click.option('--grace-minutes', type=int, default=int(BLOB_GC_GRACE.total_seconds() // 60), show_default=True,
+              help='Keep unreferenced blobs released more recently than this.')
+def gc_storage_command(orphans, grace_minutes):
+    """Delete blobs that are no longer referenced."""
+    removed = collect_garbage_blobs(timedelta(minutes=grace_minutes), sweep_orphans=orphans)
+    click.echo(f"Removed {removed} blob(s)")
+
+
+app.cli.add_command(storage_cli)
+
+# Streaming uploads
+# Uploads are read from request.stream in fixed-size chunks and written
+# straight into the user's directory under a temporary name, hashed in the
+# same pass and renamed into place once complete. Werkzeug's form parser is
+# never invoked, so the body is not spooled to a temp file first.
+MAX_FILE_SIZE = 5 * 1024 * 1024 * 1024  # 5 GB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+MULTIPART_OVERHEAD_ALLOWANCE = 64 * 1024  # Boundaries, part headers and small form fields
+
+class UploadRejected(Exception):
+    """Raised while receiving an upload that must not be stored."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+class StreamingUpload:
+    """
+    Destination for one uploaded file: a temporary file in the target
+    directory plus a running SHA-256, limited to ``max_bytes``.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.temp_path = os.path.join(directory, f".upload-{secrets.token_hex(8)}.part")
+        self._hash = hashlib.sha256()
+        self._file = open(self.temp_path, 'wb')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadRejected('Speicherlimit überschritten. Bitte löschen Sie einige Dateien.', 413)
+        self._hash.update(data)
+        self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def close(self):
+        """Flush the completed file to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def discard(self):
+        """Close and delete the temporary file."""
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+def iter_request_chunks(chunk_size=UPLOAD_CHUNK_SIZE):
+    """Yield the raw request body in chunks of at most ``chunk_size`` bytes."""
+    stream = request.stream
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def receive_streaming_upload(directory, max_bytes, field_name='file'):
+    """
+    Stream the uploaded file of the current request into ``directory``.
+
+    Accepts multipart/form-data (the file in ``field_name``) or a raw body
+    with the name in the ``filename`` query argument or X-File-Name header.
+
+    Args:
+        directory (str): Directory receiving the temporary file
+        max_bytes (int): Maximum accepted file size
+        field_name (str): Multipart field holding the file
+
+    Returns:
+        tuple: (filename, content_type, StreamingUpload)
+
+    Raises:
+        UploadRejected: If no file is present or the size limit is exceeded
+    """
+    if request.mimetype != 'multipart/form-data':
+        filename = request.args.get('filename') or request.headers.get('X-File-Name', '')
+        if not filename:
+            raise UploadRejected('Keine Datei ausgewählt')
+        upload = StreamingUpload(directory, max_bytes)
+        try:
+            for chunk in iter_request_chunks():
+                upload.write(chunk)
+        except Exception:
+            upload.discard()
+            raise
+        return filename, request.content_type or 'application/octet-stream', upload
+
+    boundary = request.mimetype_params.get('boundary', '').encode('latin-1')
+    if not boundary:
+        raise UploadRejected('Invalid multipart request')
+
+    # The decoder buffers at most one chunk plus an unterminated part header
+    decoder = MultipartDecoder(boundary, max_form_memory_size=UPLOAD_CHUNK_SIZE + MULTIPART_OVERHEAD_ALLOWANCE)
+    upload = None
+    filename = None
+    content_type = None
+    in_file_part = False
+
+    try:
+        chunks = iter_request_chunks()
+        while True:
+            event = decoder.next_event()
+            if event is NEED_DATA:
+                decoder.receive_data(next(chunks, None))
+            elif isinstance(event, MultipartFile):
+                in_file_part = event.name == field_name and upload is None and bool(event.filename)
+                if in_file_part:
+                    filename = event.filename
+                    content_type = event.headers.get('Content-Type', 'application/octet-stream')
+                    upload = StreamingUpload(directory, max_bytes)
+            elif isinstance(event, MultipartField):
+                in_file_part = False
+            elif isinstance(event, MultipartData):
+                if in_file_part:
+                    upload.write(event.data)
+            elif isinstance(event, Epilogue):
+                break
+    except RequestEntityTooLarge:
+        if upload:
+            upload.discard()
+        raise UploadRejected('Invalid multipart request')
+    except Exception:
+        if upload:
+            upload.discard()
+        raise
+
+    if upload is None:
+        raise UploadRejected('Keine Datei ausgewählt')
+    return filename, content_type, upload
+
+def validate_csrf_header():
+    """
+    CSRF check for views exempt from CSRFProtect because they must not
+    touch request.form. The token is taken from the X-CSRFToken header.
+    """
+    if not app.config.get('WTF_CSRF_ENABLED', True):
+        return True
+    try:
+        validate_csrf(request.headers.get('X-CSRFToken'))
+        return True
+    except CSRFValidationError:
+        return False
+
+@app.route('/cloud/upload', methods=['POST'])
+@login_required
+@csrf.exempt  # Validated from the header; CSRFProtect would parse the whole body
+def upload_file():
+    app.logger.info(f"Upload request from user {current_user.id}, content length {request.content_length}")
+    
+    if not validate_csrf_header():
+        return jsonify({'error': 'CSRF token missing or invalid'}), 400
+    
+    # Storage limit check before reading any of the body
+    quota = get_storage_quota(current_user.id)
+    remaining = max(0, USER_STORAGE_QUOTA_BYTES - quota.used_bytes)
+    max_bytes = min(MAX_FILE_SIZE, remaining)
+    
+    if request.content_length and request.content_length > max_bytes + MULTIPART_OVERHEAD_ALLOWANCE:
+        app.logger.warning(f"Upload of {request.content_length} bytes rejected for user {current_user.id}")
+        if request.content_length > MAX_FILE_SIZE + MULTIPART_OVERHEAD_ALLOWANCE:
+            return jsonify({
+                'error': f'Datei zu groß. Maximale Dateigröße: 5 GB (Ihre Datei: {request.content_length / (1024 * 1024):.2f} MB)'
+            }), 413
+        return jsonify({
+            'error': 'Speicherlimit überschritten. Bitte löschen Sie einige Dateien.'
+        }), 413
+    
+    user_storage_path = get_user_storage_path(current_user.id)
+    
+    try:
+        original_filename, content_type, upload = receive_streaming_upload(user_storage_path, max_bytes)
+    except UploadRejected as rejected:
+        app.logger.warning(f"Upload rejected for user {current_user.id}: {rejected.message}")
+        return jsonify({'error': rejected.message}), rejected.status_code
+    except Exception as e:
+        app.logger.error(f"File upload error: {str(e)}", exc_info=True)
+        return jsonify({
+            'error': 'Fehler beim Datei-Upload. Bitte versuchen Sie es erneut.',
+            'details': str(e)
+        }), 500
+    
+    app.logger.info(f"File details: name={original_filename}, size={upload.size} bytes")
+    
+    try:
+        upload.close()
+        
+        # Create database record; the content goes to the blob store
+        cloud_file = add_cloud_file(
+            current_user.id,
+            original_filename,
+            content_type or 'application/octet-stream',
+            upload.temp_path,
+            upload.size,
+            upload.sha256
+        )
+        db.session.commit()
+        
+        app.logger.info(f"File uploaded successfully by user {current_user.id}")
+        
+        return jsonify({
+            'id': cloud_file.id,
+            'filename': cloud_file.file_name,
+            'sha256': cloud_file.sha256,
+            'message': 'Datei erfolgreich hochgeladen'
+        }), 200
+    
+    except Exception as e:
+        # Cleanup and error handling
+        db.session.rollback()
+        upload.discard()
+        
+        app.logger.error(f"File upload error: {str(e)}", exc_info=True)
+        
+        return jsonify({
+            'error': 'Fehler beim Datei-Upload. Bitte versuchen Sie es erneut.',
+            'details': str(e)
+        }), 500
+
+# Resumable chunked uploads
+# The client opens a session, PUTs fixed-size chunks (in parallel and in any
+# order) at their byte offset and finalizes once every chunk is stored. Chunks
+# are written with os.pwrite into a preallocated temporary file, and received
+# chunks are recorded in the database so an interrupted upload can resume.
+RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+UPLOAD_SESSION_CLEANUP_INTERVAL = 60 * 60  # seconds
+
+def get_reserved_upload_bytes(user_id):
+    """Bytes claimed by the user's open upload sessions."""
+    return db.session.query(
+        func.coalesce(func.sum(UploadSession.total_size), 0)
+    ).filter(UploadSession.user_id == user_id).scalar()
+
+def get_user_upload_session(upload_id):
+    """Return the current user's upload session or None."""
+    return UploadSession.query.filter_by(id=upload_id, user_id=current_user.id).first()
+
+def upload_session_status(upload_session):
+    """JSON-ready progress of an upload session."""
+    received = sorted(index for (index,) in db.session.query(UploadSessionChunk.chunk_index).filter(
+        UploadSessionChunk.session_id == upload_session.id
+    ))
+    received_set = set(received)
+    return {
+        'upload_id': upload_session.id,
+        'file_name': upload_session.file_name,
+        'total_size': upload_session.total_size,
+        'chunk_size': upload_session.chunk_size,
+        'total_chunks': upload_session.total_chunks,
+        'received_chunks': received,
+        'received_bytes': sum(upload_session.chunk_length(index) for index in received),
+        'missing_chunks': [index for index in range(upload_session.total_chunks) if index not in received_set]
+    }
+
+def discard_upload_session(upload_session):
+    """Delete an upload session and its temporary file. The caller commits."""
+    if os.path.exists(upload_session.temp_path):
+        os.remove(upload_session.temp_path)
+    db.session.delete(upload_session)
+
+def cleanup_expired_upload_sessions():
+    """Remove upload sessions that have not received data within the TTL."""
+    cutoff = datetime.utcnow() - UPLOAD_SESSION_TTL
+    expired = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for upload_session in expired:
+        discard_upload_session(upload_session)
+    db.session.commit()
+    if expired:
+        app.logger.info(f"Removed {len(expired)} expired upload sessions")
+
+register_periodic_task('upload-session-cleanup', UPLOAD_SESSION_CLEANUP_INTERVAL, cleanup_expired_upload_sessions)
+
+@app.route('/cloud/uploads', methods=['POST'])
+@login_required
+def create_upload_session():
+    data = request.get_json(silent=True) or {}
+    file_name = (data.get('filename') or '').strip()
+    file_type = data.get('type') or 'application/octet-stream'
+    
+    try:
+        total_size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid file size'}), 400
+    
+    if not file_name:
+        return jsonify({'error': 'Keine Datei ausgewählt'}), 400
+    
+    if total_size < 0:
+        return jsonify({'error': 'Invalid file size'}), 400
+    
+    if total_size > MAX_FILE_SIZE:
+        return jsonify({
+            'error': f'Datei zu groß. Maximale Dateigröße: 5 GB (Ihre Datei: {total_size / (1024 * 1024):.2f} MB)'
+        }), 413
+    
+    # Open sessions count against the quota so parallel uploads cannot overcommit it
+    quota = get_storage_quota(current_user.id)
+    if quota.used_bytes + get_reserved_upload_bytes(current_user.id) + total_size > USER_STORAGE_QUOTA_BYTES:
+        return jsonify({
+            'error': 'Speicherlimit überschritten. Bitte löschen Sie einige Dateien.'
+        }), 413
+    
+    upload_id = secrets.token_hex(16)
+    temp_path = os.path.join(get_user_storage_path(current_user.id), f".upload-{upload_id}.part")
+    
+    try:
+        # Preallocate so chunks can be written at their offsets in any order
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            os.ftruncate(fd, total_size)
+        finally:
+            os.close(fd)
+        
+        upload_session = UploadSession(
+            id=upload_id,
+            user_id=current_user.id,
+            file_name=file_name,
+            file_type=file_type[:100],
+            total_size=total_size,
+            chunk_size=RESUMABLE_CHUNK_SIZE,
+            temp_path=temp_path
+        )
+        db.session.add(upload_session)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        app.logger.error(f"Error creating upload session: {str(e)}")
+        return jsonify({'error': 'Could not start upload', 'details': str(e)}), 500
+    
+    return jsonify(upload_session_status(upload_session)), 201
+
+@app.route('/cloud/uploads/<upload_id>', methods=['GET'])
+@login_required
+def get_upload_session(upload_id):
+    upload_session = get_user_upload_session(upload_id)
+    if not upload_session:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    return jsonify(upload_session_status(upload_session))
+
+@app.route('/cloud/uploads/<upload_id>/chunks/<int:offset>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id, offset):
+    upload_session = get_user_upload_session(upload_id)
+    if not upload_session:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    if offset % upload_session.chunk_size or offset >= max(upload_session.total_size, 1):
+        return jsonify({'error': 'Offset must be a chunk boundary inside the file'}), 400
+    
+    chunk_index = offset // upload_session.chunk_size
+    expected_length = upload_session.chunk_length(chunk_index)
+    if request.content_length is not None and request.content_length != expected_length:
+        return jsonify({'error': f'Chunk {chunk_index} must be {expected_length} bytes'}), 400
+    
+    temp_path = upload_session.temp_path
+    
+    # Release the connection while the body is received
+    db.session.commit()
+    
+    written = 0
+    fd = os.open(temp_path, os.O_WRONLY)
+    try:
+        for data in iter_request_chunks():
+            if written + len(data) > expected_length:
+                return jsonify({'error': f'Chunk {chunk_index} must be {expected_length} bytes'}), 400
+            view = memoryview(data)
+            while view:
+                count = os.pwrite(fd, view, offset + written)
+                view = view[count:]
+                written += count
+        os.fsync(fd)
+    except OSError as e:
+        app.logger.error(f"Error writing chunk {chunk_index} of upload {upload_id}: {str(e)}")
+        return jsonify({'error': 'Could not store chunk', 'details': str(e)}), 500
+    finally:
+        os.close(fd)
+    
+    if written != expected_length:
+        return jsonify({'error': f'Chunk {chunk_index} incomplete: {written} of {expected_length} bytes'}), 400
+    
+    try:
+        # Retried chunks simply overwrite the same bytes
+        if db.session.get(UploadSessionChunk, (upload_id, chunk_index)) is None:
+            db.session.add(UploadSessionChunk(session_id=upload_id, chunk_index=chunk_index))
+        db.session.query(UploadSession).filter(UploadSession.id == upload_id).update(
+            {UploadSession.updated_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.session.commit()
+    except IntegrityError:
+        # A parallel retry of the same chunk recorded it first
+        db.session.rollback()
+    
+    return jsonify({'upload_id': upload_id, 'chunk_index': chunk_index, 'received_bytes': written})
+
+@app.route('/cloud/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_upload(upload_id):
+    upload_session = get_user_upload_session(upload_id)
+    if not upload_session:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    status = upload_session_status(upload_session)
+    if status['missing_chunks']:
+        return jsonify({
+            'error': 'Upload incomplete',
+            'missing_chunks': status['missing_chunks']
+        }), 409
+    
+    sha256, _ = hash_file(upload_session.temp_path)
+    
+    quota = get_storage_quota(current_user.id)
+    if quota.used_bytes + upload_session.total_size > USER_STORAGE_QUOTA_BYTES:
+        return jsonify({
+            'error': 'Speicherlimit überschritten. Bitte löschen Sie einige Dateien.'
+        }), 413
+    
+    temp_path = upload_session.temp_path
+    
+    try:
+        cloud_file = add_cloud_file(
+            current_user.id,
+            upload_session.file_name,
+            upload_session.file_type,
+            temp_path,
+            upload_session.total_size,
+            sha256
+        )
+        db.session.delete(upload_session)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        upload_session = db.session.get(UploadSession, upload_id)
+        if upload_session and not os.path.exists(temp_path):
+            # The content already moved to the blob store, so the session cannot resume
+            discard_upload_session(upload_session)
+            db.session.commit()
+        app.logger.error(f"Error finalizing upload {upload_id}: {str(e)}", exc_info=True)
+        return jsonify({
+            'error': 'Fehler beim Datei-Upload. Bitte versuchen Sie es erneut.',
+            'details': str(e)
+        }), 500
+    
+    app.logger.info(f"Chunked upload {upload_id} finalized by user {current_user.id}")
+    
+    return jsonify({
+        'id': cloud_file.id,
+        'filename': cloud_file.file_name,
+        'sha256': cloud_file.sha256,
+        'message': 'Datei erfolgreich hochgeladen'
+    }), 200
+
+@app.route('/cloud/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_upload(upload_id):
+    upload_session = get_user_upload_session(upload_id)
+    if not upload_session:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    discard_upload_session(upload_session)
+    db.session.commit()
+    return jsonify({'message': 'Upload abgebrochen'})
+
+# Cloud file listing
+# Keyset pagination: the cursor holds the sort value and id of the last row
+# of a page, so every page is one index range scan regardless of its depth.
+CLOUD_FILES_DEFAULT_LIMIT = 100
+CLOUD_FILES_MAX_LIMIT = 500
+
+# Public field name -> column
+CLOUD_FILE_FIELDS = {
+    'id': UserCloudStorage.id,
+    'filename': UserCloudStorage.file_name,
+    'size': UserCloudStorage.file_size,
+    'type': UserCloudStorage.file_type,
+    'uploaded_at': UserCloudStorage.uploaded_at,
+    'sha256': UserCloudStorage.sha256
+}
+CLOUD_FILE_DEFAULT_FIELDS = ('id', 'filename', 'size', 'type', 'uploaded_at')
+
+# Sort name -> column; each has a (user_id, column) index
+CLOUD_FILE_SORTS = {
+    'uploaded_at': UserCloudStorage.uploaded_at,
+    'name': UserCloudStorage.file_name,
+    'size': UserCloudStorage.file_size
+}
+
+def encode_cursor(sort, value, row_id):
+    """Opaque pagination cursor for the row after which the next page starts."""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, sort):
+    """
+    Decode a cursor created by encode_cursor for the same sort order.
+
+    Returns:
+        tuple: (sort value, row id)
+
+    Raises:
+        ValueError: If the cursor is malformed or belongs to another sort
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if cursor_sort != sort or not isinstance(row_id, int):
+        raise ValueError('Cursor does not match the sort order')
+    return value, row_id
+
+@app.route('/cloud/files', methods=['GET'])
+@login_required
+def list_cloud_files():
+    """
+    List cloud files for the current user, one page at a time.
+    
+    Query parameters:
+        limit: Page size (default 100, at most 500)
+        cursor: ``next_cursor`` of the previous page
+        sort: uploaded_at, name or size, prefixed with "-" for descending
+            (default -uploaded_at)
+        type: Only files whose content type starts with this value
+        prefix: Only files whose name starts with this value
+        fields: Comma-separated subset of id, filename, size, type,
+            uploaded_at, sha256
+    
+    Returns:
+        JSON object with ``files`` and ``next_cursor`` (null on the last page)
+    """
+    sort = request.args.get('sort', '-uploaded_at')
+    sort_column = CLOUD_FILE_SORTS.get(sort.lstrip('-'))
+    if sort_column is None:
+        return jsonify({'error': f"Invalid sort, use one of: {', '.join(CLOUD_FILE_SORTS)}"}), 400
+    descending = sort.startswith('-')
+    # Timestamps go into the cursor exactly as the database returns them;
+    # SQLite stores them as text, and re-rendering would shift equal values
+    cursor_column = type_coerce(sort_column, String) if sort.lstrip('-') == 'uploaded_at' else sort_column
+    
+    limit = request.args.get('limit', CLOUD_FILES_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, CLOUD_FILES_MAX_LIMIT))
+    
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(CLOUD_FILE_DEFAULT_FIELDS)
+    unknown = [f for f in fields if f not in CLOUD_FILE_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    
+    try:
+        # The sort key and id are always selected to build the cursor
+        query = db.session.query(
+            UserCloudStorage.id, cursor_column, *[CLOUD_FILE_FIELDS[f] for f in fields]
+        ).filter(UserCloudStorage.user_id == current_user.id)
+        
+        file_type = request.args.get('type')
+        if file_type:
+            query = query.filter(UserCloudStorage.file_type.startswith(file_type, autoescape=True))
+        
+        # Range instead of LIKE so the (user_id, file_name) index is used
+        prefix = request.args.get('prefix')
+        if prefix:
+            query = query.filter(
+                UserCloudStorage.file_name >= prefix,
+                UserCloudStorage.file_name < prefix + '\U0010ffff'
+            )
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                value, row_id = decode_cursor(cursor, sort)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            key = db.tuple_(cursor_column, UserCloudStorage.id)
+            query = query.filter(key < (value, row_id) if descending else key > (value, row_id))
+        
+        if descending:
+            query = query.order_by(sort_column.desc(), UserCloudStorage.id.desc())
+        else:
+            query = query.order_by(sort_column.asc(), UserCloudStorage.id.asc())
+        
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        file_list = []
+        for row in rows:
+            item = {}
+            for index, field in enumerate(fields, start=2):
+                value = row[index]
+                item[field] = value.isoformat() if isinstance(value, datetime) else value
+            file_list.append(item)
+        
+        next_cursor = encode_cursor(sort, rows[-1][1], rows[-1][0]) if has_more else None
+        
+        return jsonify({'files': file_list, 'next_cursor': next_cursor})
+    except Exception as e:
+        app.logger.error(f"Error listing cloud files: {e}")
+        return jsonify({'error': 'Failed to retrieve cloud files'}), 500
+
+@app.route('/cloud/files/<int:file_id>', methods=['DELETE'])
+@login_required
+def delete_cloud_file(file_id):
+    """
+    Delete a cloud file of the current user. Its blob is garbage collected
+    once no other file references it.
+    """
+    cloud_file = UserCloudStorage.query.filter_by(id=file_id, user_id=current_user.id).first()
+    if not cloud_file:
+        return jsonify({'error': 'File not found'}), 404
+    
+    # Accepted shares hold their own reference; pending ones still need this row
+    active_shares = SharedFile.query.filter_by(original_file_id=file_id, status='pending').count()
+    if active_shares:
+        return jsonify({
+            'error': 'File has pending shares',
+            'active_shares': active_shares
+        }), 409
+    
+    try:
+        legacy_path = remove_cloud_file(cloud_file)
+        db.session.commit()
+        
+        if legacy_path and os.path.exists(legacy_path):
+            os.remove(legacy_path)
+        
+        return jsonify({'message': 'Datei erfolgreich gelöscht'}), 200
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error deleting cloud file {file_id}: {str(e)}")
+        return jsonify({'error': 'Failed to delete file', 'details': str(e)}), 500
+
+# Cloud file downloads
+# With CLOUD_DOWNLOAD_OFFLOAD=x-accel-redirect, nginx streams the file from an
+# internal location that maps CLOUD_DOWNLOAD_ACCEL_PREFIX to USER_STORAGE_BASE_DIR:
+#
+#     location /protected-storage/ { internal; alias /path/to/user_storage/; }
+#
+# With CLOUD_DOWNLOAD_OFFLOAD=x-sendfile, Apache/lighttpd do the same via
+# X-Sendfile. Otherwise send_file serves ranges itself through the WSGI
+# server's file wrapper (sendfile where available).
+CLOUD_DOWNLOAD_OFFLOAD = os.environ.get('CLOUD_DOWNLOAD_OFFLOAD', '').lower()
+CLOUD_DOWNLOAD_ACCEL_PREFIX = os.environ.get('CLOUD_DOWNLOAD_ACCEL_PREFIX', '/protected-storage/')
+app.config['USE_X_SENDFILE'] = CLOUD_DOWNLOAD_OFFLOAD == 'x-sendfile'
+
+def get_downloadable_file(file_id, user_id):
+    """
+    Return a cloud file the user owns or has a pending share for, in one query.
+
+    Args:
+        file_id (int): The ID of the file
+        user_id (int): The ID of the requesting user
+
+    Returns:
+        UserCloudStorage: The file, or None if it is not accessible
+    """
+    shared_with_user = db.session.query(SharedFile.id).filter(
+        SharedFile.recipient_id == user_id,
+        SharedFile.status == 'pending',
+        SharedFile.original_file_id == UserCloudStorage.id
+    ).exists()
+    return UserCloudStorage.query.filter(
+        UserCloudStorage.id == file_id,
+        db.or_(UserCloudStorage.user_id == user_id, shared_with_user)
+    ).first()
+
+def attachment_disposition(filename):
+    """Content-Disposition value for a download, as send_file builds it."""
+    try:
+        filename.encode('ascii')
+        options = {'filename': filename}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        options = {'filename': simple, 'filename*': f"UTF-8''{url_quote(filename, safe='!#$&+^`|~')}"}
+    return dump_options_header('attachment', options)
+
+def cloud_file_etag(cloud_file, stat_result):
+    """Strong ETag from the content hash, size and modification time."""
+    content_hash = (cloud_file.sha256 or 'legacy')[:16]
+    return f"{content_hash}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"
+
+@app.route('/cloud/files/<int:file_id>/download', methods=['GET'])
+@login_required
+def download_cloud_file(file_id):
+    cloud_file = get_downloadable_file(file_id, current_user.id)
+    if not cloud_file:
+        return jsonify({'error': 'File not found'}), 404
+    
+    path = cloud_file.stored_path
+    try:
+        stat_result = os.stat(path)
+    except (OSError, TypeError):
+        app.logger.error(f"Stored file missing on disk: {path} (id={cloud_file.id})")
+        return jsonify({'error': 'File not found', 'details': 'File content is missing'}), 404
+    
+    etag = cloud_file_etag(cloud_file, stat_result)
+    mimetype = cloud_file.file_type
+    if mimetype.startswith(CODE_FILE_TYPE_PREFIX) or '/' not in mimetype:
+        mimetype = 'text/plain'
+    
+    if CLOUD_DOWNLOAD_OFFLOAD == 'x-accel-redirect':
+        # nginx handles Range and the transfer; only validators are answered here
+        response = make_response('')
+        response.set_etag(etag)
+        response.last_modified = datetime.fromtimestamp(stat_result.st_mtime, timezone.utc)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        if request.if_none_match.contains(etag):
+            response.status_code = 304
+            return response
+        
+        relative_path = os.path.relpath(path, USER_STORAGE_BASE_DIR).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = CLOUD_DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + relative_path
+        response.headers['Content-Type'] = mimetype
+        response.headers['Content-Disposition'] = attachment_disposition(cloud_file.file_name)
+        return response
+    
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=cloud_file.file_name,
+        conditional=True,
+        etag=etag,
+        last_modified=stat_result.st_mtime
+    )
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/cloud')
+@login_required
+def cloud_storage():
+    return render_template('cloud_storage.html')
+
+@app.route('/dashboard/add_payment_method', methods=['POST'])
+@login_required
 def add_payment_method():
     """Add a new payment method for the user"""
     try:
@@ -1864,20 +4145,10 @@ def set_default_payment_method(method_id):
         # Reset other default methods
         PaymentMethod.query.filter_by(user_id=current_user.id).update({'is_default': False})
         
-        # Set this method as default
+        # Set this method as default; a job updates the Stripe customer
         method.is_default = True
-        
-        # Update Stripe customer's default payment method
-        try:
-            stripe.Customer.modify(
-                current_user.stripe_customer_id,
-                invoice_settings={
-                    'default_payment_method': method.stripe_payment_method_id
-                }
-            )
-        except Exception as e:
-            app.logger.error(f"Stripe default payment method error: {str(e)}")
-            return jsonify({'success': False, 'message': 'Failed to update default payment method'}), 500
+        current_user.default_payment_method_id = method.stripe_payment_method_id
+        enqueue_job('stripe.sync_default_payment_method', {'user_id': current_user.id})
         
         # Commit changes
         db.session.commit()
@@ -1908,32 +4179,26 @@ def delete_payment_method(method_id):
                 'message': 'You must have at least one payment method'
             }), 400
         
-        # Detach from Stripe
-        try:
-            stripe.PaymentMethod.detach(method.stripe_payment_method_id)
-        except Exception as e:
-            app.logger.error(f"Stripe payment method detach error: {str(e)}")
-            # Continue even if Stripe detach fails
+        # Detach from Stripe in the background
+        if method.stripe_payment_method_id:
+            enqueue_job(
+                'stripe.detach_payment_method',
+                {'stripe_payment_method_id': method.stripe_payment_method_id}
+            )
         
         # Delete the payment method
         db.session.delete(method)
         
         # If this was the default method, set another method as default
         if method.is_default:
-            new_default_method = PaymentMethod.query.filter_by(user_id=current_user.id).first()
+            new_default_method = PaymentMethod.query.filter(
+                PaymentMethod.user_id == current_user.id,
+                PaymentMethod.id != method.id
+            ).first()
             if new_default_method:
                 new_default_method.is_default = True
-                
-                # Update Stripe customer's default payment method
-                try:
-                    stripe.Customer.modify(
-                        current_user.stripe_customer_id,
-                        invoice_settings={
-                            'default_payment_method': new_default_method.stripe_payment_method_id
-                        }
-                    )
-                except Exception as e:
-                    app.logger.error(f"Stripe default payment method error: {str(e)}")
+                current_user.default_payment_method_id = new_default_method.stripe_payment_method_id
+                enqueue_job('stripe.sync_default_payment_method', {'user_id': current_user.id})
         
         # Commit changes
         db.session.commit()
@@ -2012,18 +4277,27 @@ def create_payment_method():
     return render_template('add_payment_method.html', current_year=datetime.now().year)
 
 # Add cloud storage routes for code editor
+# Code files are cloud files with a "code/<language>" type; their content
+# lives in the blob store like every other upload.
+CODE_FILE_TYPE_PREFIX = 'code/'
+
+def get_user_code_file(user_id, filename):
+    """Return the user's code file with the given name or None."""
+    return UserCloudStorage.query.filter(
+        UserCloudStorage.user_id == user_id,
+        UserCloudStorage.file_name == filename,
+        UserCloudStorage.file_type.startswith(CODE_FILE_TYPE_PREFIX)
+    ).first()
+
 @app.route('/cloud/code/list', methods=['GET'])
 @login_required
 def list_cloud_code_files():
     """List code files in user's cloud storage."""
-    user_cloud_dir = get_user_code_storage_path(current_user.id)
-    
-    # Ensure the directory exists
-    os.makedirs(user_cloud_dir, exist_ok=True)
-    
-    # Get list of code files
     try:
-        code_files = [f for f in os.listdir(user_cloud_dir) if os.path.isfile(os.path.join(user_cloud_dir, f))]
+        code_files = [name for (name,) in db.session.query(UserCloudStorage.file_name).filter(
+            UserCloudStorage.user_id == current_user.id,
+            UserCloudStorage.file_type.startswith(CODE_FILE_TYPE_PREFIX)
+        ).order_by(UserCloudStorage.file_name)]
         return jsonify(code_files)
     except Exception as e:
         app.logger.error(f"Error listing code files: {str(e)}")
@@ -2044,36 +4318,47 @@ def save_cloud_code_file():
     # Sanitize filename and ensure it has an extension
     if '.' not in filename:
         filename = f"{filename}.{language}"
+    filename = secure_filename(filename)
+    if not filename:
+        return jsonify({'error': 'Invalid filename'}), 400
     
-    # Ensure unique filename
-    user_cloud_dir = get_user_code_storage_path(current_user.id)
-    filepath = os.path.join(user_cloud_dir, filename)
+    encoded = content.encode('utf-8')
+    sha256 = hashlib.sha256(encoded).hexdigest()
+    temp_path = os.path.join(get_user_storage_path(current_user.id), f".code-{secrets.token_hex(8)}.part")
     
     try:
-        # Save file
-        with open(filepath, 'w') as f:
-            f.write(content)
+        with open(temp_path, 'wb') as f:
+            f.write(encoded)
+        
+        existing = get_user_code_file(current_user.id, filename)
+        new_file = add_cloud_file(
+            current_user.id,
+            filename,
+            f"{CODE_FILE_TYPE_PREFIX}{language}"[:100],
+            temp_path,
+            len(encoded),
+            sha256
+        )
         
-        # Optional: Create a database record for the file
-        try:
-            new_file = UserCloudStorage(
-                user_id=current_user.id,
-                file_name=filename,
-                file_path=filepath,
-                file_size=len(content),
-                file_type=language
-            )
-            db.session.add(new_file)
-            db.session.commit()
-        except Exception as db_error:
-            app.logger.warning(f"Could not create database record: {str(db_error)}")
+        # Saving replaces an existing file of the same name; its shares
+        # now point at the new version
+        legacy_path = None
+        if existing:
+            legacy_path = remove_cloud_file(existing, replacement=new_file)
+        db.session.commit()
+        
+        if legacy_path and os.path.exists(legacy_path):
+            os.remove(legacy_path)
         
         return jsonify({
             'success': True, 
             'message': f'File {filename} saved successfully',
-            'filepath': filepath
+            'id': new_file.id
         }), 200
     except Exception as e:
+        db.session.rollback()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
         app.logger.error(f"Error saving code file: {str(e)}")
         return jsonify({
             'error': f'Failed to save file: {str(e)}'
@@ -2086,23 +4371,18 @@ def load_cloud_code_file(filename):
     # Sanitize filename
     filename = secure_filename(filename)
     
-    user_cloud_dir = get_user_code_storage_path(current_user.id)
-    filepath = os.path.join(user_cloud_dir, filename)
-    
-    if not os.path.exists(filepath):
+    code_file = get_user_code_file(current_user.id, filename)
+    if not code_file:
         return jsonify({'error': 'File not found'}), 404
     
     try:
-        with open(filepath, 'r') as f:
+        with open(code_file.stored_path, 'r', encoding='utf-8') as f:
             content = f.read()
         
-        # Determine language from file extension
-        language = filename.split('.')[-1] if '.' in filename else 'text'
-        
         return jsonify({
             'filename': filename,
             'content': content,
-            'language': language
+            'language': code_file.file_type[len(CODE_FILE_TYPE_PREFIX):] or 'text'
         }), 200
     except Exception as e:
         app.logger.error(f"Error loading code file: {str(e)}")
@@ -2117,33 +4397,23 @@ def delete_cloud_code_file(filename):
     # Sanitize filename
     filename = secure_filename(filename)
     
-    user_cloud_dir = get_user_code_storage_path(current_user.id)
-    filepath = os.path.join(user_cloud_dir, filename)
-    
-    if not os.path.exists(filepath):
+    code_file = get_user_code_file(current_user.id, filename)
+    if not code_file:
         return jsonify({'error': 'File not found'}), 404
     
     try:
-        # Delete physical file
-        os.remove(filepath)
+        legacy_path = remove_cloud_file(code_file)
+        db.session.commit()
         
-        # Optional: Remove database record
-        try:
-            file_to_delete = UserCloudStorage.query.filter_by(
-                user_id=current_user.id, 
-                file_name=filename
-            ).first()
-            if file_to_delete:
-                db.session.delete(file_to_delete)
-                db.session.commit()
-        except Exception as db_error:
-            app.logger.warning(f"Could not delete database record: {str(db_error)}")
+        if legacy_path and os.path.exists(legacy_path):
+            os.remove(legacy_path)
         
         return jsonify({
             'success': True, 
             'message': f'File {filename} deleted successfully'
         }), 200
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"Error deleting code file: {str(e)}")
         return jsonify({
             'error': f'Failed to delete file: {str(e)}'
@@ -2165,23 +4435,15 @@ def code_editor():
         # Retrieve cloud files
         cloud_files = UserCloudStorage.query.filter_by(user_id=current_user.id).all()
         
-        # Ensure user's code storage directory exists
-        user_code_dir = get_user_code_storage_path(current_user.id)
-        
-        # Get local code files
-        try:
-            local_code_files = [
-                {
-                    'name': f, 
-                    'path': os.path.join(user_code_dir, f),
-                    'size': os.path.getsize(os.path.join(user_code_dir, f))
-                } 
-                for f in os.listdir(user_code_dir) 
-                if os.path.isfile(os.path.join(user_code_dir, f))
-            ]
-        except Exception as list_error:
-            app.logger.warning(f"Could not list local code files for user {current_user.id}: {list_error}")
-            local_code_files = []
+        # Code files are the cloud files with a code type
+        local_code_files = [
+            {
+                'name': f.file_name,
+                'size': f.file_size
+            }
+            for f in cloud_files
+            if f.file_type.startswith(CODE_FILE_TYPE_PREFIX)
+        ]
         
         return render_template(
             'code_editor.html', 
@@ -2202,16 +4464,18 @@ def get_storage_info():
     """
     try:
         # Total storage limit (5 GB)
-        TOTAL_STORAGE_BYTES = 5 * 1024 * 1024 * 1024  # 5 GB
-        
-        # Get all cloud storage files for the user
-        cloud_files = UserCloudStorage.query.filter_by(user_id=current_user.id).all()
+        TOTAL_STORAGE_BYTES = USER_STORAGE_QUOTA_BYTES
         
-        # Calculate total storage used
-        total_size = sum(file.file_size for file in cloud_files)
+        # Usage comes from the per-user counter instead of summing every file
+        quota = get_storage_quota(current_user.id, commit=True)
+        total_size = max(0, quota.used_bytes)
         
-        # Ensure total_size is a valid number
-        total_size = max(0, total_size)
+        # Get all cloud storage files for the user
+        cloud_files = db.session.query(
+            UserCloudStorage.file_name,
+            UserCloudStorage.file_size,
+            UserCloudStorage.uploaded_at
+        ).filter(UserCloudStorage.user_id == current_user.id).all()
         
         # Convert to human-readable format
         def convert_size(size_in_bytes):
@@ -2253,7 +4517,7 @@ def get_storage_info():
             'used_storage': total_size,
             'used_storage_human': convert_size(total_size),
             'percent_used': round(percent_used, 2),
-            'total_files': len(cloud_files),
+            'total_files': quota.file_count,
             'files': [
                 {
                     'name': file.file_name,
@@ -2318,29 +4582,319 @@ def billing():
 def search_users_for_sharing():
     """
     Search for users to share files with.
-    Excludes the current user and returns usernames matching the query.
+    Excludes the current user and returns users whose username or email
+    equals, starts with or contains the query, in that order.
     """
-    query = request.args.get('query', '').strip()
+    query = normalize_directory_term(request.args.get('query', ''))
     
     if not query:
         return jsonify([])
     
-    # Search for users with matching username or email, excluding current user
-    matching_users = User.query.filter(
-        db.or_(
-            User.username.ilike(f'%{query}%'), 
-            User.email.ilike(f'%{query}%')
-        ), 
-        User.id != current_user.id
-    ).limit(10).all()
-    
-    return jsonify([
-        {
-            'id': user.id, 
-            'username': user.username, 
-            'email': user.email
-        } for user in matching_users
-    ])
+    # Cached results are shared by all users, so the current user is
+    # filtered out here rather than in the query
+    matching_users = [
+        user for user in search_user_directory(query)
+        if user['id'] != current_user.id
+    ][:USER_SEARCH_LIMIT]
+    
+    response = jsonify(matching_users)
+    response.headers['Cache-Control'] = f'private, max-age={USER_SEARCH_CACHE_TTL}'
+    # Clients searching as the user types should wait this long after the last keystroke
+    response.headers['X-Search-Debounce'] = str(USER_SEARCH_DEBOUNCE_MS)
+    return response
+
+# Outbound email
+# Emails are queued in the outbox_emails table in the same transaction as the
+# change they announce, so requests return once the row is committed. The
+# outbox-sender task delivers due messages over one reused SMTP connection
+# per process; rows are claimed with a lease, so several workers never send
+# the same row twice. Failed sends are retried with exponential backoff.
+# Messages with a digest key are held for OUTBOX_DIGEST_DELAY and sent as a
+# single digest when a recipient got several in that window.
+SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 1025))  # mail_sink.py default
+SMTP_USERNAME = os.environ.get('SMTP_USERNAME')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '').lower() in ('1', 'true', 'yes')
+SMTP_TIMEOUT = int(os.environ.get('SMTP_TIMEOUT', 10))  # seconds
+MAIL_FROM = os.environ.get('MAIL_FROM', 'SideForge <no-reply@sideforge.com>')
+OUTBOX_POLL_INTERVAL = int(os.environ.get('OUTBOX_POLL_INTERVAL', 5))  # seconds
+OUTBOX_DIGEST_DELAY = int(os.environ.get('OUTBOX_DIGEST_DELAY', 60))  # seconds
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_LEASE = timedelta(minutes=5)
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BASE_BACKOFF = 30  # seconds, doubled after every failed attempt
+OUTBOX_MAX_BACKOFF = 6 * 60 * 60  # seconds
+OUTBOX_RETENTION = timedelta(days=7)
+
+# Digest key -> subject of the combined message
+OUTBOX_DIGEST_SUBJECTS = {
+    'file_shared': '{count} files were shared with you on SideForge'
+}
+
+class OutboxEmail(db.Model):
+    __tablename__ = 'outbox_emails'
+    __table_args__ = (
+        db.Index('ix_outbox_emails_status_next_attempt_at', 'status', 'next_attempt_at'),
+        db.Index('ix_outbox_emails_to_email_digest_key', 'to_email', 'digest_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    # Messages with the same recipient and digest key may be combined;
+    # summary is their line in the digest
+    digest_key = db.Column(db.String(50), nullable=True)
+    summary = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32), nullable=True, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+def send_email(to_email, subject, body, digest_key=None, summary=None):
+    """
+    Queue an email for the outbox sender. The caller commits; nothing is
+    sent if the transaction rolls back.
+
+    Args:
+        to_email (str): Recipient address
+        subject (str): Subject line
+        body (str): Plain text body
+        digest_key (str): Allow combining with other messages to the same
+            recipient, see OUTBOX_DIGEST_SUBJECTS
+        summary (str): Line representing this message in a digest
+    """
+    now = datetime.utcnow()
+    db.session.add(OutboxEmail(
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        digest_key=digest_key,
+        summary=summary,
+        next_attempt_at=now + timedelta(seconds=OUTBOX_DIGEST_DELAY) if digest_key else now
+    ))
+
+class SMTPConnection:
+    """
+    A single SMTP connection reused for every message. It is checked with
+    NOOP after idling and re-opened when the server has dropped it.
+    """
+
+    def __init__(self, host, port, username=None, password=None, starttls=False, timeout=10, max_idle=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._smtp = None
+        self._last_used = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        self._smtp = smtp
+
+    def _ensure_connected(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.max_idle:
+            try:
+                self._smtp.noop()
+            except smtplib.SMTPException:
+                self._smtp = None
+        if self._smtp is None:
+            self._connect()
+
+    def send(self, message):
+        """Send an EmailMessage, reconnecting once if the connection was lost."""
+        with self._lock:
+            try:
+                self._ensure_connected()
+                self._smtp.send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                self._connect()
+                self._smtp.send_message(message)
+            self._last_used = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._smtp is not None:
+                try:
+                    self._smtp.quit()
+                except smtplib.SMTPException:
+                    pass
+                self._smtp = None
+
+smtp_connection = SMTPConnection(
+    SMTP_HOST, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD,
+    starttls=SMTP_STARTTLS, timeout=SMTP_TIMEOUT
+)
+
+def build_email_message(to_email, subject, body):
+    message = EmailMessage()
+    message['From'] = MAIL_FROM
+    message['To'] = to_email
+    message['Subject'] = subject
+    message['Message-ID'] = make_msgid(domain='sideforge.com')
+    message.set_content(body)
+    return message
+
+def compose_outbox_message(rows):
+    """
+    The message for a group of claimed rows: the row's own message, or a
+    digest when several rows share a recipient and digest key.
+    """
+    if len(rows) == 1:
+        row = rows[0]
+        return build_email_message(row.to_email, row.subject, row.body)
+    
+    lines = '\n'.join(f"    - {row.summary or row.subject}" for row in rows)
+    body = f"""
+    Hello,
+
+    Here is what happened on SideForge:
+
+{lines}
+
+    Please log in to your account to see the details.
+
+    Best regards,
+    SideForge Team
+    """
+    subject = OUTBOX_DIGEST_SUBJECTS[rows[0].digest_key].format(count=len(rows))
+    return build_email_message(rows[0].to_email, subject, body)
+
+def is_permanent_smtp_error(error):
+    """Rejected recipients and 5xx replies will not succeed on retry."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+def claim_outbox_batch(batch_size):
+    """
+    Claim due messages, plus the held messages that can join their digests,
+    for OUTBOX_LEASE. A sender that dies mid-batch leaves rows that become
+    due again when the lease runs out.
+
+    Returns:
+        list: Claimed OutboxEmail rows
+    """
+    now = datetime.utcnow()
+    token = secrets.token_hex(16)
+    
+    due_ids = [row_id for (row_id,) in db.session.query(OutboxEmail.id).filter(
+        OutboxEmail.status == 'pending',
+        OutboxEmail.next_attempt_at <= now
+    ).order_by(OutboxEmail.next_attempt_at).limit(batch_size)]
+    if not due_ids:
+        return []
+    
+    # Conditional update: of two senders racing for a row only one matches
+    OutboxEmail.query.filter(
+        OutboxEmail.id.in_(due_ids),
+        OutboxEmail.status == 'pending',
+        OutboxEmail.next_attempt_at <= now
+    ).update({'claim_token': token, 'next_attempt_at': now + OUTBOX_LEASE}, synchronize_session=False)
+    
+    digest_groups = db.session.query(OutboxEmail.to_email, OutboxEmail.digest_key).filter(
+        OutboxEmail.claim_token == token,
+        OutboxEmail.digest_key.isnot(None)
+    ).distinct().all()
+    if digest_groups:
+        OutboxEmail.query.filter(
+            db.tuple_(OutboxEmail.to_email, OutboxEmail.digest_key).in_(digest_groups),
+            OutboxEmail.status == 'pending',
+            OutboxEmail.claim_token.is_(None)
+        ).update({'claim_token': token, 'next_attempt_at': now + OUTBOX_LEASE}, synchronize_session=False)
+    
+    rows = OutboxEmail.query.filter(OutboxEmail.claim_token == token).order_by(OutboxEmail.id).all()
+    db.session.commit()
+    return rows
+
+def deliver_outbox(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Send due outbox messages until none are left.
+
+    Returns:
+        tuple: (messages sent, messages failed permanently)
+    """
+    sent = failed = 0
+    while True:
+        rows = claim_outbox_batch(batch_size)
+        if not rows:
+            return sent, failed
+        
+        groups = OrderedDict()
+        for row in rows:
+            key = (row.to_email, row.digest_key) if row.digest_key else row.id
+            groups.setdefault(key, []).append(row)
+        
+        for group in groups.values():
+            try:
+                smtp_connection.send(compose_outbox_message(group))
+            except Exception as e:
+                # Errors other than SMTP and network ones come from building
+                # the message (unknown digest key, bad header) and would
+                # fail again on every retry
+                permanent = is_permanent_smtp_error(e) or not isinstance(e, (smtplib.SMTPException, OSError))
+                for row in group:
+                    row.attempts += 1
+                    row.claim_token = None
+                    row.last_error = str(e) or e.__class__.__name__
+                    if row.attempts >= OUTBOX_MAX_ATTEMPTS or permanent:
+                        row.status = 'failed'
+                        failed += 1
+                    else:
+                        row.next_attempt_at = datetime.utcnow() + timedelta(
+                            seconds=backoff_delay(row.attempts, OUTBOX_BASE_BACKOFF, OUTBOX_MAX_BACKOFF)
+                        )
+                app.logger.warning(f"Sending email to {group[0].to_email} failed: {str(e)}")
+            else:
+                sent_at = datetime.utcnow()
+                for row in group:
+                    row.status = 'sent'
+                    row.sent_at = sent_at
+                    row.claim_token = None
+                    sent += 1
+            db.session.commit()
+
+def prune_outbox():
+    """Delete sent messages older than OUTBOX_RETENTION."""
+    OutboxEmail.query.filter(
+        OutboxEmail.status == 'sent',
+        OutboxEmail.sent_at < datetime.utcnow() - OUTBOX_RETENTION
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+register_periodic_task('outbox-sender', OUTBOX_POLL_INTERVAL, deliver_outbox, run_immediately=True)
+register_recurring_job('outbox-pruner', 60 * 60, prune_outbox)
+
+outbox_cli = AppGroup('outbox', help='Inspect and deliver queued email.')
+
+@outbox_cli.command('deliver')
+def deliver_outbox_command():
+    """Send all due messages now."""
+    sent, failed = deliver_outbox()
+    click.echo(f"Sent {sent} message(s), {failed} failed permanently")
+
+@outbox_cli.command('status')
+def outbox_status_command():
+    """Show message counts by status."""
+    counts = db.session.query(OutboxEmail.status, func.count(OutboxEmail.id)).group_by(OutboxEmail.status).all()
+    for status, count in counts:
+        click.echo(f"{status}: {count}")
+
+app.cli.add_command(outbox_cli)
+
+SHARE_MAX_RECIPIENTS = 500
 
 @app.route('/cloud/files/<int:file_id>/share', methods=['POST'])
 @login_required
@@ -2353,9 +4907,19 @@ def share_cloud_file(file_id):
     data = request.get_json()
     recipient_ids = data.get('recipient_ids', [])
     
-    # Validate input
+    # Validate input; the share dialog sends checkbox values as digit strings
     if not recipient_ids or not isinstance(recipient_ids, list):
         return jsonify({'error': 'Invalid recipient list'}), 400
+    recipient_ids = [
+        int(recipient_id) if isinstance(recipient_id, str) and recipient_id.isascii() and recipient_id.isdigit()
+        else recipient_id
+        for recipient_id in recipient_ids
+    ]
+    if any(type(recipient_id) is not int for recipient_id in recipient_ids):
+        return jsonify({'error': 'Invalid recipient list'}), 400
+    recipient_ids = list(dict.fromkeys(recipient_ids))
+    if len(recipient_ids) > SHARE_MAX_RECIPIENTS:
+        return jsonify({'error': f'A file can be shared with at most {SHARE_MAX_RECIPIENTS} users at once'}), 400
     
     # Validate file ownership
     file = UserCloudStorage.query.filter_by(id=file_id, user_id=current_user.id).first()
@@ -2363,7 +4927,7 @@ def share_cloud_file(file_id):
         return jsonify({'error': 'File not found or not owned by you'}), 404
     
     # Validate recipients
-    recipients = User.query.filter(
+    recipients = db.session.query(User.id, User.email, User.email_notifications).filter(
         User.id.in_(recipient_ids),
         User.id != current_user.id
     ).all()
@@ -2372,55 +4936,85 @@ def share_cloud_file(file_id):
     if len(recipients) != len(recipient_ids):
         return jsonify({'error': 'One or more recipients are invalid'}), 400
     
-    shared_files = []
-    for recipient in recipients:
-        # Check if file is already shared with this user
-        existing_share = SharedFile.query.filter_by(
-            original_file_id=file_id, 
-            sender_id=current_user.id, 
-            recipient_id=recipient.id,
-            status='pending'
-        ).first()
-        
-        if existing_share:
-            continue  # Skip if already shared
-        
-        # Create a shared file entry
-        shared_file = SharedFile(
-            original_file_id=file_id,
-            sender_id=current_user.id,
-            recipient_id=recipient.id,
-            status='pending'
-        )
-        db.session.add(shared_file)
-        shared_files.append(shared_file.to_dict())
-    
     try:
-        db.session.commit()
+        created = upsert_shares(file.id, current_user.id, recipient_ids)
         
-        # Optional: Send notification email
-        for recipient in recipients:
-            try:
+        # Only recipients with a new or re-opened share are notified; the
+        # emails are queued in the same transaction as the shares
+        notify = {user_id: email for user_id, email, enabled in recipients if enabled is not False}
+        for _, recipient_id, _ in created:
+            if recipient_id in notify:
                 send_share_notification_email(
-                    recipient_email=recipient.email, 
+                    recipient_email=notify[recipient_id], 
                     sender_name=current_user.username, 
                     file_name=file.file_name
                 )
-            except Exception as email_error:
-                app.logger.error(f"Failed to send share notification email: {email_error}")
         
-        return jsonify({
-            'message': f'File shared with {len(recipients)} user(s)',
-            'shared_files': shared_files
-        })
+        db.session.commit()
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Error sharing file: {str(e)}")
         return jsonify({'error': 'Failed to share file', 'details': str(e)}), 500
+    
+    # Serialized from what is already loaded; no per-share lazy loads
+    shared_files = [{
+        'id': share_id,
+        'original_file_id': file.id,
+        'sender_id': current_user.id,
+        'recipient_id': recipient_id,
+        'sender_username': current_user.username,
+        'sender_name': current_user.name,
+        'file_name': file.file_name,
+        'file_type': file.file_type,
+        'file_size': file.file_size,
+        'status': 'pending',
+        'shared_at': shared_at.isoformat()
+    } for share_id, recipient_id, shared_at in created]
+    
+    return jsonify({
+        'message': f'File shared with {len(created)} user(s)',
+        'shared_files': shared_files
+    })
+
+def upsert_shares(file_id, sender_id, recipient_ids):
+    """
+    Share a file with many users in one INSERT ... ON CONFLICT statement.
+    A pair that was never shared gets a pending share and a rejected share
+    is re-opened. Pending and accepted shares are left alone. The caller
+    commits.
+    
+    Args:
+        file_id (int): Shared UserCloudStorage id
+        sender_id (int): Owner of the file
+        recipient_ids (list): Validated, distinct recipient user ids
+    
+    Returns:
+        list: (share_id, recipient_id, shared_at) of created or re-opened shares
+    """
+    shared_at = datetime.utcnow()
+    statement = dialect_insert(SharedFile).values([{
+        'original_file_id': file_id,
+        'sender_id': sender_id,
+        'recipient_id': recipient_id,
+        'status': 'pending',
+        'shared_at': shared_at
+    } for recipient_id in recipient_ids])
+    statement = statement.on_conflict_do_update(
+        index_elements=['original_file_id', 'recipient_id'],
+        set_={
+            'sender_id': statement.excluded.sender_id,
+            'status': 'pending',
+            'shared_at': statement.excluded.shared_at
+        },
+        where=SharedFile.status == 'rejected'
+    ).returning(SharedFile.id, SharedFile.recipient_id, SharedFile.shared_at)
+    
+    return db.session.execute(statement).all()
 
 def send_share_notification_email(recipient_email, sender_name, file_name):
     """
-    Send an email notification about a shared file.
+    Queue an email notification about a shared file. Several shares to the
+    same recipient within OUTBOX_DIGEST_DELAY are sent as one digest.
     """
     subject = f"{sender_name} shared a file with you"
     body = f"""
@@ -2434,55 +5028,100 @@ def send_share_notification_email(recipient_email, sender_name, file_name):
     SideForge Team
     """
     
-    # Use your existing email sending mechanism
     send_email(
         to_email=recipient_email, 
         subject=subject, 
-        body=body
+        body=body,
+        digest_key='file_shared',
+        summary=f"{sender_name} shared '{file_name}'"
     )
 
+SHARED_FILES_DEFAULT_LIMIT = 100
+SHARED_FILES_MAX_LIMIT = 500
+
+# Response key -> (column, fallback when the joined row is missing); one
+# SELECT of these columns replaces SharedFile.to_dict() and its lazy loads
+SHARED_FILE_COLUMNS = {
+    'id': (SharedFile.id, None),
+    'original_file_id': (SharedFile.original_file_id, None),
+    'sender_id': (SharedFile.sender_id, None),
+    'recipient_id': (SharedFile.recipient_id, None),
+    'sender_username': (User.username, 'Unknown Sender'),
+    'sender_name': (User.name, 'Unknown'),
+    'file_name': (UserCloudStorage.file_name, 'Unnamed File'),
+    'file_type': (UserCloudStorage.file_type, 'Unknown'),
+    'file_size': (UserCloudStorage.file_size, 0),
+    'status': (SharedFile.status, None),
+    'shared_at': (SharedFile.shared_at, None)
+}
+
 @app.route('/cloud/files/shared', methods=['GET'])
 @login_required
 def get_shared_files():
     """
-    Retrieve shared files for the current user.
+    List pending and accepted shares sent to the current user, newest first.
+    
+    Query parameters:
+        limit: Page size (default 100, at most 500)
+        cursor: ``next_cursor`` of the previous page
+    
+    Returns:
+        JSON object with ``shared_files`` and ``next_cursor`` (null on the
+        last page). The response has an ETag; polling clients sending
+        If-None-Match get a 304 while the page is unchanged.
     """
+    limit = request.args.get('limit', SHARED_FILES_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, SHARED_FILES_MAX_LIMIT))
+    
     try:
-        # Get pending and accepted shared files for the current user
-        from sqlalchemy import or_
-        
-        shared_files = SharedFile.query.filter(
+        query = db.session.query(
+            *[column for column, _ in SHARED_FILE_COLUMNS.values()]
+        ).select_from(SharedFile).outerjoin(
+            User, User.id == SharedFile.sender_id
+        ).outerjoin(
+            UserCloudStorage, UserCloudStorage.id == SharedFile.original_file_id
+        ).filter(
             SharedFile.recipient_id == current_user.id,
-            or_(
-                SharedFile.status == 'pending', 
-                SharedFile.status == 'accepted'
-            )
-        ).all()
-        
-        # Debug logging
-        app.logger.info(f"Found {len(shared_files)} shared files for user {current_user.id}")
-        
-        # Detailed logging for each shared file
-        for sf in shared_files:
-            app.logger.info(f"Shared File Details: ID={sf.id}, Sender={sf.sender_id}, "
-                            f"Original File={sf.original_file_id}, Status={sf.status}")
-        
-        # Convert shared files to dictionary
-        shared_files_dict = [sf.to_dict() for sf in shared_files]
+            SharedFile.status.in_(('pending', 'accepted'))
+        )
         
-        return jsonify(shared_files_dict)
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                _, row_id = decode_cursor(cursor, '-id')
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query = query.filter(SharedFile.id < row_id)
+        
+        rows = query.order_by(SharedFile.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        shared_files = []
+        for row in rows:
+            item = {}
+            for (key, (_, fallback)), value in zip(SHARED_FILE_COLUMNS.items(), row):
+                if value is None:
+                    value = fallback
+                item[key] = value.isoformat() if isinstance(value, datetime) else value
+            shared_files.append(item)
+        
+        next_cursor = encode_cursor('-id', rows[-1].id, rows[-1].id) if has_more else None
+        
+        response = jsonify({'shared_files': shared_files, 'next_cursor': next_cursor})
+        response.add_etag()
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     except Exception as e:
         app.logger.error(f"Error retrieving shared files: {str(e)}")
-        # Include the full traceback for more detailed error information
-        import traceback
-        app.logger.error(traceback.format_exc())
         return jsonify({'error': 'Failed to retrieve shared files', 'details': str(e)}), 500
 
 @app.route('/cloud/files/shared/<int:shared_file_id>/accept', methods=['POST'])
 @login_required
 def accept_shared_file(shared_file_id):
     """
-    Accept a shared file, which copies it to the recipient's cloud storage.
+    Accept a shared file, which adds a reference to its content to the recipient's cloud storage.
     """
     shared_file = SharedFile.query.filter_by(
         id=shared_file_id, 
@@ -2493,17 +5132,9 @@ def accept_shared_file(shared_file_id):
     if not shared_file:
         return jsonify({'error': 'Shared file not found or already processed'}), 404
     
-    # Copy the original file to recipient's cloud storage
+    # Reference the original content from the recipient's cloud storage
     original_file = shared_file.original_file
-    new_file = UserCloudStorage(
-        user_id=current_user.id,
-        file_name=f"Shared_{original_file.file_name}",
-        file_path=original_file.file_path,
-        file_type=original_file.file_type,
-        file_size=original_file.file_size
-    )
-    
-    db.session.add(new_file)
+    new_file = add_cloud_file_reference(current_user.id, original_file, f"Shared_{original_file.file_name}")
     
     # Update shared file status
     shared_file.status = 'accepted'
@@ -2511,20 +5142,15 @@ def accept_shared_file(shared_file_id):
     try:
         db.session.commit()
         
-        # Optional: Send notification email
-        for recipient in recipients:
-            try:
-                send_share_notification_email(
-                    recipient_email=recipient.email, 
-                    sender_name=current_user.username, 
-                    file_name=file.file_name
-                )
-            except Exception as email_error:
-                app.logger.error(f"Failed to send share notification email: {email_error}")
-        
         return jsonify({
             'message': 'File successfully accepted and added to your cloud storage',
-            'file': new_file.to_dict()
+            'file': {
+                'id': new_file.id,
+                'filename': new_file.file_name,
+                'size': new_file.file_size,
+                'type': new_file.file_type,
+                'uploaded_at': new_file.uploaded_at.isoformat() if new_file.uploaded_at else None
+            }
         }), 200
     except Exception as e:
         db.session.rollback()
@@ -2734,6 +5360,57 @@ def toggle_two_factor():
         app.logger.error(f"2FA toggle error for user {current_user.id}: {str(e)}")
         return jsonify({'success': False, 'message': 'Could not toggle two-factor authentication'}), 500
 
+def delete_user_data(user):
+    """
+    Delete a user and every row that references them. Foreign keys are
+    enforced, so children go first. Tasks the user created on other
+    people's boards are kept and credited to the board owner. The caller
+    commits.
+
+    Args:
+        user (User): The user to delete
+
+    Returns:
+        list: Legacy files to delete after the commit
+    """
+    user_id = user.id
+    legacy_paths = []
+    for cloud_file in UserCloudStorage.query.filter_by(user_id=user_id).all():
+        legacy_path = remove_cloud_file(cloud_file)
+        if legacy_path:
+            legacy_paths.append(legacy_path)
+    SharedFile.query.filter(
+        db.or_(SharedFile.sender_id == user_id, SharedFile.recipient_id == user_id)
+    ).delete(synchronize_session=False)
+    for upload_session in UploadSession.query.filter_by(user_id=user_id).all():
+        discard_upload_session(upload_session)
+    UserStorageQuota.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    
+    # Lists, tasks and members of owned boards follow through ON DELETE CASCADE
+    for board in PlannerBoard.query.filter_by(owner_id=user_id).all():
+        db.session.delete(board)
+    db.session.flush()
+    BoardMember.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    PlannerTask.query.filter_by(assigned_to_id=user_id).update(
+        {PlannerTask.assigned_to_id: None}, synchronize_session=False
+    )
+    board_owner = db.select(PlannerBoard.owner_id).join(
+        PlannerList, PlannerList.board_id == PlannerBoard.id
+    ).where(PlannerList.id == PlannerTask.list_id).scalar_subquery()
+    PlannerTask.query.filter_by(creator_id=user_id).update(
+        {PlannerTask.creator_id: board_owner}, synchronize_session=False
+    )
+    
+    ServerInstance.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    Payment.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    Subscription.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    PaymentMethod.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    
+    # Collections loaded earlier would otherwise be nulled out on delete
+    db.session.expire(user)
+    db.session.delete(user)
+    return legacy_paths
+
 @app.route('/account/delete', methods=['POST'])
 @login_required
 def delete_account():
@@ -2748,10 +5425,13 @@ def delete_account():
         logout_user()
 
         # Delete user account
-        user = User.query.get(user_id)
+        user = db.session.get(User, user_id)
         if user:
-            db.session.delete(user)
+            legacy_paths = delete_user_data(user)
             db.session.commit()
+            for legacy_path in legacy_paths:
+                if os.path.exists(legacy_path):
+                    os.remove(legacy_path)
 
         return jsonify({
             'message': 'Your account has been permanently deleted',
@@ -2879,11 +5559,12 @@ def debug_user_files():
             file_details.append({
                 'id': file.id,
                 'name': file.file_name,
-                'path': file.file_path,
+                'path': file.stored_path,
+                'sha256': file.sha256,
                 'size': file.file_size,
                 'type': file.file_type,
                 'active_shares': active_shares,
-                'physical_file_exists': os.path.exists(file.file_path) if file.file_path else False
+                'physical_file_exists': os.path.exists(file.stored_path) if file.stored_path else False
             })
         
         return jsonify({
@@ -2898,13 +5579,400 @@ def debug_user_files():
             'details': str(e)
         }), 500
 
+# Board permissions
+# resolve_board_role answers (user, board) -> role with one indexed query.
+# Results are memoized for the request in flask.g and cached per process
+# for a few seconds; inserts, updates and deletes of BoardMember and
+# PlannerBoard rows invalidate the cached roles of that board.
+BOARD_ROLE_LEVELS = {'viewer': 1, 'editor': 2, 'admin': 3, 'owner': 4}
+BOARD_PERMISSION_CACHE_TTL = int(os.environ.get('BOARD_PERMISSION_CACHE_TTL', 30))  # seconds
+
+class BoardPermissionCache:
+    """
+    Per-process LRU of (user_id, board_id) -> role entries that expire
+    after ``ttl`` seconds.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, board_id):
+        """Return the cached role (possibly None), or _MISSING."""
+        key = (user_id, board_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return self._MISSING
+            role, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return self._MISSING
+            self._entries.move_to_end(key)
+            return role
+
+    def set(self, user_id, board_id, role):
+        key = (user_id, board_id)
+        with self._lock:
+            self._entries[key] = (role, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_board(self, board_id):
+        """Forget every cached role on a board."""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == board_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+board_permission_cache = BoardPermissionCache(BOARD_PERMISSION_CACHE_TTL)
+
+def invalidate_board_permissions(board_id):
+    """Drop cached and request-memoized roles for a board."""
+    board_permission_cache.invalidate_board(board_id)
+    if has_request_context():
+        memo = g.get('board_roles')
+        if memo:
+            for key in [key for key in memo if key[1] == board_id]:
+                del memo[key]
+
+@event.listens_for(BoardMember, 'after_insert')
+@event.listens_for(BoardMember, 'after_update')
+@event.listens_for(BoardMember, 'after_delete')
+@event.listens_for(PlannerBoard, 'after_update')
+@event.listens_for(PlannerBoard, 'after_delete')
+def _invalidate_board_permissions_on_change(mapper, connection, target):
+    invalidate_board_permissions(target.board_id if isinstance(target, BoardMember) else target.id)
+
+def resolve_board_role(user_id, board_id):
+    """
+    Return the user's role on a board.
+    
+    Args:
+        user_id (int): The ID of the user
+        board_id (int): The ID of the board
+    
+    Returns:
+        str: 'owner', 'admin', 'editor' or 'viewer' ('viewer' also for
+        non-members of public boards), or None without access or if the
+        board does not exist
+    """
+    key = (user_id, board_id)
+    memo = g.setdefault('board_roles', {})
+    if key in memo:
+        return memo[key]
+    
+    role = board_permission_cache.get(user_id, board_id)
+    if role is BoardPermissionCache._MISSING:
+        row = db.session.query(
+            PlannerBoard.owner_id, PlannerBoard.is_public, BoardMember.role
+        ).outerjoin(
+            BoardMember,
+            db.and_(BoardMember.board_id == PlannerBoard.id, BoardMember.user_id == user_id)
+        ).filter(PlannerBoard.id == board_id, PlannerBoard.deleted_at.is_(None)).first()
+        
+        role = None
+        if row is not None:
+            owner_id, is_public, member_role = row
+            if owner_id == user_id:
+                role = 'owner'
+            elif member_role:
+                role = member_role
+            elif is_public:
+                role = 'viewer'
+        board_permission_cache.set(user_id, board_id, role)
+    
+    memo[key] = role
+    return role
+
+def has_board_role(role, min_role):
+    """Whether ``role`` grants at least ``min_role``."""
+    return BOARD_ROLE_LEVELS.get(role, 0) >= BOARD_ROLE_LEVELS[min_role]
+
+def get_task_board_id(task_id):
+    """
+    Return the board ID of a task with a single join. The task is loaded
+    into the session, so the view can fetch it without another query.
+    """
+    row = db.session.query(PlannerTask, PlannerList.board_id).join(
+        PlannerList, PlannerTask.list_id == PlannerList.id
+    ).filter(PlannerTask.id == task_id).first()
+    return row[1] if row else None
+
+def board_role_required(min_role, message='You do not have permission to perform this action.',
+                        board_field=None, task_field=None):
+    """
+    Require at least ``min_role`` on the board a planner view acts on.
+    
+    The board comes from the ``board_id`` view argument or the
+    ``board_field`` request value. If the view acts on a task (``task_id``
+    view argument or ``task_field`` request value), the task's board is
+    used and must match a board given in the URL. The view receives the
+    board as its ``board_id`` argument and the role in ``g.board_role``.
+    Under /api/ a denied request gets a JSON 403 instead of a redirect.
+    
+    Args:
+        min_role (str): 'viewer', 'editor', 'admin' or 'owner'
+        message (str): Flashed when access is denied
+        board_field (str): Form/query field holding the board ID
+        task_field (str): Form/query field holding the task ID
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            board_id = kwargs.get('board_id')
+            if board_id is None and board_field:
+                board_id = request.values.get(board_field, type=int)
+            task_id = kwargs.get('task_id')
+            if task_id is None and task_field:
+                task_id = request.values.get(task_field, type=int)
+                if task_id is None:
+                    abort(404)
+            
+            if task_id is not None:
+                task_board_id = get_task_board_id(task_id)
+                # A task addressed through a board URL must belong to it
+                if task_board_id is None or (board_id is not None and task_board_id != board_id):
+                    abort(404)
+                board_id = task_board_id
+            elif board_id is None:
+                abort(404)
+            
+            role = resolve_board_role(current_user.id, board_id)
+            if not has_board_role(role, min_role):
+                if role is None and db.session.get(PlannerBoard, board_id) is None:
+                    abort(404)
+                if request.path.startswith('/api/'):
+                    return jsonify({'error': message}), 403
+                flash(message, 'danger')
+                if role is None:
+                    return redirect(url_for('planner_home'))
+                return redirect(url_for('planner_board', board_id=board_id))
+            
+            g.board_role = role
+            kwargs['board_id'] = board_id
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Planner ordering
+# Lists and tasks are ordered by rank, a base-36 key compared as a plain
+# string. A new position gets a key between its neighbours' keys, so an
+# insert or move writes only that row. Appends step the first RANK_WIDTH
+# digits; repeated inserts at one spot make keys longer, and containers
+# whose keys exceed RANK_REBALANCE_LENGTH are respaced in the background.
+RANK_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+RANK_BASE = len(RANK_DIGITS)
+RANK_WIDTH = 4
+RANK_STEP = RANK_BASE  # Gap left after an appended key
+RANK_REBALANCE_LENGTH = 24
+# Ranked model -> column of the container the rank orders it in
+RANK_CONTAINERS = {
+    PlannerList: 'board_id',
+    PlannerTask: 'list_id'
+}
+
+def _rank_midpoint(low, high):
+    """Key between ``low`` ('' for the start) and ``high`` (None for the end)."""
+    if high is not None:
+        prefix = 0
+        while prefix < len(high) and (low[prefix] if prefix < len(low) else '0') == high[prefix]:
+            prefix += 1
+        if prefix:
+            return high[:prefix] + _rank_midpoint(low[prefix:], high[prefix:])
+    
+    low_digit = RANK_DIGITS.index(low[0]) if low else 0
+    high_digit = RANK_DIGITS.index(high[0]) if high is not None else RANK_BASE
+    if high_digit - low_digit > 1:
+        return RANK_DIGITS[(low_digit + high_digit) // 2]
+    if high is not None and len(high) > 1:
+        return high[0]
+    return RANK_DIGITS[low_digit] + _rank_midpoint(low[1:], None)
+
+def _rank_from_int(value, width=RANK_WIDTH):
+    digits = []
+    for _ in range(width):
+        value, digit = divmod(value, RANK_BASE)
+        digits.append(RANK_DIGITS[digit])
+    # Keys never end in the lowest digit, so one always fits in front
+    return ''.join(reversed(digits)).rstrip('0')
+
+def _rank_head(key, width):
+    return int(key[:width].ljust(width, '0'), RANK_BASE)
+
+def rank_between(low, high):
+    """
+    Return a rank key that sorts after ``low`` and before ``high``.
+    
+    Args:
+        low (str): Rank of the preceding row, or None at the start
+        high (str): Rank of the following row, or None at the end
+    
+    Returns:
+        str: The new key
+    """
+    if low is not None and high is not None and low >= high:
+        # Duplicate keys from concurrent writes; the rebalancer separates them
+        high = None
+    if high is None and low is not None:
+        # Step the leading digits, using one more digit whenever they are exhausted
+        for width in range(RANK_WIDTH, max(RANK_WIDTH, len(low)) + 3):
+            head = _rank_head(low, width) + RANK_STEP
+            if head < RANK_BASE ** width:
+                return _rank_from_int(head, width)
+    elif low is None and high is not None:
+        for width in range(RANK_WIDTH, max(RANK_WIDTH, len(high)) + 3):
+            head = _rank_head(high, width) - RANK_STEP
+            if head > 0:
+                return _rank_from_int(head, width)
+    return _rank_midpoint(low or '', high)
+
+def spaced_ranks(count):
+    """
+    Return ``count`` increasing, evenly spaced rank keys. They fill the
+    middle half of the key space, leaving room for as many appends and
+    prepends again before keys grow.
+    """
+    width = RANK_WIDTH
+    while RANK_BASE ** width < 4 * (count + 1) * RANK_STEP:
+        width += 1
+    space = RANK_BASE ** width
+    return [_rank_from_int(space // 4 + (i + 1) * (space // 2) // (count + 1), width) for i in range(count)]
+
+_rank_rebalance_lock = threading.Lock()
+_rank_rebalance_pending = set()
+
+def request_rank_rebalance(model, container_id):
+    """Queue a container for respacing by the background rebalancer."""
+    with _rank_rebalance_lock:
+        _rank_rebalance_pending.add((model, container_id))
+
+def rank_for_position(model, container_id, after_id=None, before_id=None):
+    """
+    Rank for placing a row of ``model`` in a container: right after the
+    row ``after_id``, right before ``before_id``, between both, or at the
+    end when neither is given. Each neighbour lookup is one index probe.
+    
+    Args:
+        model: PlannerList or PlannerTask
+        container_id (int): Board ID for lists, list ID for tasks
+        after_id (int): ID of the row to follow
+        before_id (int): ID of the row to precede
+    
+    Returns:
+        str: The new rank
+    
+    Raises:
+        ValueError: If a neighbour is not in the container
+    """
+    container = getattr(model, RANK_CONTAINERS[model])
+    neighbour_ids = [row_id for row_id in (after_id, before_id) if row_id is not None]
+    ranks = dict(db.session.query(model.id, model.rank).filter(
+        container == container_id, model.id.in_(neighbour_ids)
+    )) if neighbour_ids else {}
+    if any(row_id not in ranks for row_id in neighbour_ids):
+        raise ValueError('Neighbour is not in the same container')
+    
+    low = ranks.get(after_id)
+    high = ranks.get(before_id)
+    if after_id is None and before_id is None:
+        low = db.session.query(func.max(model.rank)).filter(container == container_id).scalar()
+    elif before_id is None:
+        high = db.session.query(func.min(model.rank)).filter(
+            container == container_id, model.rank > low
+        ).scalar()
+    elif after_id is None:
+        low = db.session.query(func.max(model.rank)).filter(
+            container == container_id, model.rank < high
+        ).scalar()
+    
+    rank = rank_between(low, high)
+    if len(rank) > RANK_REBALANCE_LENGTH or (low is not None and low == high):
+        request_rank_rebalance(model, container_id)
+    return rank
+
+@event.listens_for(PlannerList, 'before_insert')
+@event.listens_for(PlannerTask, 'before_insert')
+def _assign_default_rank(mapper, connection, target):
+    """Rank rows inserted without a position after their container's last row."""
+    if target.rank is not None:
+        return
+    model = type(target)
+    container_id = getattr(target, RANK_CONTAINERS[model])
+    # Rows of one flush are inserted together; chain them in memory
+    tails = object_session(target).info.setdefault('rank_tails', {})
+    low = tails.get((model, container_id))
+    if low is None:
+        low = connection.execute(db.select(func.max(model.rank)).where(
+            getattr(model, RANK_CONTAINERS[model]) == container_id
+        )).scalar()
+    target.rank = rank_between(low, None)
+    tails[(model, container_id)] = target.rank
+
+@event.listens_for(Session, 'after_flush')
+def _clear_rank_tails(session, flush_context):
+    session.info.pop('rank_tails', None)
+
+def rebalance_ranks(model, container_id):
+    """
+    Respace the ranks of one container, keeping the current order. Written
+    as one executemany UPDATE, without per-row change events.
+    """
+    container = getattr(model, RANK_CONTAINERS[model])
+    row_ids = [row_id for (row_id,) in db.session.query(model.id).filter(
+        container == container_id
+    ).order_by(model.rank, model.id)]
+    if row_ids:
+        db.session.execute(db.update(model), [
+            {'id': row_id, 'rank': rank} for row_id, rank in zip(row_ids, spaced_ranks(len(row_ids)))
+        ])
+    db.session.commit()
+    return len(row_ids)
+
+def rebalance_pending_ranks():
+    """Respace the containers queued by request_rank_rebalance."""
+    with _rank_rebalance_lock:
+        pending = list(_rank_rebalance_pending)
+        _rank_rebalance_pending.clear()
+    for model, container_id in pending:
+        count = rebalance_ranks(model, container_id)
+        app.logger.info(f"Rebalanced {count} {model.__tablename__} ranks in container {container_id}")
+
+register_periodic_task('rank-rebalancer', 60, rebalance_pending_ranks)
+
+planner_cli = AppGroup('planner', help='Planner maintenance.')
+
+@planner_cli.command('rebalance')
+@click.option('--min-length', default=RANK_REBALANCE_LENGTH, show_default=True,
+              help='Respace containers holding a rank longer than this.')
+def rebalance_ranks_command(min_length):
+    """Respace list and task ranks that have grown long."""
+    for model, container_column in RANK_CONTAINERS.items():
+        container = getattr(model, container_column)
+        container_ids = [container_id for (container_id,) in db.session.query(container).filter(
+            func.length(model.rank) > min_length
+        ).distinct()]
+        for container_id in container_ids:
+            count = rebalance_ranks(model, container_id)
+            click.echo(f"{model.__tablename__}: respaced {count} rows in container {container_id}")
+
+app.cli.add_command(planner_cli)
+
 # Planner Routes
 @app.route('/planner')
 @login_required
 def planner_home():
     # Get boards where user is owner or member
-    owned_boards = PlannerBoard.query.filter_by(owner_id=current_user.id).all()
-    member_boards = [bm.board for bm in current_user.board_memberships]
+    owned_boards = PlannerBoard.query.filter_by(owner_id=current_user.id, deleted_at=None).all()
+    member_boards = [bm.board for bm in current_user.board_memberships if bm.board.deleted_at is None]
     
     return render_template('planner/home.html', 
                            owned_boards=owned_boards, 
@@ -2937,27 +6005,42 @@ def create_board():
     
     return render_template('planner/create_board.html', form=form)
 
+def load_board_snapshot(board_id):
+    """
+    Load a board with its lists, tasks, assignees and members in a fixed
+    number of queries (board, lists, tasks with assignees, members with
+    users), independent of the board size.
+    
+    Args:
+        board_id (int): The ID of the board
+    
+    Returns:
+        PlannerBoard: The board with all relationships loaded, or None
+    """
+    return PlannerBoard.query.options(
+        selectinload(PlannerBoard.lists)
+            .selectinload(PlannerList.tasks)
+            .joinedload(PlannerTask.assigned_to),
+        selectinload(PlannerBoard.board_members)
+            .joinedload(BoardMember.user)
+    ).filter(PlannerBoard.id == board_id).first()
+
+def set_task_form_choices(form, board_id):
+    """Fill the list and assignee choices of a TaskForm for a board."""
+    form.list_id.choices = [(list_id, title) for list_id, title in db.session.query(
+        PlannerList.id, PlannerList.title
+    ).filter(PlannerList.board_id == board_id)]
+    board_members = db.session.query(User.id, User.name).join(
+        BoardMember, BoardMember.user_id == User.id
+    ).filter(BoardMember.board_id == board_id).all()
+    form.assigned_to.choices = [(0, 'Unassigned')] + [(user_id, name) for user_id, name in board_members]
+
 @app.route('/planner/board/<int:board_id>')
 @login_required
+@board_role_required('viewer', 'You do not have access to this board.')
 def planner_board(board_id):
-    board = PlannerBoard.query.get_or_404(board_id)
-    
-    # Check board access permissions
-    is_member = BoardMember.query.filter(
-        BoardMember.board_id == board_id, 
-        BoardMember.user_id == current_user.id
-    ).first()
-    
-    if not is_member and not board.is_public and board.owner_id != current_user.id:
-        flash('You do not have access to this board.', 'danger')
-        return redirect(url_for('planner_home'))
-    
-    # Determine user's role
-    user_role = 'viewer'
-    if board.owner_id == current_user.id:
-        user_role = 'owner'
-    elif is_member:
-        user_role = is_member.role
+    board = load_board_snapshot(board_id)
+    user_role = g.board_role
     
     # Prepare forms
     task_form = TaskForm()
@@ -3003,26 +6086,15 @@ def planner_board(board_id):
 
 @app.route('/planner/board/<int:board_id>/list/create', methods=['POST'])
 @login_required
+@board_role_required('editor', 'You do not have permission to create lists.')
 def create_list(board_id):
     form = ListForm()
-    board = PlannerBoard.query.get_or_404(board_id)
-    
-    # Check permissions
-    is_member = BoardMember.query.filter(
-        BoardMember.board_id == board_id, 
-        BoardMember.user_id == current_user.id, 
-        BoardMember.role.in_(['editor', 'admin'])
-    ).first()
-    
-    if not is_member and board.owner_id != current_user.id:
-        flash('You do not have permission to create lists.', 'danger')
-        return redirect(url_for('planner_board', board_id=board_id))
     
     if form.validate_on_submit():
+        # Ranked after the board's last list on insert
         new_list = PlannerList(
             title=form.title.data,
-            board_id=board_id,
-            order=len(board.lists)
+            board_id=board_id
         )
         db.session.add(new_list)
         db.session.commit()
@@ -3032,24 +6104,10 @@ def create_list(board_id):
 
 @app.route('/planner/board/<int:board_id>/task/create', methods=['POST'])
 @login_required
+@board_role_required('editor', 'You do not have permission to create tasks.')
 def create_task(board_id):
     form = TaskForm()
-    board = PlannerBoard.query.get_or_404(board_id)
-    
-    # Check permissions
-    is_member = BoardMember.query.filter(
-        BoardMember.board_id == board_id, 
-        BoardMember.user_id == current_user.id, 
-        BoardMember.role.in_(['editor', 'admin'])
-    ).first()
-    
-    if not is_member and board.owner_id != current_user.id:
-        flash('You do not have permission to create tasks.', 'danger')
-        return redirect(url_for('planner_board', board_id=board_id))
-    
-    form.list_id.choices = [(lst.id, lst.title) for lst in board.lists]
-    board_members = [bm.user for bm in board.board_members]
-    form.assigned_to.choices = [(0, 'Unassigned')] + [(user.id, user.name) for user in board_members]
+    set_task_form_choices(form, board_id)
     
     if form.validate_on_submit():
         assigned_to_id = form.assigned_to.data if form.assigned_to.data != 0 else None
@@ -3073,24 +6131,13 @@ def create_task(board_id):
 
 @app.route('/planner/board/<int:board_id>/invite', methods=['GET', 'POST'])
 @login_required
+@board_role_required('admin', 'You do not have permission to invite members.')
 def invite_to_board(board_id):
-    board = PlannerBoard.query.get_or_404(board_id)
+    board = db.session.get(PlannerBoard, board_id)
     form = BoardInviteForm()
     
-    # Check if current user is owner or admin
-    is_admin = (board.owner_id == current_user.id or 
-                BoardMember.query.filter_by(
-                    board_id=board_id, 
-                    user_id=current_user.id, 
-                    role='admin'
-                ).first() is not None)
-    
-    if not is_admin:
-        flash('You do not have permission to invite members.', 'danger')
-        return redirect(url_for('planner_board', board_id=board_id))
-    
     # Get current board members for display
-    board_members = BoardMember.query.filter_by(board_id=board_id).all()
+    board_members = BoardMember.query.options(joinedload(BoardMember.user)).filter_by(board_id=board_id).all()
     
     if form.validate_on_submit():
         email = form.email.data.strip()
@@ -3118,11 +6165,10 @@ def invite_to_board(board_id):
                 db.session.add(board_member)
                 
                 try:
+                    if user.email_notifications is not False:
+                        send_board_invitation_email(user.email, board, current_user.name)
                     db.session.commit()
                     
-                    # Send invitation notification (implement email sending logic)
-                    send_board_invitation_email(user.email, board.title, current_user.name)
-                    
                     flash(f'{user.name} has been invited to the board with {role} access.', 'success')
                 except Exception as e:
                     db.session.rollback()
@@ -3133,40 +6179,33 @@ def invite_to_board(board_id):
     
     return render_template('planner/invite.html', board=board, board_members=board_members, form=form)
 
-def send_board_invitation_email(recipient_email, board_title, inviter_name):
-    # Implement email sending logic
-    pass
+def send_board_invitation_email(recipient_email, board, inviter_name):
+    """
+    Queue an email telling a new member about the board. The caller commits.
+    """
+    board_url = url_for('planner_board', board_id=board.id, _external=True)
+    send_email(
+        to_email=recipient_email,
+        subject=f"{inviter_name} invited you to {board.title}",
+        body=f"""
+    Hello,
+
+    {inviter_name} has added you to the board '{board.title}' on SideForge.
+
+    Open the board: {board_url}
+
+    Best regards,
+    SideForge Team
+    """
+    )
 
 @app.route('/planner/task/<int:task_id>/toggle_status', methods=['POST'])
 @login_required
-def toggle_task_status(task_id):
+@board_role_required('editor', 'You do not have permission to modify tasks.')
+def toggle_task_status(task_id, board_id):
     try:
-        # Log the incoming request details
-        app.logger.info(f"Toggle task status request received for task_id: {task_id}")
-        app.logger.info(f"Current user: {current_user.id}")
-        
-        task = PlannerTask.query.get_or_404(task_id)
-        board = task.list.board
-        
-        # Log board and task details
-        app.logger.info(f"Board ID: {board.id}")
-        app.logger.info(f"Current task status: {task.status}")
-        
-        # Check permissions
-        is_member = BoardMember.query.filter(
-            BoardMember.board_id == board.id, 
-            BoardMember.user_id == current_user.id, 
-            BoardMember.role.in_(['editor', 'admin'])
-        ).first()
-        
-        # Log permission check
-        app.logger.info(f"Is member: {is_member is not None}")
-        app.logger.info(f"Board owner ID: {board.owner_id}")
-        
-        if not is_member and board.owner_id != current_user.id:
-            app.logger.warning(f"Unauthorized task status toggle attempt by user {current_user.id}")
-            flash('You do not have permission to modify tasks.', 'danger')
-            return redirect(url_for('planner_board', board_id=board.id))
+        # Loaded by the permission check
+        task = db.session.get(PlannerTask, task_id)
         
         # Toggle task status
         if task.status == 'done':
@@ -3179,7 +6218,7 @@ def toggle_task_status(task_id):
         db.session.commit()
         app.logger.info(f"Task {task_id} status updated successfully")
         flash('Task status updated successfully!', 'success')
-        return redirect(url_for('planner_board', board_id=board.id))
+        return redirect(url_for('planner_board', board_id=board_id))
     
     except Exception as e:
         db.session.rollback()
@@ -3189,30 +6228,21 @@ def toggle_task_status(task_id):
 
 @app.route('/planner/task/<int:task_id>/edit', methods=['GET', 'POST'])
 @login_required
-def edit_task(task_id):
-    task = PlannerTask.query.get_or_404(task_id)
-    board = task.list.board
-    
-    # Check permissions
-    is_member = BoardMember.query.filter(
-        BoardMember.board_id == board.id, 
-        BoardMember.user_id == current_user.id, 
-        BoardMember.role.in_(['editor', 'admin'])
-    ).first()
-    
-    if not is_member and board.owner_id != current_user.id:
-        flash('You do not have permission to edit tasks.', 'danger')
-        return redirect(url_for('planner_board', board_id=board.id))
+@board_role_required('editor', 'You do not have permission to edit tasks.')
+def edit_task(task_id, board_id):
+    # Loaded by the permission check
+    task = db.session.get(PlannerTask, task_id)
+    board = db.session.get(PlannerBoard, board_id)
     
     form = TaskForm()
-    form.list_id.choices = [(lst.id, lst.title) for lst in board.lists]
-    board_members = [bm.user for bm in board.board_members]
-    form.assigned_to.choices = [(0, 'Unassigned')] + [(user.id, user.name) for user in board_members]
+    set_task_form_choices(form, board_id)
     
     if form.validate_on_submit():
         task.title = form.title.data
         task.description = form.description.data
-        task.list_id = form.list_id.data
+        if form.list_id.data != task.list_id:
+            task.rank = rank_for_position(PlannerTask, form.list_id.data)
+            task.list_id = form.list_id.data
         task.assigned_to_id = form.assigned_to.data if form.assigned_to.data != 0 else None
         task.due_date = form.due_date.data
         task.status = form.status.data
@@ -3221,7 +6251,7 @@ def edit_task(task_id):
         
         db.session.commit()
         flash('Task updated successfully!', 'success')
-        return redirect(url_for('planner_board', board_id=board.id))
+        return redirect(url_for('planner_board', board_id=board_id))
     
     # Populate form with existing task data
     form.title.data = task.title
@@ -3236,20 +6266,9 @@ def edit_task(task_id):
 
 @app.route('/planner/board/<int:board_id>/settings', methods=['GET', 'POST'])
 @login_required
+@board_role_required('admin', 'You do not have permission to modify board settings.')
 def board_settings(board_id):
-    board = PlannerBoard.query.get_or_404(board_id)
-    
-    # Check if current user is the owner or an admin
-    if board.owner_id != current_user.id:
-        is_admin = BoardMember.query.filter(
-            BoardMember.board_id == board_id, 
-            BoardMember.user_id == current_user.id, 
-            BoardMember.role == 'admin'
-        ).first()
-        
-        if not is_admin:
-            flash('You do not have permission to modify board settings.', 'danger')
-            return redirect(url_for('planner_board', board_id=board_id))
+    board = db.session.get(PlannerBoard, board_id)
     
     form = BoardForm()
     
@@ -3269,29 +6288,27 @@ def board_settings(board_id):
     
     return render_template('planner/board_settings.html', form=form, board=board)
 
+# Boards with more tasks are hidden and purged in chunks in the background
+BOARD_DELETE_CHUNK_SIZE = int(os.environ.get('BOARD_DELETE_CHUNK_SIZE', 5000))
+
 @app.route('/planner/board/<int:board_id>/delete', methods=['POST'])
 @login_required
+@board_role_required('owner', 'Only the board owner can delete the board.')
 def delete_board(board_id):
-    board = PlannerBoard.query.get_or_404(board_id)
-    
-    # Check if current user is the owner
-    if board.owner_id != current_user.id:
-        flash('Only the board owner can delete the board.', 'danger')
-        return redirect(url_for('planner_board', board_id=board_id))
+    board = db.session.get(PlannerBoard, board_id)
     
     try:
-        # Delete all associated tasks
-        for list_item in board.lists:
-            PlannerTask.query.filter_by(list_id=list_item.id).delete()
-        
-        # Delete all lists
-        PlannerList.query.filter_by(board_id=board_id).delete()
-        
-        # Delete board members
-        BoardMember.query.filter_by(board_id=board_id).delete()
-        
-        # Delete the board itself
-        db.session.delete(board)
+        # Bounded probe instead of counting every task of a huge board
+        is_large = db.session.query(PlannerTask.id).join(
+            PlannerList, PlannerTask.list_id == PlannerList.id
+        ).filter(PlannerList.board_id == board_id).offset(BOARD_DELETE_CHUNK_SIZE).limit(1).first() is not None
+        
+        if is_large:
+            # Hidden right away; purge_deleted_boards removes it in chunks
+            board.deleted_at = datetime.utcnow()
+        else:
+            # Lists, tasks and members follow through ON DELETE CASCADE
+            db.session.delete(board)
         db.session.commit()
         
         flash('Board deleted successfully!', 'success')
@@ -3303,52 +6320,76 @@ def delete_board(board_id):
         flash('An error occurred while deleting the board.', 'danger')
         return redirect(url_for('planner_board', board_id=board_id))
 
-@app.route('/planner/task/delete', methods=['POST'])
-@login_required
-def delete_task():
-    task_id = request.form.get('task_id')
-    task = PlannerTask.query.get_or_404(task_id)
-    board = task.list.board
+def purge_deleted_boards(chunk_size=None):
+    """
+    Delete boards marked with deleted_at. Tasks go first, chunk_size rows
+    per transaction, so no single statement holds the write lock for long;
+    the board row then takes its lists and members with it.
     
-    # Check permissions
-    is_member = BoardMember.query.filter(
-        BoardMember.board_id == board.id, 
-        BoardMember.user_id == current_user.id, 
-        BoardMember.role.in_(['editor', 'admin'])
-    ).first()
+    Args:
+        chunk_size (int): Tasks deleted per transaction
     
-    if not is_member and board.owner_id != current_user.id:
-        flash('You do not have permission to delete tasks.', 'danger')
-        return redirect(url_for('planner_board', board_id=board.id))
+    Returns:
+        int: Number of boards purged
+    """
+    chunk_size = chunk_size or BOARD_DELETE_CHUNK_SIZE
+    board_ids = [board_id for (board_id,) in db.session.query(PlannerBoard.id).filter(
+        PlannerBoard.deleted_at.isnot(None)
+    )]
+    for board_id in board_ids:
+        board_list_ids = db.select(PlannerList.id).where(PlannerList.board_id == board_id)
+        deleted_tasks = 0
+        while True:
+            chunk = db.select(PlannerTask.id).where(PlannerTask.list_id.in_(board_list_ids)).limit(chunk_size)
+            deleted = db.session.execute(
+                db.delete(PlannerTask).where(PlannerTask.id.in_(chunk)),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            db.session.commit()
+            deleted_tasks += deleted
+            if deleted < chunk_size:
+                break
+        
+        db.session.execute(
+            db.delete(PlannerBoard).where(PlannerBoard.id == board_id),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        app.logger.info(f"Purged deleted board {board_id} with {deleted_tasks} tasks")
+    return len(board_ids)
+
+register_periodic_task('board-purger', 30, purge_deleted_boards)
+
+@planner_cli.command('purge-deleted')
+@click.option('--chunk-size', default=None, type=int, help='Tasks deleted per transaction.')
+def purge_deleted_boards_command(chunk_size):
+    """Delete boards waiting for background deletion now."""
+    click.echo(f"Purged {purge_deleted_boards(chunk_size)} board(s)")
+
+@app.route('/planner/board/<int:board_id>/task/delete', methods=['POST'])
+@login_required
+@board_role_required('editor', 'You do not have permission to delete tasks.', task_field='task_id')
+def delete_task(board_id):
+    # Loaded by the permission check, which also ensures it belongs to this board
+    task = db.session.get(PlannerTask, request.form.get('task_id', type=int))
     
     try:
         db.session.delete(task)
         db.session.commit()
+        
         flash('Task deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Error deleting task: {str(e)}")
         flash('An error occurred while deleting the task.', 'danger')
     
-    return redirect(url_for('planner_board', board_id=board.id))
+    return redirect(url_for('planner_board', board_id=board_id))
 
 @app.route('/planner/board/update', methods=['POST'])
 @login_required
-def update_board():
-    board_id = request.form.get('board_id')
-    board = PlannerBoard.query.get_or_404(board_id)
-    
-    # Check if current user is the owner or an admin
-    if board.owner_id != current_user.id:
-        is_admin = BoardMember.query.filter(
-            BoardMember.board_id == board_id, 
-            BoardMember.user_id == current_user.id, 
-            BoardMember.role == 'admin'
-        ).first()
-        
-        if not is_admin:
-            flash('You do not have permission to modify board settings.', 'danger')
-            return redirect(url_for('planner_board', board_id=board_id))
+@board_role_required('admin', 'You do not have permission to modify board settings.', board_field='board_id')
+def update_board(board_id):
+    board = db.session.get(PlannerBoard, board_id)
     
     form = BoardForm()
     
@@ -3365,6 +6406,1020 @@ def update_board():
     
     return redirect(url_for('planner_board', board_id=board_id))
 
+# Planner JSON API
+# Mutations for the board page's scripts. Each response carries only the
+# task or list that changed, so a toggle costs one small JSON body instead
+# of a full board render; the batch endpoint applies many task operations
+# in a single transaction.
+PLANNER_TASK_STATUSES = ('todo', 'in_progress', 'done')
+PLANNER_TASK_PRIORITIES = ('low', 'medium', 'high')
+PLANNER_BATCH_MAX_OPERATIONS = 500
+
+class PlannerRequestError(Exception):
+    """Raised for an invalid planner API request."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+class PlannerBoardScope:
+    """
+    List and member IDs of one board, each loaded with one query on first
+    use, for validating list_id and assigned_to_id values.
+    """
+
+    def __init__(self, board_id):
+        self.board_id = board_id
+
+    @functools.cached_property
+    def list_ids(self):
+        return {list_id for (list_id,) in db.session.query(PlannerList.id).filter(
+            PlannerList.board_id == self.board_id
+        )}
+
+    @functools.cached_property
+    def member_ids(self):
+        return {user_id for (user_id,) in db.session.query(BoardMember.user_id).filter(
+            BoardMember.board_id == self.board_id
+        )}
+
+def serialize_planner_task(task):
+    return {
+        'id': task.id,
+        'list_id': task.list_id,
+        'rank': task.rank,
+        'title': task.title,
+        'description': task.description,
+        'creator_id': task.creator_id,
+        'assigned_to_id': task.assigned_to_id,
+        'due_date': task.due_date.strftime('%Y-%m-%d') if task.due_date else None,
+        'status': task.status,
+        'priority': task.priority,
+        'is_completed': bool(task.is_completed),
+        'created_at': task.created_at.isoformat() if task.created_at else None,
+        'completed_at': task.completed_at.isoformat() if task.completed_at else None
+    }
+
+def serialize_planner_list(board_list):
+    return {
+        'id': board_list.id,
+        'board_id': board_list.board_id,
+        'title': board_list.title,
+        'rank': board_list.rank
+    }
+
+def get_planner_request_json():
+    """Return the JSON object body of the request or raise PlannerRequestError."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise PlannerRequestError('Request body must be a JSON object')
+    return data
+
+def set_planner_task_status(task, status):
+    """Set a task's status, keeping completed_at and is_completed in sync."""
+    if status == 'done':
+        if task.status != 'done':
+            task.mark_complete()
+    else:
+        task.status = status
+        task.completed_at = None
+        task.is_completed = False
+
+def clean_planner_task_fields(data, scope, partial=True):
+    """
+    Validate task fields from a JSON object the way TaskForm does.
+    
+    Args:
+        data (dict): Submitted fields; unknown keys are ignored
+        scope (PlannerBoardScope): The board the task belongs to
+        partial (bool): Whether title and list_id may be omitted
+    
+    Returns:
+        dict: Column name -> validated value for the submitted fields
+    """
+    fields = {}
+    
+    if 'title' in data or not partial:
+        title = data.get('title')
+        if not isinstance(title, str) or not 2 <= len(title.strip()) <= 200:
+            raise PlannerRequestError('title must be 2 to 200 characters')
+        fields['title'] = title.strip()
+    
+    if 'description' in data:
+        description = data['description']
+        if description is not None and (not isinstance(description, str) or len(description) > 500):
+            raise PlannerRequestError('description must be at most 500 characters')
+        fields['description'] = description
+    
+    if 'list_id' in data or not partial:
+        list_id = data.get('list_id')
+        if not isinstance(list_id, int) or list_id not in scope.list_ids:
+            raise PlannerRequestError('list_id must be a list on this board')
+        fields['list_id'] = list_id
+    
+    if 'assigned_to_id' in data:
+        assigned_to_id = data['assigned_to_id'] or None
+        if assigned_to_id is not None and (
+                not isinstance(assigned_to_id, int) or assigned_to_id not in scope.member_ids):
+            raise PlannerRequestError('assigned_to_id must be a member of this board')
+        fields['assigned_to_id'] = assigned_to_id
+    
+    if 'due_date' in data:
+        due_date = data['due_date']
+        if due_date:
+            try:
+                due_date = datetime.strptime(due_date, '%Y-%m-%d')
+            except (TypeError, ValueError):
+                raise PlannerRequestError('due_date must be formatted as YYYY-MM-DD')
+        fields['due_date'] = due_date or None
+    
+    if 'status' in data:
+        if data['status'] not in PLANNER_TASK_STATUSES:
+            raise PlannerRequestError(f"status must be one of {', '.join(PLANNER_TASK_STATUSES)}")
+        fields['status'] = data['status']
+    
+    if 'priority' in data:
+        if data['priority'] not in PLANNER_TASK_PRIORITIES:
+            raise PlannerRequestError(f"priority must be one of {', '.join(PLANNER_TASK_PRIORITIES)}")
+        fields['priority'] = data['priority']
+    
+    return fields
+
+def apply_planner_task_fields(task, fields):
+    """
+    Apply fields returned by clean_planner_task_fields to a task. A task
+    moved to another list is ranked at its end.
+    """
+    for name, value in fields.items():
+        if name == 'status':
+            set_planner_task_status(task, value)
+        elif name == 'list_id' and task.list_id is not None and value != task.list_id:
+            task.rank = rank_for_position(PlannerTask, value)
+            task.list_id = value
+        else:
+            setattr(task, name, value)
+
+def move_planner_task(task, list_id, after_id, before_id, scope):
+    """
+    Move a task to ``list_id`` (its own list if None), right after task
+    ``after_id`` and/or before task ``before_id``, or to the end.
+    """
+    list_id = task.list_id if list_id is None else list_id
+    if not isinstance(list_id, int) or list_id not in scope.list_ids:
+        raise PlannerRequestError('list_id must be a list on this board')
+    for neighbour_id in (after_id, before_id):
+        if neighbour_id is not None and (not isinstance(neighbour_id, int) or neighbour_id == task.id):
+            raise PlannerRequestError('after_id and before_id must be IDs of other tasks')
+    try:
+        task.rank = rank_for_position(PlannerTask, list_id, after_id, before_id)
+    except ValueError:
+        raise PlannerRequestError('after_id and before_id must be tasks in the target list')
+    task.list_id = list_id
+
+@app.errorhandler(PlannerRequestError)
+def planner_request_error(error):
+    db.session.rollback()
+    return jsonify({'error': error.message}), error.status_code
+
+@app.route('/api/planner/board/<int:board_id>/lists', methods=['POST'])
+@login_required
+@board_role_required('editor', 'You do not have permission to create lists.')
+def api_create_list(board_id):
+    data = get_planner_request_json()
+    title = data.get('title')
+    if not isinstance(title, str) or not 2 <= len(title.strip()) <= 100:
+        raise PlannerRequestError('title must be 2 to 100 characters')
+    
+    try:
+        new_list = PlannerList(title=title.strip(), board_id=board_id)
+        db.session.add(new_list)
+        db.session.commit()
+        return jsonify({'list': serialize_planner_list(new_list)}), 201
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error creating list on board {board_id}: {str(e)}")
+        return jsonify({'error': 'Failed to create list', 'details': str(e)}), 500
+
+@app.route('/api/planner/board/<int:board_id>/lists/<int:list_id>/move', methods=['POST'])
+@login_required
+@board_role_required('editor', 'You do not have permission to reorder lists.')
+def api_move_list(board_id, list_id):
+    """Move a list right after list ``after_id`` and/or before ``before_id``."""
+    data = get_planner_request_json()
+    board_list = PlannerList.query.filter_by(id=list_id, board_id=board_id).first()
+    if board_list is None:
+        raise PlannerRequestError('List not found on this board', 404)
+    after_id = data.get('after_id')
+    before_id = data.get('before_id')
+    if list_id in (after_id, before_id):
+        raise PlannerRequestError('after_id and before_id must be IDs of other lists')
+    try:
+        board_list.rank = rank_for_position(PlannerList, board_id, after_id, before_id)
+    except ValueError:
+        raise PlannerRequestError('after_id and before_id must be lists on this board')
+    
+    try:
+        db.session.commit()
+        return jsonify({'list': serialize_planner_list(board_list)})
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error moving list {list_id}: {str(e)}")
+        return jsonify({'error': 'Failed to move list', 'details': str(e)}), 500
+
+@app.route('/api/planner/board/<int:board_id>/tasks', methods=['POST'])
+@login_required
+@board_role_required('editor', 'You do not have permission to create tasks.')
+def api_create_task(board_id):
+    fields = clean_planner_task_fields(get_planner_request_json(), PlannerBoardScope(board_id), partial=False)
+    
+    try:
+        new_task = PlannerTask(creator_id=current_user.id, status='todo', priority='medium', is_completed=False)
+        apply_planner_task_fields(new_task, fields)
+        db.session.add(new_task)
+        db.session.commit()
+        return jsonify({'task': serialize_planner_task(new_task)}), 201
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error creating task on board {board_id}: {str(e)}")
+        return jsonify({'error': 'Failed to create task', 'details': str(e)}), 500
+
+@app.route('/api/planner/task/<int:task_id>', methods=['PATCH'])
+@login_required
+@board_role_required('editor', 'You do not have permission to edit tasks.')
+def api_update_task(task_id, board_id):
+    """
+    Update task fields. With ``after_id`` or ``before_id`` the task is
+    moved next to that task (in ``list_id`` if given); only its own row
+    is written.
+    """
+    data = get_planner_request_json()
+    scope = PlannerBoardScope(board_id)
+    fields = clean_planner_task_fields(data, scope)
+    # Loaded by the permission check
+    task = db.session.get(PlannerTask, task_id)
+    
+    if 'after_id' in data or 'before_id' in data:
+        move_planner_task(task, fields.pop('list_id', None), data.get('after_id'), data.get('before_id'), scope)
+    
+    try:
+        apply_planner_task_fields(task, fields)
+        db.session.commit()
+        return jsonify({'task': serialize_planner_task(task)})
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error updating task {task_id}: {str(e)}")
+        return jsonify({'error': 'Failed to update task', 'details': str(e)}), 500
+
+@app.route('/api/planner/task/<int:task_id>/toggle', methods=['POST'])
+@login_required
+@board_role_required('editor', 'You do not have permission to modify tasks.')
+def api_toggle_task(task_id, board_id):
+    # Loaded by the permission check
+    task = db.session.get(PlannerTask, task_id)
+    
+    try:
+        set_planner_task_status(task, 'todo' if task.status == 'done' else 'done')
+        db.session.commit()
+        return jsonify({'task': serialize_planner_task(task)})
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error toggling task {task_id}: {str(e)}")
+        return jsonify({'error': 'Failed to update task status', 'details': str(e)}), 500
+
+@app.route('/api/planner/task/<int:task_id>', methods=['DELETE'])
+@login_required
+@board_role_required('editor', 'You do not have permission to delete tasks.')
+def api_delete_task(task_id, board_id):
+    try:
+        # Loaded by the permission check
+        db.session.delete(db.session.get(PlannerTask, task_id))
+        db.session.commit()
+        return jsonify({'deleted': task_id})
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error deleting task {task_id}: {str(e)}")
+        return jsonify({'error': 'Failed to delete task', 'details': str(e)}), 500
+
+@app.route('/api/planner/board/<int:board_id>/batch', methods=['POST'])
+@login_required
+@board_role_required('editor', 'You do not have permission to modify tasks.')
+def api_batch_update_tasks(board_id):
+    """
+    Apply several task operations atomically. The body is
+    
+        {"operations": [
+            {"op": "move", "task_id": 1, "list_id": 2, "after_id": 7},
+            {"op": "status", "task_id": 3, "status": "done"},
+            {"op": "update", "task_id": 4, "title": "...", "priority": "high"},
+            {"op": "toggle", "task_id": 5},
+            {"op": "delete", "task_id": 6}
+        ]}
+    
+    A move goes to the end of the list unless ``after_id`` or ``before_id``
+    names the task to follow or precede. All tasks are loaded with one
+    query and must belong to the board. If any operation is invalid nothing
+    is changed and the error names its index.
+    Returns the changed tasks and the IDs of deleted ones.
+    """
+    operations = get_planner_request_json().get('operations')
+    if not isinstance(operations, list) or not operations:
+        raise PlannerRequestError('operations must be a non-empty list')
+    if len(operations) > PLANNER_BATCH_MAX_OPERATIONS:
+        raise PlannerRequestError(f'At most {PLANNER_BATCH_MAX_OPERATIONS} operations per batch')
+    if not all(isinstance(operation, dict) and isinstance(operation.get('task_id'), int)
+               for operation in operations):
+        raise PlannerRequestError('Every operation needs an integer task_id')
+    
+    task_ids = {operation['task_id'] for operation in operations}
+    tasks = {task.id: task for task in PlannerTask.query.join(
+        PlannerList, PlannerTask.list_id == PlannerList.id
+    ).filter(PlannerList.board_id == board_id, PlannerTask.id.in_(task_ids))}
+    
+    scope = PlannerBoardScope(board_id)
+    changed = {}
+    deleted = []
+    for index, operation in enumerate(operations):
+        op = operation.get('op')
+        task = tasks.get(operation['task_id'])
+        try:
+            if task is None:
+                raise PlannerRequestError('Task not found on this board', 404)
+            if op == 'move':
+                if not any(key in operation for key in ('list_id', 'after_id', 'before_id')):
+                    raise PlannerRequestError('move needs a list_id, after_id or before_id')
+                move_planner_task(task, operation.get('list_id'), operation.get('after_id'),
+                                  operation.get('before_id'), scope)
+            elif op == 'status':
+                if 'status' not in operation:
+                    raise PlannerRequestError('status needs a status')
+                apply_planner_task_fields(task, clean_planner_task_fields({'status': operation['status']}, scope))
+            elif op == 'update':
+                apply_planner_task_fields(task, clean_planner_task_fields(operation, scope))
+            elif op == 'toggle':
+                set_planner_task_status(task, 'todo' if task.status == 'done' else 'done')
+            elif op == 'delete':
+                db.session.delete(task)
+                del tasks[task.id]
+                changed.pop(task.id, None)
+                deleted.append(task.id)
+                continue
+            else:
+                raise PlannerRequestError(f'Unknown operation: {op}')
+        except PlannerRequestError as e:
+            db.session.rollback()
+            return jsonify({'error': e.message, 'operation': index}), e.status_code
+        changed[task.id] = task
+    
+    try:
+        db.session.commit()
+        return jsonify({
+            'tasks': [serialize_planner_task(task) for task in changed.values()],
+            'deleted': deleted
+        })
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error applying task batch on board {board_id}: {str(e)}")
+        return jsonify({'error': 'Failed to apply operations', 'details': str(e)}), 500
+
+# Board change feed
+# Task, list and board changes are written to board_events in the same
+# transaction that makes them and pushed to the board's Server-Sent Events
+# streams by a per-process hub. The backend decides how a worker learns
+# about events committed by other workers:
+#   poll  - read new board_events rows every BOARD_EVENTS_POLL_INTERVAL (default)
+#   redis - publish after commit and subscribe to a Redis channel (REDIS_URL)
+#   local - deliver after commit inside this process only (tests, one worker)
+# Polling relies on event IDs becoming visible in order, which holds for
+# SQLite's single writer; use redis with PostgreSQL. Every open stream holds
+# a thread, so run gunicorn with gthread or gevent workers.
+BOARD_EVENTS_BACKEND = os.environ.get('BOARD_EVENTS_BACKEND', 'poll')
+BOARD_EVENTS_POLL_INTERVAL = float(os.environ.get('BOARD_EVENTS_POLL_INTERVAL', 1.0))  # seconds
+BOARD_EVENTS_HEARTBEAT = int(os.environ.get('BOARD_EVENTS_HEARTBEAT', 15))  # seconds
+BOARD_EVENTS_BUFFER_SIZE = int(os.environ.get('BOARD_EVENTS_BUFFER_SIZE', 100))  # events per stream
+BOARD_EVENTS_REPLAY_LIMIT = 500
+BOARD_EVENTS_RETENTION = timedelta(hours=1)
+BOARD_EVENTS_REDIS_CHANNEL = 'sideforge:board-events'
+
+def _has_column_changes(target):
+    state = db.inspect(target)
+    return any(state.attrs[attr.key].history.has_changes() for attr in state.mapper.column_attrs)
+
+def record_board_event(connection, target, board_id, kind, payload):
+    """
+    Append an event to board_events on the flushing connection and queue
+    it on the session for publishing once the transaction commits.
+    """
+    data = json.dumps(payload)
+    result = connection.execute(BoardEvent.__table__.insert().values(
+        board_id=board_id, kind=kind, data=data, created_at=datetime.utcnow()
+    ))
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('board_events', []).append({
+            'id': result.inserted_primary_key[0], 'board_id': board_id, 'kind': kind, 'data': data
+        })
+
+def _task_board_id(connection, task):
+    return connection.execute(
+        db.select(PlannerList.board_id).where(PlannerList.id == task.list_id)
+    ).scalar()
+
+def _board_event_listener(kind, get_board_id, serialize):
+    def listener(mapper, connection, target):
+        if kind.endswith('.updated') and not _has_column_changes(target):
+            return
+        board_id = get_board_id(connection, target)
+        if board_id is not None:
+            record_board_event(connection, target, board_id, kind, serialize(target))
+    return listener
+
+for _model, _name, _get_board_id, _serialize, _serialize_deleted in (
+    (PlannerTask, 'task', _task_board_id, serialize_planner_task,
+     lambda task: {'id': task.id, 'list_id': task.list_id}),
+    (PlannerList, 'list', lambda connection, board_list: board_list.board_id,
+     serialize_planner_list, lambda board_list: {'id': board_list.id}),
+):
+    event.listen(_model, 'after_insert', _board_event_listener(f'{_name}.created', _get_board_id, _serialize))
+    event.listen(_model, 'after_update', _board_event_listener(f'{_name}.updated', _get_board_id, _serialize))
+    event.listen(_model, 'after_delete', _board_event_listener(f'{_name}.deleted', _get_board_id, _serialize_deleted))
+
+event.listen(PlannerBoard, 'after_update', _board_event_listener(
+    'board.updated', lambda connection, board: board.id if board.deleted_at is None else None,
+    lambda board: {'id': board.id, 'title': board.title, 'description': board.description,
+                   'is_public': bool(board.is_public)}
+))
+# Boards deleted in the background are announced when they are hidden
+event.listen(PlannerBoard, 'after_update', _board_event_listener(
+    'board.deleted', lambda connection, board: board.id if board.deleted_at is not None else None,
+    lambda board: {'id': board.id}
+))
+event.listen(PlannerBoard, 'after_delete', _board_event_listener(
+    'board.deleted', lambda connection, board: board.id, lambda board: {'id': board.id}
+))
+
+@event.listens_for(Session, 'after_commit')
+def _publish_board_events(session):
+    events = session.info.pop('board_events', None)
+    if events:
+        board_event_hub.publish(events)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_board_events(session):
+    session.info.pop('board_events', None)
+
+class BoardEventSubscription:
+    """A connected stream: a bounded buffer of events for one board."""
+
+    def __init__(self, board_id, max_events):
+        self.board_id = board_id
+        self.overflowed = False
+        self._events = queue.Queue(maxsize=max_events)
+
+    def offer(self, message):
+        """Buffer an event; a client that falls this far behind must resync."""
+        try:
+            self._events.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def next_event(self, timeout):
+        """Return the next buffered event, or None after ``timeout`` seconds."""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class BoardEventHub:
+    """
+    Fans events out to the streams connected to this process. The backend
+    is started with the first subscription.
+    """
+
+    def __init__(self, backend, buffer_size):
+        self.backend = backend
+        self.buffer_size = buffer_size
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def subscribe(self, board_id):
+        subscription = BoardEventSubscription(board_id, self.buffer_size)
+        with self._lock:
+            self._subscriptions.setdefault(board_id, set()).add(subscription)
+            if not self._started:
+                self._started = True
+                self.backend.start(self)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.board_id)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.board_id]
+
+    def publish(self, events):
+        """Hand events committed in this process to the backend."""
+        try:
+            self.backend.publish(events)
+        except Exception as e:
+            # The events are in board_events; streams catch up on reconnect
+            app.logger.error(f"Could not publish board events: {str(e)}")
+
+    def dispatch(self, events):
+        """Deliver events to the local streams of their boards."""
+        with self._lock:
+            targets = [(message, list(self._subscriptions.get(message['board_id'], ())))
+                       for message in events]
+        for message, subscriptions in targets:
+            for subscription in subscriptions:
+                subscription.offer(message)
+
+class LocalBoardEventBackend:
+    """Delivers events inside the committing process only."""
+
+    def start(self, hub):
+        self.hub = hub
+
+    def publish(self, events):
+        if getattr(self, 'hub', None):
+            self.hub.dispatch(events)
+
+class PollingBoardEventBackend:
+    """Reads new board_events rows, so commits of every process are seen."""
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def start(self, hub):
+        threading.Thread(target=self._run, args=(hub,), name='board-event-poller', daemon=True).start()
+
+    def publish(self, events):
+        pass  # Picked up by the next poll
+
+    def _run(self, hub):
+        last_id = None
+        while True:
+            with app.app_context():
+                try:
+                    if last_id is None:
+                        last_id = db.session.query(func.max(BoardEvent.id)).scalar() or 0
+                    else:
+                        rows = BoardEvent.query.filter(BoardEvent.id > last_id).order_by(BoardEvent.id).limit(1000).all()
+                        if rows:
+                            last_id = rows[-1].id
+                            hub.dispatch([row.to_message() for row in rows])
+                except Exception as e:
+                    app.logger.error(f"Polling board events failed: {str(e)}")
+                finally:
+                    db.session.remove()
+            time.sleep(self.interval)
+
+class RedisBoardEventBackend:
+    """Publishes committed events on a Redis channel every worker subscribes to."""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('BOARD_EVENTS_BACKEND=redis requires the redis package')
+        self.client = redis.Redis.from_url(url)
+
+    def start(self, hub):
+        threading.Thread(target=self._run, args=(hub,), name='board-event-subscriber', daemon=True).start()
+
+    def publish(self, events):
+        self.client.publish(BOARD_EVENTS_REDIS_CHANNEL, json.dumps(events))
+
+    def _run(self, hub):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(BOARD_EVENTS_REDIS_CHANNEL)
+                for message in pubsub.listen():
+                    hub.dispatch(json.loads(message['data']))
+            except Exception as e:
+                app.logger.error(f"Redis board event subscription failed: {str(e)}")
+                time.sleep(1)
+
+def create_board_event_backend(name):
+    if name == 'poll':
+        return PollingBoardEventBackend(BOARD_EVENTS_POLL_INTERVAL)
+    if name == 'redis':
+        return RedisBoardEventBackend(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    if name == 'local':
+        return LocalBoardEventBackend()
+    raise ValueError(f"Unknown BOARD_EVENTS_BACKEND: {name}")
+
+board_event_hub = BoardEventHub(create_board_event_backend(BOARD_EVENTS_BACKEND), BOARD_EVENTS_BUFFER_SIZE)
+
+def format_server_sent_event(kind, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {kind}')
+    lines.extend(f'data: {line}' for line in data.split('\n'))
+    return '\n'.join(lines) + '\n\n'
+
+def prune_board_events():
+    """Delete change-log entries older than BOARD_EVENTS_RETENTION."""
+    cutoff = datetime.utcnow() - BOARD_EVENTS_RETENTION
+    deleted = BoardEvent.query.filter(BoardEvent.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    if deleted:
+        app.logger.info(f"Pruned {deleted} board events")
+
+register_periodic_task('board-event-pruner', 600, prune_board_events)
+
+@app.route('/planner/board/<int:board_id>/events')
+@login_required
+@board_role_required('viewer', 'You do not have access to this board.')
+def board_event_stream(board_id):
+    """
+    Server-Sent Events stream of a board's changes. A reconnecting client
+    sends Last-Event-ID and first receives what it missed; if that is more
+    than BOARD_EVENTS_REPLAY_LIMIT events, or its buffer overflows, it gets
+    a ``resync`` event and should reload the board.
+    """
+    user_id = current_user.id
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get('last_event_id', type=int)
+    
+    # Subscribe before reading the backlog so nothing falls in between
+    subscription = board_event_hub.subscribe(board_id)
+    resync = False
+    if last_event_id is None:
+        replay = []
+        last_event_id = db.session.query(func.max(BoardEvent.id)).scalar() or 0
+    else:
+        replay = [row.to_message() for row in BoardEvent.query.filter(
+            BoardEvent.board_id == board_id, BoardEvent.id > last_event_id
+        ).order_by(BoardEvent.id).limit(BOARD_EVENTS_REPLAY_LIMIT + 1)]
+        resync = len(replay) > BOARD_EVENTS_REPLAY_LIMIT
+    # The stream may stay open for hours; do not hold a connection
+    db.session.remove()
+    
+    def generate():
+        last_sent = last_event_id
+        try:
+            yield f'retry: {BOARD_EVENTS_HEARTBEAT * 1000}\n\n'
+            if resync:
+                yield format_server_sent_event('resync', '{}')
+                return
+            for message in replay:
+                yield format_server_sent_event(message['kind'], message['data'], message['id'])
+                last_sent = message['id']
+            
+            while True:
+                if subscription.overflowed:
+                    yield format_server_sent_event('resync', '{}')
+                    return
+                message = subscription.next_event(BOARD_EVENTS_HEARTBEAT)
+                if message is None:
+                    # Heartbeats also detect closed connections; members who
+                    # lost access are disconnected here
+                    with app.app_context():
+                        try:
+                            role = resolve_board_role(user_id, board_id)
+                        finally:
+                            db.session.remove()
+                    if role is None:
+                        return
+                    yield ': heartbeat\n\n'
+                elif message['id'] > last_sent:
+                    yield format_server_sent_event(message['kind'], message['data'], message['id'])
+                    last_sent = message['id']
+        finally:
+            board_event_hub.unsubscribe(subscription)
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+# Full-text search
+# Task and board titles/descriptions and cloud file names are indexed by
+# FTS5 tables kept in sync by triggers on SQLite, and by generated tsvector
+# columns with GIN indexes on PostgreSQL. Queries join the index to the base
+# tables, so ranking, prefix matching and access control all run in SQL.
+# Batch migrations that recreate an indexed table must recreate its triggers.
+# Indexed table -> (column, SQLite bm25 weight, PostgreSQL weight class)
+SEARCH_INDEXED_COLUMNS = {
+    'planner_tasks': (('title', 10.0, 'A'), ('description', 1.0, 'B')),
+    'planner_boards': (('title', 10.0, 'A'), ('description', 1.0, 'B')),
+    'user_cloud_storage': (('file_name', 1.0, 'A'),),
+}
+SEARCH_TYPES = ('tasks', 'boards', 'files')
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 50
+SEARCH_MAX_TERMS = 8
+SEARCH_TERM_PATTERN = re.compile(r'\w+')
+SEARCH_FTS_OPTIONS = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+
+def sqlite_search_ddl(table, columns, options=SEARCH_FTS_OPTIONS):
+    """FTS5 table and sync triggers for an external-content index of ``table``."""
+    names = ', '.join(column for column, _, _ in columns)
+    new_values = ', '.join(f'new.{column}' for column, _, _ in columns)
+    old_values = ', '.join(f'old.{column}' for column, _, _ in columns)
+    fts = f'{table}_fts'
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values});"
+    delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table}', "
+        f"content_rowid='id', {options})",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END",
+    ]
+
+def postgresql_search_ddl(table, columns):
+    """Generated, weighted tsvector column of ``table`` and its GIN index."""
+    vector = ' || '.join(
+        f"setweight(to_tsvector('simple', coalesce({column}, '')), '{weight_class}')"
+        for column, _, weight_class in columns
+    )
+    return [
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({vector}) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)",
+    ]
+
+# db.create_all() builds the indexes too; migrations do the same for existing databases
+for _table, _columns in SEARCH_INDEXED_COLUMNS.items():
+    for _statement in sqlite_search_ddl(_table, _columns):
+        event.listen(db.metadata, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+    for _statement in postgresql_search_ddl(_table, _columns):
+        event.listen(db.metadata, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+    event.listen(db.metadata, 'before_drop', DDL(f'DROP TABLE IF EXISTS {_table}_fts').execute_if(dialect='sqlite'))
+
+def search_query_terms(query):
+    """Split user input into lowercase word terms; punctuation is dropped."""
+    return SEARCH_TERM_PATTERN.findall(query.lower())[:SEARCH_MAX_TERMS]
+
+def search_clauses(model, terms):
+    """
+    Build the dialect's full-text clauses for a model. Every term matches
+    as a prefix and all terms must match.
+    
+    Args:
+        model: PlannerTask, PlannerBoard or UserCloudStorage
+        terms (list): Terms from search_query_terms
+    
+    Returns:
+        tuple: (index table and join condition, or None), match condition,
+        order by clause (best first)
+    """
+    table = model.__tablename__
+    if db.engine.dialect.name == 'postgresql':
+        tsquery = func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        vector = db.literal_column(f'{table}.search_vector')
+        return None, vector.op('@@')(tsquery), func.ts_rank(vector, tsquery).desc()
+    
+    fts = db.table(f'{table}_fts', db.column('rowid'))
+    fts_name = db.literal_column(fts.name)
+    weights = [weight for _, weight, _ in SEARCH_INDEXED_COLUMNS[table]]
+    match = ' '.join(f'"{term}"*' for term in terms)
+    return (fts, fts.c.rowid == model.id), fts_name.op('MATCH')(match), func.bm25(fts_name, *weights).asc()
+
+def _search_query(model, terms, *columns):
+    index_join, match, order = search_clauses(model, terms)
+    query = db.session.query(*columns).select_from(model)
+    if index_join is not None:
+        query = query.join(*index_join)
+    return query.filter(match), order
+
+def board_access_filter(user_id):
+    """Boards the user owns or is a member of, excluding deleted ones."""
+    return db.and_(
+        PlannerBoard.deleted_at.is_(None),
+        db.or_(
+            PlannerBoard.owner_id == user_id,
+            db.exists().where(BoardMember.board_id == PlannerBoard.id, BoardMember.user_id == user_id)
+        )
+    )
+
+def search_tasks(user_id, terms, limit):
+    query, order = _search_query(
+        PlannerTask, terms,
+        PlannerTask.id, PlannerTask.title, PlannerTask.status, PlannerTask.list_id,
+        PlannerBoard.id, PlannerBoard.title
+    )
+    rows = query.join(PlannerList, PlannerTask.list_id == PlannerList.id).join(
+        PlannerBoard, PlannerList.board_id == PlannerBoard.id
+    ).filter(board_access_filter(user_id)).order_by(order).limit(limit).all()
+    return [{
+        'id': task_id,
+        'title': title,
+        'status': status,
+        'list_id': list_id,
+        'board_id': board_id,
+        'board_title': board_title,
+        'url': url_for('planner_board', board_id=board_id)
+    } for task_id, title, status, list_id, board_id, board_title in rows]
+
+def search_boards(user_id, terms, limit):
+    query, order = _search_query(
+        PlannerBoard, terms, PlannerBoard.id, PlannerBoard.title, PlannerBoard.description
+    )
+    rows = query.filter(board_access_filter(user_id)).order_by(order).limit(limit).all()
+    return [{
+        'id': board_id,
+        'title': title,
+        'description': description,
+        'url': url_for('planner_board', board_id=board_id)
+    } for board_id, title, description in rows]
+
+def search_files(user_id, terms, limit):
+    query, order = _search_query(
+        UserCloudStorage, terms,
+        UserCloudStorage.id, UserCloudStorage.file_name, UserCloudStorage.file_size,
+        UserCloudStorage.file_type, UserCloudStorage.uploaded_at
+    )
+    rows = query.filter(UserCloudStorage.user_id == user_id).order_by(order).limit(limit).all()
+    return [{
+        'id': file_id,
+        'filename': file_name,
+        'size': file_size,
+        'type': file_type,
+        'uploaded_at': uploaded_at.isoformat() if uploaded_at else None,
+        'url': url_for('download_cloud_file', file_id=file_id)
+    } for file_id, file_name, file_size, file_type, uploaded_at in rows]
+
+SEARCHERS = {
+    'tasks': search_tasks,
+    'boards': search_boards,
+    'files': search_files
+}
+
+@app.route('/search', methods=['GET'])
+@login_required
+def search():
+    """
+    Search the current user's tasks, boards and files.
+    
+    Query parameters:
+        q: Search text; every word matches as a prefix
+        types: Comma-separated subset of tasks, boards, files (default all)
+        limit: Results per type (default 20, at most 50)
+    """
+    query = request.args.get('q', '').strip()
+    types = [t for t in request.args.get('types', ','.join(SEARCH_TYPES)).split(',') if t]
+    if not types or any(t not in SEARCH_TYPES for t in types):
+        return jsonify({'error': f"types must be a subset of {', '.join(SEARCH_TYPES)}"}), 400
+    limit = min(max(request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int), 1), SEARCH_MAX_LIMIT)
+    
+    terms = search_query_terms(query)
+    if not terms:
+        return jsonify({'query': query, 'results': {t: [] for t in types}})
+    
+    try:
+        results = {t: SEARCHERS[t](current_user.id, terms, limit) for t in types}
+        return jsonify({'query': query, 'results': results})
+    except Exception as e:
+        app.logger.error(f"Search failed for {query!r}: {str(e)}")
+        return jsonify({'error': 'Search failed', 'details': str(e)}), 500
+
+# User directory search
+# The share dialog looks users up by username or email. Exact and prefix
+# matches use indexes on lowercase copies of both columns; substring matches
+# (3+ characters) use a trigram index: an FTS5 trigram table on SQLite,
+# pg_trgm GIN indexes on PostgreSQL. Results rank exact, then prefix, then
+# substring matches, and recent queries are cached per process.
+USER_SEARCH_LIMIT = 10
+USER_SEARCH_MIN_SUBSTRING = 3  # shortest term a trigram index can answer
+USER_SEARCH_CACHE_TTL = int(os.environ.get('USER_SEARCH_CACHE_TTL', 15))  # seconds
+USER_SEARCH_DEBOUNCE_MS = int(os.environ.get('USER_SEARCH_DEBOUNCE_MS', 150))
+USER_DIRECTORY_COLUMNS = (('username', 1.0, None), ('email', 1.0, None))
+
+for _statement in sqlite_search_ddl('user', USER_DIRECTORY_COLUMNS, options="tokenize='trigram'"):
+    event.listen(db.metadata, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ix_user_username_lower_trgm ON "user" USING GIN (username_lower gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_user_email_lower_trgm ON "user" USING GIN (email_lower gin_trgm_ops)',
+]:
+    event.listen(db.metadata, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+event.listen(db.metadata, 'before_drop', DDL('DROP TABLE IF EXISTS user_fts').execute_if(dialect='sqlite'))
+
+def normalize_directory_term(value):
+    """Lowercase form stored in, and matched against, the directory columns."""
+    return (value or '').strip().lower()
+
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def _sync_user_directory_columns(mapper, connection, target):
+    target.username_lower = normalize_directory_term(target.username)
+    target.email_lower = normalize_directory_term(target.email)
+
+class UserDirectoryCache:
+    """
+    Per-process LRU of query -> search results that expire after ``ttl``
+    seconds. Absorbs the repeated lookups of a user refining a query.
+    """
+
+    def __init__(self, ttl, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query):
+        """Return the cached results, or None."""
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is None:
+                return None
+            results, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[query]
+                return None
+            self._entries.move_to_end(query)
+            return results
+
+    def set(self, query, results):
+        with self._lock:
+            self._entries[query] = (results, time.monotonic() + self.ttl)
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+user_directory_cache = UserDirectoryCache(USER_SEARCH_CACHE_TTL)
+
+def directory_prefix_filter(column, prefix):
+    """Index-friendly ``column starts with prefix`` condition."""
+    if db.engine.dialect.name == 'postgresql':
+        return column.startswith(prefix, autoescape=True)
+    # SQLite only uses an index for LIKE with case_sensitive_like, so use the
+    # equivalent range instead
+    return db.and_(column >= prefix, column < prefix + chr(0x10FFFF))
+
+def directory_substring_query(query, term):
+    """Restrict ``query`` to users whose username or email contains ``term``."""
+    if db.engine.dialect.name == 'postgresql':
+        return query.filter(db.or_(
+            User.username_lower.contains(term, autoescape=True),
+            User.email_lower.contains(term, autoescape=True)
+        ))
+    fts = db.table('user_fts', db.column('rowid'))
+    phrase = '"' + term.replace('"', '""') + '"'
+    return query.join(fts, fts.c.rowid == User.id).filter(db.literal_column('user_fts').op('MATCH')(phrase))
+
+def search_user_directory(query, limit=USER_SEARCH_LIMIT + 1):
+    """
+    Look users up by username or email. Every step is an index lookup that
+    stops after ``limit`` rows, so the cost does not grow with the directory.
+    
+    Args:
+        query (str): Term normalized with normalize_directory_term
+        limit (int): Maximum number of users; one more than the page size
+            leaves room for dropping the searching user
+    
+    Returns:
+        list: {'id', 'username', 'email'} dicts, exact matches first, then
+        prefix matches (shortest first), then substring matches
+    """
+    cached = user_directory_cache.get(query)
+    if cached is not None:
+        return cached
+    
+    columns = (User.id, User.username, User.email)
+    found = OrderedDict()
+    
+    def add(rows):
+        for user_id, username, email, *_ in rows:
+            found.setdefault(user_id, {'id': user_id, 'username': username, 'email': email})
+    
+    add(db.session.query(*columns).filter(
+        db.or_(User.username_lower == query, User.email_lower == query)
+    ).limit(limit))
+    
+    if len(found) < limit:
+        # One range scan per column in index order, merged here, avoids
+        # sorting every prefix match in SQL
+        prefix_rows = []
+        for column in (User.username_lower, User.email_lower):
+            prefix_rows += db.session.query(*columns, column).filter(
+                directory_prefix_filter(column, query)
+            ).order_by(column).limit(limit).all()
+        prefix_rows.sort(key=lambda row: (len(row[3]), row[3]))
+        add(prefix_rows)
+    
+    if len(found) < limit and len(query) >= USER_SEARCH_MIN_SUBSTRING:
+        add(directory_substring_query(
+            db.session.query(*columns), query
+        ).limit(limit + len(found)))
+    
+    results = list(found.values())[:limit]
+    user_directory_cache.set(query, results)
+    return results
+
 # Add these to your database initialization or migration script
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 80))
@@ -3401,33 +7456,3 @@ def configure_logging(app):
 
 # Call logging configuration
 configure_logging(app)
-
-@app.route('/planner/board/<int:board_id>/task/delete', methods=['POST'])
-@login_required
-def delete_task(board_id):
-    task_id = request.form.get('task_id')
-    task = PlannerTask.query.get_or_404(task_id)
-    board = task.list.board
-    
-    # Check permissions
-    is_member = BoardMember.query.filter(
-        BoardMember.board_id == board_id, 
-        BoardMember.user_id == current_user.id, 
-        BoardMember.role.in_(['editor', 'admin'])
-    ).first()
-    
-    if not is_member and board.owner_id != current_user.id:
-        flash('You do not have permission to delete tasks.', 'danger')
-        return redirect(url_for('planner_board', board_id=board_id))
-    
-    try:
-        db.session.delete(task)
-        db.session.commit()
-        
-        flash('Task deleted successfully!', 'success')
-    except Exception as e:
-        db.session.rollback()
-        app.logger.error(f"Error deleting task: {str(e)}")
-        flash('An error occurred while deleting the task.', 'danger')
-    
-    return redirect(url_for('planner_board', board_id=board_id))
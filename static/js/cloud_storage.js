@@ -62,24 +62,42 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    // Fetch user files
-    async function fetchUserFiles() {
+    const FILES_PAGE_SIZE = 50;
+    let nextFilesCursor = null;
+
+    // Fetch user files; with append, the next page is added to the list
+    async function fetchUserFiles(append = false) {
         try {
-            const response = await fetch('/cloud/files');
+            const params = new URLSearchParams({
+                limit: FILES_PAGE_SIZE,
+                fields: 'id,filename,size,type'
+            });
+            if (append && nextFilesCursor) {
+                params.set('cursor', nextFilesCursor);
+            }
+
+            const response = await fetch(`/cloud/files?${params}`);
             if (!response.ok) {
                 throw new Error('Fehler beim Abrufen von Dateien');
             }
-            const files = await response.json();
+            const page = await response.json();
+            const files = page.files;
+            nextFilesCursor = page.next_cursor;
             
             const filesList = document.getElementById('files-list');
             const noFilesMessage = document.getElementById('no-files');
+            const loadMoreFiles = document.getElementById('load-more-files');
             
-            // Clear existing list
-            filesList.innerHTML = '';
+            loadMoreFiles.style.display = nextFilesCursor ? 'block' : 'none';
             
-            if (!files || files.length === 0) {
-                noFilesMessage.style.display = 'block';
-                return;
+            if (!append) {
+                // Clear existing list
+                filesList.innerHTML = '';
+                
+                if (!files || files.length === 0) {
+                    noFilesMessage.style.display = 'block';
+                    return;
+                }
             }
             
             noFilesMessage.style.display = 'none';
@@ -182,23 +200,158 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    // File Upload with Enhanced Error Handling
-    async function uploadFile(file) {
+    // Files above this size use the resumable chunked upload API
+    const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+    const PARALLEL_CHUNK_UPLOADS = 4;
+    const CHUNK_RETRIES = 3;
+
+    function setUploadProgress(fraction) {
+        const percent = `${Math.round(fraction * 100)}%`;
+        uploadProgress.style.width = percent;
+        uploadProgress.textContent = percent;
+    }
+
+    async function postSingleUpload(file) {
         const formData = new FormData();
         formData.append('file', file);
 
-        try {
-            const response = await fetch('/cloud/upload', {
-                method: 'POST',
-                body: formData
-            });
+        const response = await fetch('/cloud/upload', {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCsrfToken()
+            },
+            body: formData
+        });
 
-            const result = await response.json();
+        const result = await response.json();
 
-            if (!response.ok) {
-                throw new Error(result.error || 'Upload failed');
+        if (!response.ok) {
+            throw new Error(result.error || 'Upload failed');
+        }
+
+        return result;
+    }
+
+    // Key under which an unfinished upload of this file is remembered
+    function uploadResumeKey(file) {
+        return `cloud-upload:${file.name}:${file.size}:${file.lastModified}`;
+    }
+
+    async function openUploadSession(file) {
+        const resumeKey = uploadResumeKey(file);
+        const previousId = localStorage.getItem(resumeKey);
+
+        if (previousId) {
+            const response = await fetch(`/cloud/uploads/${previousId}`);
+            if (response.ok) {
+                return await response.json();
+            }
+            localStorage.removeItem(resumeKey);
+        }
+
+        const response = await fetch('/cloud/uploads', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCsrfToken()
+            },
+            body: JSON.stringify({
+                filename: file.name,
+                size: file.size,
+                type: file.type || 'application/octet-stream'
+            })
+        });
+
+        const result = await response.json();
+
+        if (!response.ok) {
+            throw new Error(result.error || 'Upload failed');
+        }
+
+        localStorage.setItem(resumeKey, result.upload_id);
+        return result;
+    }
+
+    async function putChunk(session, file, chunkIndex) {
+        const offset = chunkIndex * session.chunk_size;
+        const blob = file.slice(offset, Math.min(offset + session.chunk_size, file.size));
+
+        for (let attempt = 1; ; attempt++) {
+            try {
+                const response = await fetch(`/cloud/uploads/${session.upload_id}/chunks/${offset}`, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'X-CSRFToken': getCsrfToken()
+                    },
+                    body: blob
+                });
+
+                if (response.ok) {
+                    return blob.size;
+                }
+
+                const result = await response.json().catch(() => ({}));
+                // Client errors will not succeed on retry
+                if (response.status < 500 || attempt >= CHUNK_RETRIES) {
+                    throw new Error(result.error || 'Chunk upload failed');
+                }
+            } catch (error) {
+                if (attempt >= CHUNK_RETRIES) {
+                    throw error;
+                }
             }
 
+            await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+        }
+    }
+
+    async function chunkedUpload(file) {
+        const session = await openUploadSession(file);
+        const pending = [...session.missing_chunks];
+        let uploadedBytes = session.received_bytes;
+
+        setUploadProgress(file.size ? uploadedBytes / file.size : 0);
+
+        // Each worker takes the next missing chunk until none are left
+        async function worker() {
+            while (pending.length) {
+                const chunkIndex = pending.shift();
+                uploadedBytes += await putChunk(session, file, chunkIndex);
+                setUploadProgress(file.size ? uploadedBytes / file.size : 1);
+            }
+        }
+
+        await Promise.all(
+            Array.from({ length: Math.min(PARALLEL_CHUNK_UPLOADS, pending.length) }, worker)
+        );
+
+        const response = await fetch(`/cloud/uploads/${session.upload_id}/finalize`, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCsrfToken()
+            }
+        });
+
+        const result = await response.json();
+
+        if (!response.ok) {
+            throw new Error(result.error || 'Upload failed');
+        }
+
+        localStorage.removeItem(uploadResumeKey(file));
+        return result;
+    }
+
+    // File Upload with Enhanced Error Handling
+    async function uploadFile(file) {
+        try {
+            const result = file.size > CHUNKED_UPLOAD_THRESHOLD
+                ? await chunkedUpload(file)
+                : await postSingleUpload(file);
+
+            setUploadProgress(1);
+
             // Show success message
             showAlert(result.message || 'Datei erfolgreich hochgeladen', 'success');
 
@@ -214,6 +367,8 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     // Event Listeners
+    document.querySelector('#load-more-files button').addEventListener('click', () => fetchUserFiles(true));
+
     fileUpload.addEventListener('change', async (event) => {
         const file = event.target.files[0];
         if (!file) {
@@ -285,29 +440,21 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Download file
     async function downloadFile(fileId) {
+        const url = `/cloud/files/${fileId}/download`;
         try {
-            const response = await fetch(`/cloud/files/${fileId}/download`);
+            // Check access first; the download itself is streamed by the browser
+            const response = await fetch(url, { method: 'HEAD' });
             
             if (response.ok) {
-                const contentDisposition = response.headers.get('Content-Disposition');
-                const filename = contentDisposition
-                    ? contentDisposition.split('filename=')[1]?.replace(/"/g, '')
-                    : 'downloaded_file';
-                
-                const blob = await response.blob();
                 const link = document.createElement('a');
-                link.href = window.URL.createObjectURL(blob);
-                link.download = filename;
+                link.href = url;
+                link.download = '';
                 document.body.appendChild(link);
                 link.click();
                 document.body.removeChild(link);
-                
-                // Optional: Revoke the object URL to free up memory
-                window.URL.revokeObjectURL(link.href);
             } else {
-                const errorData = await response.json();
-                console.error('Download error:', errorData);
-                alert(errorData.error || errorData.details || 'Failed to download file');
+                console.error('Download error:', response.status);
+                alert(response.status === 404 ? 'File not found' : 'Failed to download file');
             }
         } catch (error) {
             console.error('Error downloading file:', error);
@@ -467,26 +614,54 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    // Fetch shared files
-    async function fetchSharedFiles() {
+    const SHARED_FILES_POLL_INTERVAL = 30000;
+    // ETag of the rendered shared files; polls send it back and get a 304
+    // while nothing changed
+    let sharedFilesEtag = null;
+
+    let nextSharedFilesCursor = null;
+
+    // Fetch shared files; with append, the next page is added to the list.
+    // Polls reload the first page, so loaded pages stay until it changes.
+    async function fetchSharedFiles(append = false) {
         try {
-            const response = await fetch('/cloud/files/shared');
+            const params = new URLSearchParams();
+            if (append && nextSharedFilesCursor) {
+                params.set('cursor', nextSharedFilesCursor);
+            }
+            const response = await fetch(`/cloud/files/shared?${params}`, {
+                headers: !append && sharedFilesEtag ? { 'If-None-Match': sharedFilesEtag } : {},
+                cache: 'no-store'
+            });
+            if (response.status === 304) {
+                return;
+            }
             if (!response.ok) {
                 const errorData = await response.json();
                 console.error('Failed to fetch shared files:', errorData);
                 throw new Error(errorData.error || 'Failed to fetch shared files');
             }
-            const sharedFiles = await response.json();
+            const page = await response.json();
+            const sharedFiles = page.shared_files;
+            nextSharedFilesCursor = page.next_cursor;
+            if (!append) {
+                sharedFilesEtag = response.headers.get('ETag');
+            }
             
             const sharedFilesList = document.getElementById('shared-files-list');
             const noSharedFilesMessage = document.getElementById('no-shared-files');
+            const loadMoreSharedFiles = document.getElementById('load-more-shared-files');
             
-            // Clear existing list
-            sharedFilesList.innerHTML = '';
+            loadMoreSharedFiles.style.display = nextSharedFilesCursor ? 'block' : 'none';
             
-            if (!sharedFiles || sharedFiles.length === 0) {
-                noSharedFilesMessage.style.display = 'block';
-                return;
+            if (!append) {
+                // Clear existing list
+                sharedFilesList.innerHTML = '';
+                
+                if (!sharedFiles || sharedFiles.length === 0) {
+                    noSharedFilesMessage.style.display = 'block';
+                    return;
+                }
             }
             
             noSharedFilesMessage.style.display = 'none';
@@ -516,22 +691,18 @@ document.addEventListener('DOMContentLoaded', () => {
                     </td>
                 `;
                 
-                sharedFilesList.appendChild(row);
-            });
-            
-            // Add event listeners for accept/reject buttons
-            document.querySelectorAll('.accept-shared-file').forEach(btn => {
-                btn.addEventListener('click', async (e) => {
+                // Add event listeners for accept/reject buttons of this row only;
+                // rows of earlier pages already have theirs
+                row.querySelector('.accept-shared-file').addEventListener('click', async (e) => {
                     const sharedFileId = e.currentTarget.getAttribute('data-shared-file-id');
                     await acceptSharedFile(sharedFileId);
                 });
-            });
-            
-            document.querySelectorAll('.reject-shared-file').forEach(btn => {
-                btn.addEventListener('click', async (e) => {
+                row.querySelector('.reject-shared-file').addEventListener('click', async (e) => {
                     const sharedFileId = e.currentTarget.getAttribute('data-shared-file-id');
                     await rejectSharedFile(sharedFileId);
                 });
+                
+                sharedFilesList.appendChild(row);
             });
         } catch (error) {
             console.error('Error fetching shared files:', error);
@@ -597,6 +768,12 @@ document.addEventListener('DOMContentLoaded', () => {
     
     // Call fetchSharedFiles when the page loads
     if (document.getElementById('shared-files-list')) {
+        document.querySelector('#load-more-shared-files button').addEventListener('click', () => fetchSharedFiles(true));
         fetchSharedFiles();
+        setInterval(() => {
+            if (document.visibilityState === 'visible') {
+                fetchSharedFiles();
+            }
+        }, SHARED_FILES_POLL_INTERVAL);
     }
 });
@@ -10,6 +10,9 @@ document.addEventListener('DOMContentLoaded', function() {
         'upload-cloud-file-btn'
     ];
 
+    // The editor shows the first page of cloud files, sorted by name
+    const CLOUD_FILE_LIST_LIMIT = 200;
+
     requiredElements.forEach(elementId => {
         const element = document.getElementById(elementId);
         if (!element) {
@@ -255,14 +258,14 @@ document.addEventListener('DOMContentLoaded', function() {
     // Load cloud file list
     function loadCloudFileList() {
         console.log('Loading cloud file list');
-        fetch('/cloud/files')
+        fetch(`/cloud/files?limit=${CLOUD_FILE_LIST_LIMIT}&sort=name&fields=filename,size,type`)
             .then(response => {
                 if (!response.ok) {
                     throw new Error(`HTTP error! status: ${response.status}`);
                 }
                 return response.json();
             })
-            .then(files => {
+            .then(({ files }) => {
                 console.log('Cloud files received:', files);
                 const cloudFileList = document.getElementById('cloud-file-list');
                 cloudFileList.innerHTML = ''; // Clear existing list
@@ -578,14 +581,14 @@ document.addEventListener('DOMContentLoaded', function() {
     // Function to load cloud files
     function loadCloudFiles() {
         console.log('Loading cloud files');
-        fetch('/cloud/files')
+        fetch(`/cloud/files?limit=${CLOUD_FILE_LIST_LIMIT}&sort=name&fields=filename,size,type`)
             .then(response => {
                 if (!response.ok) {
                     throw new Error(`HTTP error! status: ${response.status}`);
                 }
                 return response.json();
             })
-            .then(files => {
+            .then(({ files }) => {
                 console.log('Cloud files received:', files);
                 const cloudFileList = document.getElementById('cloud-file-list');
                 
@@ -0,0 +1,103 @@
+"""
+Delivers Stripe fixture events out of order to a throwaway app and checks
+the subscription they leave behind.
+
+Each scenario posts signed events from stripe_event_generator to
+/stripe/webhook in delivery order, runs the queued jobs after every
+delivery (retries included), and compares the subscription's status and
+payment_status with the expected values:
+
+    python stripe_event_checker.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+WEBHOOK_SECRET = 'whsec_event_check'
+MAX_JOB_ROUNDS = 2  # a delivery may make one earlier event retry, e.g. one that beat its checkout
+
+# (description, [(event type, overrides, created)] in delivery order, expected subscription fields)
+SCENARIOS = [
+    ('invoice.paid created before checkout.session.completed and delivered first',
+     [('invoice.paid', {}, 1000),
+      ('checkout.session.completed', {'data.object.payment_status': 'unpaid'}, 1001)],
+     {'status': 'active', 'payment_status': 'paid'}),
+    ('invoice.payment_failed delivered after a newer subscription update',
+     [('checkout.session.completed', {}, 1000),
+      ('customer.subscription.updated', {'data.object.status': 'active'}, 1003),
+      ('invoice.payment_failed', {}, 1002)],
+     {'status': 'active', 'payment_status': 'overdue'}),
+    ('invoice.payment_failed delivered after a newer invoice.paid',
+     [('checkout.session.completed', {}, 1000),
+      ('invoice.paid', {}, 1005),
+      ('invoice.payment_failed', {}, 1004)],
+     {'status': 'active', 'payment_status': 'paid'}),
+    ('subscription update delivered after a newer cancellation',
+     [('checkout.session.completed', {}, 1000),
+      ('customer.subscription.deleted', {}, 1005),
+      ('customer.subscription.updated', {'data.object.status': 'active'}, 1004)],
+     {'status': 'cancelled', 'payment_status': 'paid'}),
+]
+
+def run_event_checks() -> int:
+    """
+    Run every scenario against a fresh SQLite database. Returns a process
+    exit code.
+    """
+    database_dir = tempfile.mkdtemp(prefix='stripe-event-check-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(database_dir, 'check.db')
+    os.environ['STRIPE_WEBHOOK_SECRET'] = WEBHOOK_SECRET
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from server import app, db, User, Job, Subscription, run_next_job
+    from stripe_event_generator import build_event, load_fixture, signed_request
+
+    customer_id = load_fixture('checkout.session.completed')['data']['object']['customer']
+    client = app.test_client()
+
+    def run_jobs():
+        with app.app_context():
+            for _ in range(MAX_JOB_ROUNDS):
+                while run_next_job():
+                    pass
+                # Make retries due now instead of after their backoff
+                waiting = Job.query.filter(Job.status == 'queued').update({Job.run_at: datetime.utcnow()})
+                db.session.commit()
+                if not waiting:
+                    break
+
+    failed = False
+    for description, deliveries, expected in SCENARIOS:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            user = User(id=1, username='billing', email='billing@sideforge.com', name='Billing Check',
+                        stripe_customer_id=customer_id)
+            user.set_password('checkpassword')
+            db.session.add(user)
+            db.session.commit()
+
+        for event_type, overrides, created in deliveries:
+            body, headers = signed_request(build_event(event_type, overrides, created=created), WEBHOOK_SECRET)
+            response = client.post('/stripe/webhook', data=body, headers=headers)
+            if response.status_code != 200:
+                failed = True
+                print(f"{description}: {event_type} got status {response.status_code}")
+            run_jobs()
+
+        with app.app_context():
+            subscription = Subscription.query.one_or_none()
+            actual = {field: getattr(subscription, field, None) for field in expected}
+        if actual != expected:
+            failed = True
+            print(f"{description}: expected {expected}, got {actual}")
+
+    if failed:
+        return 1
+
+    print(f"Checked {len(SCENARIOS)} out-of-order Stripe event scenarios.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(run_event_checks())
@@ -0,0 +1,200 @@
+"""
+Gateway for every Stripe API call the app makes.
+
+Calls go through ``call()``. This gives them:
+- one keep-alive HTTP client, so TLS is set up once per pooled connection
+  instead of once per call
+- a timeout per operation
+- network retries that reuse one idempotency key
+- latency numbers per operation
+
+    stripe_gateway.configure()
+    customer_id = stripe_gateway.ensure_customer(user)
+    session = stripe_gateway.call(
+        'checkout.session.create', stripe.checkout.Session.create,
+        customer=customer_id, ...
+    )
+    stripe_gateway.latency_stats.snapshot()
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+import stripe
+
+logger = logging.getLogger(__name__)
+
+STRIPE_CONNECT_TIMEOUT = float(os.environ.get('STRIPE_CONNECT_TIMEOUT', 5))  # seconds
+STRIPE_READ_TIMEOUT = float(os.environ.get('STRIPE_READ_TIMEOUT', 30))  # seconds
+STRIPE_MAX_NETWORK_RETRIES = int(os.environ.get('STRIPE_MAX_NETWORK_RETRIES', 2))
+STRIPE_POOL_SIZE = int(os.environ.get('STRIPE_POOL_SIZE', 10))  # keep-alive connections
+STRIPE_SLOW_CALL = float(os.environ.get('STRIPE_SLOW_CALL', 2.0))  # seconds before a call is logged
+LATENCY_SAMPLES = 500  # recent durations kept per operation for percentiles
+
+# Read timeouts of operations a user waits for. Everything else uses
+# STRIPE_READ_TIMEOUT.
+OPERATION_TIMEOUTS = {
+    'customer.create': 10,
+    'checkout.session.create': 10,
+    'checkout.session.retrieve': 10,
+    'payment_intent.create': 10,
+}
+
+class PooledRequestsClient(stripe.RequestsClient):
+    """
+    Stripe's requests client with one pooled session for all threads and a
+    timeout that ``call()`` can narrow for the calls of the current thread.
+
+    Overrides the private ``_timeout`` and ``_thread_local`` attributes of
+    stripe 16.0.0 (pinned in requirements.txt).
+    """
+
+    def __init__(self, pool_size=STRIPE_POOL_SIZE,
+                 timeout=(STRIPE_CONNECT_TIMEOUT, STRIPE_READ_TIMEOUT)):
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session = requests.Session()
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)  # local stripe-mock
+        super().__init__(timeout=timeout, session=session)
+
+    @property
+    def _timeout(self):
+        return getattr(self._thread_local, 'timeout', None) or self.default_timeout
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self.default_timeout = value
+
+    def set_thread_timeout(self, timeout):
+        self._thread_local.timeout = timeout
+
+    def connections_opened(self):
+        """Connections (and TLS handshakes) made since the client was created."""
+        pools = self.adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+class LatencyStats:
+    """Thread-safe durations and error counts per Stripe operation."""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def record(self, operation, seconds, failed=False):
+        with self._lock:
+            entry = self._operations.get(operation)
+            if entry is None:
+                entry = self._operations[operation] = {
+                    'calls': 0, 'errors': 0, 'total': 0.0, 'max': 0.0,
+                    'recent': deque(maxlen=self.samples)
+                }
+            entry['calls'] += 1
+            entry['errors'] += int(failed)
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['recent'].append(seconds)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: operation -> {'calls', 'errors', 'avg_ms', 'p50_ms', 'p95_ms', 'max_ms'}
+        """
+        with self._lock:
+            operations = {name: dict(entry, recent=sorted(entry['recent']))
+                          for name, entry in self._operations.items()}
+        result = {}
+        for name, entry in operations.items():
+            recent = entry['recent']
+            result[name] = {
+                'calls': entry['calls'],
+                'errors': entry['errors'],
+                'avg_ms': round(entry['total'] / entry['calls'] * 1000, 1),
+                'p50_ms': round(recent[len(recent) // 2] * 1000, 1),
+                'p95_ms': round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 1),
+                'max_ms': round(entry['max'] * 1000, 1),
+            }
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._operations.clear()
+
+latency_stats = LatencyStats()
+http_client = None
+
+def configure(pool_size=STRIPE_POOL_SIZE, max_network_retries=STRIPE_MAX_NETWORK_RETRIES):
+    """Install the pooled client as stripe.default_http_client."""
+    global http_client
+    http_client = PooledRequestsClient(pool_size=pool_size)
+    stripe.default_http_client = http_client
+    stripe.max_network_retries = max_network_retries
+    return http_client
+
+def call(operation, func, *args, timeout=None, retries=None, idempotency_key=None, **kwargs):
+    """
+    Call a Stripe API method with the gateway's timeout, retry and timing.
+
+    Args:
+        operation (str): Name the latency is recorded under, e.g. 'customer.create'
+        func (callable): Stripe library method, e.g. stripe.Customer.create
+        timeout (float): Read timeout in seconds (default: OPERATION_TIMEOUTS, then STRIPE_READ_TIMEOUT)
+        retries (int): Network retries (default: STRIPE_MAX_NETWORK_RETRIES)
+        idempotency_key (str): Key for creates; one is generated when omitted so
+            retries of this call cannot create twice
+
+    Returns:
+        The Stripe object returned by func
+    """
+    if http_client is None:
+        configure()
+    if idempotency_key is None and operation.rsplit('.', 1)[-1] in ('create', 'modify', 'detach', 'attach'):
+        idempotency_key = uuid.uuid4().hex
+    if idempotency_key is not None:
+        kwargs['idempotency_key'] = idempotency_key
+    kwargs['max_network_retries'] = STRIPE_MAX_NETWORK_RETRIES if retries is None else retries
+
+    read_timeout = timeout or OPERATION_TIMEOUTS.get(operation, STRIPE_READ_TIMEOUT)
+    http_client.set_thread_timeout((STRIPE_CONNECT_TIMEOUT, read_timeout))
+    started = time.perf_counter()
+    failed = False
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        http_client.set_thread_timeout(None)
+        elapsed = time.perf_counter() - started
+        latency_stats.record(operation, elapsed, failed)
+        if elapsed >= STRIPE_SLOW_CALL:
+            logger.warning(f"Slow Stripe call {operation}: {elapsed * 1000:.0f}ms")
+
+def ensure_customer(user):
+    """
+    Return the user's Stripe customer ID, creating the customer only when
+    none is stored. Sets user.stripe_customer_id; the caller commits.
+
+    Args:
+        user: Object with id, email, name and stripe_customer_id
+
+    Returns:
+        str: Stripe customer ID
+    """
+    if user.stripe_customer_id:
+        return user.stripe_customer_id
+    customer = call(
+        'customer.create', stripe.Customer.create,
+        email=user.email,
+        name=user.name,
+        metadata={'user_id': str(user.id)},
+        # Same key for every attempt, so concurrent requests get one customer
+        idempotency_key=f"customer-{user.id}"
+    )
+    user.stripe_customer_id = customer.id
+    return customer.id